@@ -1,11 +1,21 @@
 """
 Servicio para generar tablas de amortización de préstamos.
+
+El cronograma se materializa en la tabla `cuotas` al crear o refinanciar un
+préstamo y se mantiene al registrar/eliminar pagos, de modo que las consultas
+"qué vence entre X e Y" sean búsquedas por rango de fecha en lugar de
+recalcular el cronograma de cada préstamo.
 """
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import List, Dict
+from typing import List, Dict, Sequence, Optional, Tuple
+import numpy as np
 from sqlalchemy.orm import Session
-from app.models.models import Prestamo
+from sqlalchemy import exists, insert
+from app.models.models import Prestamo, Cuota
+
+# Tamaño de lote para inserciones masivas de cuotas
+LOTE_INSERCION_CUOTAS = 5000
 
 
 def add_days(start: date, days: int) -> date:
@@ -18,23 +28,8 @@ def add_months(start: date, months: int) -> date:
     return start + relativedelta(months=months)
 
 
-def generar_amortizacion(prestamo: Prestamo, db: Session) -> List[Dict]:
-    """
-    Genera la tabla de amortización para un préstamo.
-    
-    Args:
-        prestamo: instancia del modelo Prestamo
-        db: sesión de base de datos
-    
-    Returns:
-        Lista de diccionarios con: numero, fecha, monto, estado
-    """
-    if not prestamo:
-        return []
-    
-    hoy = date.today()
-    
-    # Número de cuotas según frecuencia
+def calcular_numero_cuotas(prestamo: Prestamo) -> int:
+    """Número de cuotas del préstamo (cuotas_totales o estimado según frecuencia)."""
     numero_cuotas = prestamo.cuotas_totales if prestamo.cuotas_totales else 0
     if not numero_cuotas or numero_cuotas <= 0:
         frecuencia = prestamo.frecuencia_pago or 'semanal'
@@ -44,45 +39,287 @@ def generar_amortizacion(prestamo: Prestamo, db: Session) -> List[Dict]:
             numero_cuotas = (prestamo.plazo_dias + 29) // 30
         else:
             numero_cuotas = prestamo.plazo_dias  # diario
-    
-    # Valor de cada cuota
+    return int(numero_cuotas)
+
+
+def calcular_valor_cuota(prestamo: Prestamo, numero_cuotas: int) -> float:
+    """Valor de cada cuota (valor_cuota o monto_total repartido)."""
     valor_cuota = prestamo.valor_cuota if prestamo.valor_cuota else 0
     if not valor_cuota or valor_cuota <= 0:
         valor_cuota = prestamo.monto_total / numero_cuotas if numero_cuotas > 0 else 0
-    
-    # Cuotas pagadas
-    cuotas_pagadas = prestamo.cuotas_pagadas if prestamo.cuotas_pagadas else 0
-    
+    return round(float(valor_cuota), 2)
+
+
+def fecha_cuota(inicio: date, frecuencia: str, numero: int) -> date:
+    """Fecha de vencimiento de la cuota `numero` (1-based)."""
+    # La primera cuota es una semana/mes después del inicio
+    if frecuencia == 'semanal':
+        return add_days(inicio, numero * 7)
+    if frecuencia == 'mensual':
+        return add_months(inicio, numero)
+    # Diario: la primera cuota es al día siguiente
+    return add_days(inicio, numero)
+
+
+def indices_en_rango(inicio: date, frecuencia: str, numero_cuotas: int, desde: date, hasta: date) -> Tuple[int, int]:
+    """Primer y último número de cuota con vencimiento en [desde, hasta].
+
+    Se calcula directamente desde la fecha de inicio y la frecuencia, sin recorrer
+    el cronograma. Si ninguna cuota cae en el rango, el primero es mayor que el último.
+    """
+    if frecuencia == 'mensual':
+        # Cuota del mismo mes que `desde`; si vence antes, la primera es la siguiente
+        primero = (desde.year - inicio.year) * 12 + (desde.month - inicio.month)
+        if fecha_cuota(inicio, frecuencia, primero) < desde:
+            primero += 1
+        ultimo = (hasta.year - inicio.year) * 12 + (hasta.month - inicio.month)
+        if fecha_cuota(inicio, frecuencia, ultimo) > hasta:
+            ultimo -= 1
+    else:
+        paso = 7 if frecuencia == 'semanal' else 1
+        primero = -(-(desde - inicio).days // paso)  # techo
+        ultimo = (hasta - inicio).days // paso
+    return max(primero, 1), min(ultimo, numero_cuotas)
+
+
+def cuota_pagada(prestamo: Prestamo, numero: int) -> bool:
+    """Una cuota está pagada si el préstamo está pagado o si ya se cubrió su número."""
+    if (prestamo.estado or '').lower() == 'pagado':
+        return True
+    return numero <= (prestamo.cuotas_pagadas or 0)
+
+
+def generar_amortizacion_lote(
+    fechas_inicio: Sequence[date],
+    frecuencias: Sequence[Optional[str]],
+    cuotas_totales: Sequence[int],
+    valores_cuota: Sequence[float],
+    cuotas_pagadas: Sequence[int],
+    estados: Sequence[Optional[str]],
+    hoy: Optional[date] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Genera en una sola pasada el cronograma de muchos préstamos a partir de sus columnas.
+
+    Cada argumento es una columna (un elemento por préstamo). `cuotas_totales` y
+    `valores_cuota` deben venir ya resueltos (ver calcular_numero_cuotas / calcular_valor_cuota).
+
+    Returns:
+        Diccionario de arreglos alineados, un elemento por cuota:
+        prestamo (índice del préstamo en la entrada), numero, fecha (datetime64[D]),
+        monto, pagada (bool) y estado (Pagado, Vencido, Pendiente)
+    """
+    hoy = np.datetime64(hoy or date.today(), 'D')
+    inicio = np.asarray(fechas_inicio, dtype='datetime64[D]')
+    n = np.clip(np.asarray(cuotas_totales, dtype=np.int64), 0, None)
+    valores = np.round(np.asarray(valores_cuota, dtype=np.float64), 2)
+    pagadas = np.asarray([p or 0 for p in cuotas_pagadas], dtype=np.int64)
+    frec = np.asarray([(f or 'semanal') for f in frecuencias], dtype=object)
+    prestamo_pagado = np.asarray([(e or '').lower() == 'pagado' for e in estados], dtype=bool)
+
+    # Expandir a una fila por cuota
+    idx = np.repeat(np.arange(len(n)), n)
+    inicio_cuota = np.cumsum(n) - n
+    numero = np.arange(idx.size, dtype=np.int64) - inicio_cuota[idx] + 1
+    base = inicio[idx]
+
+    # Semanal: +7 días por cuota; diario: +1 día por cuota
+    frec_cuota = frec[idx]
+    es_semanal = frec_cuota == 'semanal'
+    es_mensual = frec_cuota == 'mensual'
+    fecha = base + np.where(es_semanal, numero * 7, numero).astype('timedelta64[D]')
+
+    # Mensual: sumar meses y recortar al último día del mes (igual que relativedelta)
+    if es_mensual.any():
+        base_m = base[es_mensual]
+        mes_inicio = base_m.astype('datetime64[M]')
+        dia = (base_m - mes_inicio.astype('datetime64[D]')).astype(np.int64)
+        mes = mes_inicio + numero[es_mensual].astype('timedelta64[M]')
+        primer_dia = mes.astype('datetime64[D]')
+        dias_mes = ((mes + 1).astype('datetime64[D]') - primer_dia).astype(np.int64)
+        fecha[es_mensual] = primer_dia + np.minimum(dia, dias_mes - 1).astype('timedelta64[D]')
+
+    pagada = prestamo_pagado[idx] | (numero <= pagadas[idx])
+    estado = np.where(pagada, 'Pagado', np.where(fecha < hoy, 'Vencido', 'Pendiente'))
+
+    return {
+        'prestamo': idx,
+        'numero': numero,
+        'fecha': fecha,
+        'monto': valores[idx],
+        'pagada': pagada,
+        'estado': estado
+    }
+
+
+def _filas_cuotas(prestamos: Sequence) -> List[Dict]:
+    """Filas para insertar en `cuotas` a partir de préstamos (modelos o filas con las mismas columnas)."""
+    numeros = [calcular_numero_cuotas(p) for p in prestamos]
+    lote = generar_amortizacion_lote(
+        [p.fecha_inicio for p in prestamos],
+        [p.frecuencia_pago for p in prestamos],
+        numeros,
+        [calcular_valor_cuota(p, n) for p, n in zip(prestamos, numeros)],
+        [p.cuotas_pagadas for p in prestamos],
+        [p.estado for p in prestamos]
+    )
+    ids = np.asarray([p.id for p in prestamos], dtype=np.int64)
+    return [
+        {
+            'prestamo_id': prestamo_id,
+            'numero': numero,
+            'fecha_vencimiento': fecha,
+            'monto': monto,
+            'estado': 'pagado' if pagada else 'pendiente'
+        }
+        for prestamo_id, numero, fecha, monto, pagada in zip(
+            ids[lote['prestamo']].tolist(),
+            lote['numero'].tolist(),
+            lote['fecha'].tolist(),
+            lote['monto'].tolist(),
+            lote['pagada'].tolist()
+        )
+    ]
+
+
+def materializar_cuotas(db: Session, prestamo: Prestamo) -> int:
+    """(Re)escribe las filas de `cuotas` del préstamo. No hace commit."""
+    db.query(Cuota).filter(Cuota.prestamo_id == prestamo.id).delete(synchronize_session=False)
+    filas = _filas_cuotas([prestamo])
+    db.add_all([Cuota(**f) for f in filas])
+    return len(filas)
+
+
+def actualizar_estado_cuotas(db: Session, prestamo: Prestamo) -> None:
+    """Sincroniza el estado de las cuotas con cuotas_pagadas/estado del préstamo.
+
+    Solo toca las filas cuyo estado cambia. No hace commit.
+    """
+    query = db.query(Cuota).filter(Cuota.prestamo_id == prestamo.id)
+    if (prestamo.estado or '').lower() == 'pagado':
+        query.filter(Cuota.estado != 'pagado').update({Cuota.estado: 'pagado'}, synchronize_session=False)
+        return
+    pagadas = prestamo.cuotas_pagadas or 0
+    query.filter(Cuota.numero <= pagadas, Cuota.estado != 'pagado').update(
+        {Cuota.estado: 'pagado'}, synchronize_session=False
+    )
+    query.filter(Cuota.numero > pagadas, Cuota.estado != 'pendiente').update(
+        {Cuota.estado: 'pendiente'}, synchronize_session=False
+    )
+
+
+def backfill_cuotas(db: Session) -> int:
+    """Materializa el cronograma de los préstamos que aún no tienen filas en `cuotas`.
+
+    Lee solo las columnas necesarias, genera todas las cuotas con el motor por lotes
+    e inserta en bloques.
+    """
+    sin_cuotas = db.query(
+        Prestamo.id, Prestamo.fecha_inicio, Prestamo.frecuencia_pago, Prestamo.plazo_dias,
+        Prestamo.cuotas_totales, Prestamo.valor_cuota, Prestamo.monto_total,
+        Prestamo.cuotas_pagadas, Prestamo.estado
+    ).filter(
+        ~exists().where(Cuota.prestamo_id == Prestamo.id)
+    ).all()
+    if not sin_cuotas:
+        return 0
+    filas = _filas_cuotas(sin_cuotas)
+    for i in range(0, len(filas), LOTE_INSERCION_CUOTAS):
+        db.execute(insert(Cuota), filas[i:i + LOTE_INSERCION_CUOTAS])
+    db.commit()
+    return len(sin_cuotas)
+
+
+def estado_visible(estado: str, fecha: date, hoy: date) -> str:
+    """Estado mostrado de una cuota: Pagado, Vencido o Pendiente."""
+    if estado == 'pagado':
+        return 'Pagado'
+    if fecha < hoy:
+        return 'Vencido'
+    return 'Pendiente'
+
+
+def cuotas_en_rango(prestamo: Prestamo, desde: date, hasta: date) -> List[Dict]:
+    """
+    Cuotas del préstamo con vencimiento en [desde, hasta].
+
+    El costo depende del tamaño del rango y no del plazo del préstamo.
+
+    Returns:
+        Lista de diccionarios con: numero, fecha, monto, estado
+    """
+    if not prestamo or desde > hasta:
+        return []
+
+    hoy = date.today()
+    numero_cuotas = calcular_numero_cuotas(prestamo)
+    valor_cuota = calcular_valor_cuota(prestamo, numero_cuotas)
+    frecuencia = prestamo.frecuencia_pago or 'semanal'
+    primero, ultimo = indices_en_rango(prestamo.fecha_inicio, frecuencia, numero_cuotas, desde, hasta)
+
     resultado = []
-    inicio = prestamo.fecha_inicio
+    for i in range(primero, ultimo + 1):
+        fecha_esperada = fecha_cuota(prestamo.fecha_inicio, frecuencia, i)
+        estado = estado_visible('pagado' if cuota_pagada(prestamo, i) else 'pendiente', fecha_esperada, hoy)
+        resultado.append({
+            'numero': i,
+            'fecha': fecha_esperada.isoformat(),
+            'monto': valor_cuota,
+            'estado': estado
+        })
+    return resultado
+
+
+def generar_amortizacion(prestamo: Prestamo, db: Session, desde: Optional[date] = None, hasta: Optional[date] = None,
+                         cuotas: Optional[List[Cuota]] = None) -> List[Dict]:
+    """
+    Genera la tabla de amortización para un préstamo.
+
+    Args:
+        prestamo: instancia del modelo Prestamo
+        db: sesión de base de datos
+        desde, hasta: si se indican, solo devuelve las cuotas que vencen en ese rango
+        cuotas: cronograma ya cargado (p. ej. con selectinload); si se omite se consulta
+
+    Returns:
+        Lista de diccionarios con: numero, fecha, monto, estado
+    """
+    if not prestamo:
+        return []
+
+    if desde or hasta:
+        return cuotas_en_rango(prestamo, desde or prestamo.fecha_inicio, hasta or date.max)
+
+    hoy = date.today()
+
+    # Cronograma materializado
+    if cuotas is None:
+        cuotas = db.query(Cuota).filter(Cuota.prestamo_id == prestamo.id).order_by(Cuota.numero.asc()).all()
+    if cuotas:
+        return [
+            {
+                'numero': c.numero,
+                'fecha': c.fecha_vencimiento.isoformat(),
+                'monto': round(float(c.monto), 2),
+                'estado': estado_visible(c.estado, c.fecha_vencimiento, hoy)
+            }
+            for c in cuotas
+        ]
+
+    # Préstamo sin cronograma persistido: calcular al vuelo
+    numero_cuotas = calcular_numero_cuotas(prestamo)
+    valor_cuota = calcular_valor_cuota(prestamo, numero_cuotas)
     frecuencia = prestamo.frecuencia_pago or 'semanal'
-    
-    for i in range(1, int(numero_cuotas) + 1):
-        # La primera cuota es una semana/mes después del inicio
-        if frecuencia == 'semanal':
-            fecha_esperada = add_days(inicio, i * 7)
-        elif frecuencia == 'mensual':
-            fecha_esperada = add_months(inicio, i)
-        else:
-            # Diario: la primera cuota es al día siguiente
-            fecha_esperada = add_days(inicio, i)
-        
-        # Determinar estado
-        estado_prestamo = (prestamo.estado or '').lower()
-        if estado_prestamo == 'pagado':
-            estado = 'Pagado'
-        elif i <= cuotas_pagadas:
-            estado = 'Pagado'
-        elif fecha_esperada < hoy:
-            estado = 'Vencido'
-        else:
-            estado = 'Pendiente'
-        
+
+    resultado = []
+    for i in range(1, numero_cuotas + 1):
+        fecha_esperada = fecha_cuota(prestamo.fecha_inicio, frecuencia, i)
+        estado = estado_visible('pagado' if cuota_pagada(prestamo, i) else 'pendiente', fecha_esperada, hoy)
         resultado.append({
             'numero': i,
             'fecha': fecha_esperada.isoformat(),
-            'monto': round(float(valor_cuota), 2),
+            'monto': valor_cuota,
             'estado': estado
         })
-    
+
     return resultado
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from sqlalchemy.orm import Session
+from app.models.models import Usuario
+
+
+# === PRINCIPAL DEL USUARIO AUTENTICADO ===
+# Los endpoints solo necesitan identidad, rol y empleado_id del usuario. Se resuelven una vez
+# por (sub, versión de token) y se cachean en memoria del proceso; update_me y
+# admin_create_user invalidan la entrada. El TTL acota la desactualización con varios workers.
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "512"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+# Opt-in: en requests de solo lectura (GET/HEAD) confiar en los claims firmados del token sin
+# consultar la base. Un cambio de rol o de token_version recién se ve ahí al vencer el token.
+AUTH_TRUST_CLAIMS = os.getenv("AUTH_TRUST_CLAIMS", "false").lower() in ("1", "true", "si", "yes")
+
+METODOS_SOLO_LECTURA = ("GET", "HEAD")
+
+
+class Principal(NamedTuple):
+    id: int
+    username: str
+    role: str
+    empleado_id: Optional[int]
+    token_version: int
+
+
+_cache_lock = threading.Lock()
+_cache_entradas: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidaciones': 0, 'desde_claims': 0}
+
+
+def principal_desde_usuario(usuario: Usuario) -> Principal:
+    return Principal(
+        id=usuario.id,
+        username=usuario.username,
+        role=usuario.role or 'admin',
+        empleado_id=usuario.empleado_id,
+        token_version=usuario.token_version or 0,
+    )
+
+
+def claims_de_usuario(usuario: Usuario) -> dict:
+    """Claims que lleva el access token además de `sub` y `exp`."""
+    principal = principal_desde_usuario(usuario)
+    return {
+        "sub": principal.username,
+        "uid": principal.id,
+        "role": principal.role,
+        "empleado_id": principal.empleado_id,
+        "ver": principal.token_version,
+    }
+
+
+def principal_desde_claims(payload: dict) -> Optional[Principal]:
+    """Principal armado solo con el token; None si es un token anterior sin rol/uid."""
+    if "uid" not in payload or "role" not in payload:
+        return None
+    with _cache_lock:
+        _cache_stats['desde_claims'] += 1
+    return Principal(
+        id=payload["uid"],
+        username=payload["sub"],
+        role=payload["role"],
+        empleado_id=payload.get("empleado_id"),
+        token_version=payload.get("ver", 0),
+    )
+
+
+def principal_cacheado(username: str, version: int) -> Optional[Principal]:
+    """Principal cacheado para (username, versión de token), o None si hay que consultar la base.
+    No bloquea: se puede llamar desde el event loop."""
+    if AUTH_CACHE_MAX <= 0:
+        return None
+    with _cache_lock:
+        entrada = _cache_entradas.get((username, version))
+        if entrada is not None and entrada[0] > time.monotonic():
+            _cache_entradas.move_to_end((username, version))
+            _cache_stats['hits'] += 1
+            return entrada[1]
+        _cache_stats['misses'] += 1
+    return None
+
+
+def cargar_principal(db: Session, username: str, version: int) -> Optional[Principal]:
+    """Principal desde la base (para `await db.run_sync(...)`), que queda en la caché.
+
+    Devuelve None si el usuario no existe o si el token es de una versión anterior a su
+    token_version.
+    """
+    usuario = db.query(Usuario).filter(Usuario.username == username).first()
+    if usuario is None:
+        return None
+    principal = principal_desde_usuario(usuario)
+    if principal.token_version != version:
+        return None
+
+    if AUTH_CACHE_MAX > 0:
+        clave = (username, version)
+        with _cache_lock:
+            _cache_entradas[clave] = (time.monotonic() + AUTH_CACHE_TTL, principal)
+            _cache_entradas.move_to_end(clave)
+            while len(_cache_entradas) > AUTH_CACHE_MAX:
+                _cache_entradas.popitem(last=False)
+                _cache_stats['evictions'] += 1
+    return principal
+
+
+def invalidar_principal(username: str) -> None:
+    """Descarta las entradas cacheadas del usuario. Llamar después del commit que lo modifica."""
+    with _cache_lock:
+        for clave in [c for c in _cache_entradas if c[0] == username]:
+            del _cache_entradas[clave]
+        _cache_stats['invalidaciones'] += 1
+
+
+def get_principal_cache_stats() -> dict:
+    with _cache_lock:
+        total = _cache_stats['hits'] + _cache_stats['misses']
+        return {
+            **_cache_stats,
+            'hit_rate': round(_cache_stats['hits'] / total, 4) if total else 0.0,
+            'entradas': len(_cache_entradas),
+            'max_entradas': AUTH_CACHE_MAX,
+            'ttl_segundos': AUTH_CACHE_TTL,
+            'confiar_claims': AUTH_TRUST_CLAIMS,
+        }
@@ -0,0 +1,75 @@
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+from sqlalchemy.orm import Session
+from app.models.models import BackfillCheckpoint
+
+
+# === BACKFILLS POR LOTES CON CHECKPOINT ===
+# Un backfill se describe como fases sobre una tabla de origen recorrida por rangos de id.
+# Cada lote es un INSERT ... SELECT acotado a (desde, hasta] y se confirma junto con el
+# checkpoint en la misma transacción: si el proceso se corta, al volver a llamarlo retoma
+# desde el último lote confirmado sin duplicar. Los topes de id se fijan al iniciar, así las
+# filas que la app crea mientras tanto (que ya generan sus propios registros) quedan afuera.
+LOTE_BACKFILL = int(os.getenv("LOTE_BACKFILL", "50000"))
+
+
+class Fase(NamedTuple):
+    nombre: str
+    tope: Callable[[Session], int]  # id máximo de la tabla de origen
+    insertar: Callable[[Session, int, int], int]  # (db, desde excluido, hasta incluido) -> filas
+
+
+def progreso_log(nombre: str, intervalo_seg: float = 5.0) -> Callable[[str, float, int], None]:
+    """Callback que imprime el avance como mucho cada `intervalo_seg` (y siempre al 100%)."""
+    ultimo = {'t': 0.0}
+
+    def progreso(fase: str, fraccion: float, procesados: int) -> None:
+        ahora = time.monotonic()
+        if fraccion < 1 and ahora - ultimo['t'] < intervalo_seg:
+            return
+        ultimo['t'] = ahora
+        print(f"[Backfill] {nombre}/{fase}: {fraccion:.0%} ({procesados} filas)")
+    return progreso
+
+
+def ejecutar_por_lotes(db: Session, nombre: str, fases: List[Fase], lote: int = LOTE_BACKFILL,
+                       progreso: Optional[Callable[[str, float, int], None]] = None,
+                       iniciar_si: Optional[Callable[[Session], bool]] = None) -> int:
+    """Corre (o retoma) el backfill `nombre`. Devuelve las filas insertadas en total.
+
+    `iniciar_si` se consulta solo cuando no hay checkpoint: permite backfills que arrancan
+    únicamente sobre una tabla vacía pero que, una vez empezados, deben poder completarse.
+    """
+    cp = db.get(BackfillCheckpoint, nombre)
+    if cp is None:
+        if iniciar_si is not None and not iniciar_si(db):
+            return 0
+        cp = BackfillCheckpoint(
+            nombre=nombre, fase=0, ultimo_id=0, procesados=0,
+            topes=",".join(str(f.tope(db) or 0) for f in fases),
+        )
+        db.add(cp)
+        db.commit()
+    topes = [int(t) for t in cp.topes.split(",")]
+    total_ids = sum(topes) or 1
+
+    while cp.fase < len(fases):
+        fase, tope = fases[cp.fase], topes[cp.fase]
+        while cp.ultimo_id < tope:
+            hasta = min(cp.ultimo_id + lote, tope)
+            cp.procesados += fase.insertar(db, cp.ultimo_id, hasta) or 0
+            cp.ultimo_id = hasta
+            cp.actualizado_at = datetime.utcnow()
+            db.commit()
+            if progreso:
+                progreso(fase.nombre, (sum(topes[:cp.fase]) + hasta) / total_ids, cp.procesados)
+        cp.fase += 1
+        cp.ultimo_id = 0
+        db.commit()
+
+    procesados = cp.procesados
+    db.delete(cp)
+    db.commit()
+    return procesados
@@ -1,169 +1,324 @@
+import csv
+import io
 from datetime import date, datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import Optional
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, select, insert, exists, literal, cast, String, DateTime, and_, or_
+from app.backfill_service import ejecutar_por_lotes, Fase, LOTE_BACKFILL
+from app.metrics_service import invalidar_cache_metricas
+from app.pagination_service import paginar
 from app.models.models import MovimientoCaja, Prestamo, Pago, CajaCierre, PagoVendedor, PagoCobrador, Cliente, CajaEmpleadoMovimiento, CajaEmpleadoCierre, Empleado
 
 
-def backfill_caja_movimientos(db: Session):
+def _texto(valor):
+    return literal(valor, String)
+
+
+def _id_texto(columna):
+    return cast(columna, String)
+
+
+_COLUMNAS_MOVIMIENTO = ["fecha", "tipo", "categoria", "monto", "referencia_tipo", "referencia_id",
+                        "prestamo_id", "cliente_id", "created_at"]
+
+
+def _insertar_movimientos_prestamos(db: Session, desde: int, hasta: int) -> int:
+    """Egresos por desembolso de los préstamos con id en (desde, hasta]."""
+    origen = select(
+        Prestamo.fecha_inicio, _texto("egreso"), _texto("prestamo"), Prestamo.monto, _texto("prestamo"), Prestamo.id,
+        Prestamo.id, Prestamo.cliente_id, literal(datetime.utcnow(), DateTime),
+    ).where(Prestamo.id > desde, Prestamo.id <= hasta)
+    return db.execute(insert(MovimientoCaja).from_select(_COLUMNAS_MOVIMIENTO, origen)).rowcount
+
+
+def _insertar_movimientos_pagos(db: Session, desde: int, hasta: int) -> int:
+    """Ingresos de los pagos con id en (desde, hasta], referidos al préstamo y su cliente."""
+    origen = select(
+        Pago.fecha_pago, _texto("ingreso"), _texto("pago"), Pago.monto, _texto("pago"), Pago.id,
+        Pago.prestamo_id, Prestamo.cliente_id, literal(datetime.utcnow(), DateTime),
+    ).select_from(Pago).outerjoin(Prestamo, Prestamo.id == Pago.prestamo_id).where(
+        Pago.id > desde, Pago.id <= hasta
+    )
+    return db.execute(insert(MovimientoCaja).from_select(_COLUMNAS_MOVIMIENTO, origen)).rowcount
+
+
+def backfill_caja_movimientos(db: Session, lote: int = LOTE_BACKFILL, progreso=None):
     """Si la tabla de movimientos está vacía, crear movimientos históricos
-    a partir de préstamos (egresos) y pagos (ingresos)."""
-    existe = db.query(func.count(MovimientoCaja.id)).scalar() or 0
-    if existe > 0:
-        return 0
+    a partir de préstamos (egresos) y pagos (ingresos).
 
-    creados = 0
-    # Egresos por desembolso de préstamos (monto principal)
-    prestamos = db.query(Prestamo).all()
-    for p in prestamos:
-        cliente = db.query(Cliente).filter(Cliente.id == p.cliente_id).first()
-        nombre = cliente.nombre if cliente else f"Cliente {p.cliente_id}"
-        movimiento = MovimientoCaja(
-            fecha=p.fecha_inicio,
-            tipo="egreso",
-            categoria="prestamo",
-            descripcion=f"Desembolso préstamo #{p.id} - {nombre}",
-            monto=p.monto,
-            referencia_tipo="prestamo",
-            referencia_id=p.id
-        )
-        db.add(movimiento)
-        creados += 1
+    Un INSERT ... SELECT por lote de ids con las referencias a préstamo y cliente (la descripción
+    se arma al leer, ver describir_movimientos); si se interrumpe, la siguiente llamada retoma desde el checkpoint aunque la tabla ya no esté vacía.
+    """
+    return ejecutar_por_lotes(
+        db, "caja_movimientos",
+        [
+            Fase("prestamos", lambda s: s.query(func.max(Prestamo.id)).scalar(), _insertar_movimientos_prestamos),
+            Fase("pagos", lambda s: s.query(func.max(Pago.id)).scalar(), _insertar_movimientos_pagos),
+        ],
+        lote=lote, progreso=progreso,
+        iniciar_si=lambda s: s.query(MovimientoCaja.id).first() is None,
+    )
 
-    # Ingresos por pagos
-    pagos = db.query(Pago).all()
-    for pg in pagos:
-        prestamo = db.query(Prestamo).filter(Prestamo.id == pg.prestamo_id).first()
-        cliente = db.query(Cliente).filter(Cliente.id == prestamo.cliente_id).first() if prestamo else None
-        nombre = cliente.nombre if cliente else (f"Cliente {prestamo.cliente_id}" if prestamo else "Cliente")
-        movimiento = MovimientoCaja(
-            fecha=pg.fecha_pago,
-            tipo="ingreso",
-            categoria="pago",
-            descripcion=f"Pago #{pg.id} préstamo {pg.prestamo_id} - {nombre}",
-            monto=pg.monto,
-            referencia_tipo="pago",
-            referencia_id=pg.id
-        )
-        db.add(movimiento)
-        creados += 1
 
-    db.commit()
-    return creados
+def _insertar_movimientos_empleado(db: Session, desde: int, hasta: int) -> int:
+    """Ingreso y egreso de comisión por cada pago con cobrador en (desde, hasta] que no los tenga."""
+    # Como antes, se toma el primer registro de comisión del pago
+    otro = aliased(PagoCobrador)
+    primero = select(func.min(otro.id)).where(otro.pago_id == Pago.id).scalar_subquery()
+    ahora = literal(datetime.utcnow(), DateTime)
+    insertados = 0
+    for tipo, categoria, descripcion, monto in (
+        ("ingreso", "pago", _texto("Pago #"), Pago.monto),
+        ("egreso", "comision", _texto("Comisión cobrador pago #"), PagoCobrador.monto_comision),
+    ):
+        # empleado_id va dentro de una expresión para que SQLite busque por la referencia: por
+        # ix_caja_empleado_mov_empleado_fecha recorrería todo el historial del cobrador por pago
+        existente = exists().where(
+            CajaEmpleadoMovimiento.referencia_tipo == "pago",
+            CajaEmpleadoMovimiento.referencia_id == Pago.id,
+            func.coalesce(CajaEmpleadoMovimiento.empleado_id, 0) == PagoCobrador.empleado_id,
+            CajaEmpleadoMovimiento.tipo == tipo,
+            *([CajaEmpleadoMovimiento.categoria == categoria] if tipo == "egreso" else []),
+        )
+        origen = select(
+            Pago.fecha_pago, PagoCobrador.empleado_id, _texto(tipo), _texto(categoria),
+            descripcion + _id_texto(Pago.id) + _texto(" préstamo ") + _id_texto(Pago.prestamo_id),
+            monto, _texto("pago"), Pago.id, ahora,
+        ).select_from(Pago).join(PagoCobrador, PagoCobrador.id == primero).where(
+            Pago.id > desde, Pago.id <= hasta, PagoCobrador.empleado_id.isnot(None), ~existente
+        )
+        insertados += db.execute(insert(CajaEmpleadoMovimiento).from_select(
+            ["fecha", "empleado_id", "tipo", "categoria", "descripcion", "monto", "referencia_tipo", "referencia_id", "created_at"],
+            origen,
+        )).rowcount
+    return insertados
 
 
-def backfill_caja_empleado_movimientos(db: Session):
+def backfill_caja_empleado_movimientos(db: Session, lote: int = LOTE_BACKFILL, progreso=None):
     """Crea movimientos históricos para empleados (cobradores) por cada pago registrado,
     si aún no existen movimientos vinculados a esos pagos.
 
     Genera dos movimientos:
       - ingreso (pago cobrado)
       - egreso (comisión del cobrador) si existe registro PagoCobrador
+
+    Dos INSERT ... SELECT por lote de ids con NOT EXISTS sobre ix_caja_empleado_mov_referencia.
     """
-    creados = 0
-    pagos = db.query(Pago).all()
-    for pg in pagos:
-        # Buscar comisión cobrador asociada
-        pc = db.query(PagoCobrador).filter(PagoCobrador.pago_id == pg.id).first()
-        if not pc or not pc.empleado_id:
-            continue  # sin cobrador asociado
-        empleado_id = pc.empleado_id
-        # Verificar si ya existe movimiento ingreso por este pago
-        existente_ingreso = db.query(CajaEmpleadoMovimiento).filter(
-            CajaEmpleadoMovimiento.empleado_id == empleado_id,
-            CajaEmpleadoMovimiento.referencia_tipo == 'pago',
-            CajaEmpleadoMovimiento.referencia_id == pg.id,
-            CajaEmpleadoMovimiento.tipo == 'ingreso'
-        ).first()
-        if not existente_ingreso:
-            mov_in = CajaEmpleadoMovimiento(
-                fecha=pg.fecha_pago,
-                empleado_id=empleado_id,
-                tipo='ingreso',
-                categoria='pago',
-                descripcion=f"Pago #{pg.id} préstamo {pg.prestamo_id}",
-                monto=pg.monto,
-                referencia_tipo='pago',
-                referencia_id=pg.id
-            )
-            db.add(mov_in)
-            creados += 1
-        # Verificar movimiento egreso comisión
-        existente_comision = db.query(CajaEmpleadoMovimiento).filter(
-            CajaEmpleadoMovimiento.empleado_id == empleado_id,
-            CajaEmpleadoMovimiento.referencia_tipo == 'pago',
-            CajaEmpleadoMovimiento.referencia_id == pg.id,
-            CajaEmpleadoMovimiento.tipo == 'egreso',
-            CajaEmpleadoMovimiento.categoria == 'comision'
-        ).first()
-        if not existente_comision:
-            mov_out = CajaEmpleadoMovimiento(
-                fecha=pg.fecha_pago,
-                empleado_id=empleado_id,
-                tipo='egreso',
-                categoria='comision',
-                descripcion=f"Comisión cobrador pago #{pg.id} préstamo {pg.prestamo_id}",
-                monto=pc.monto_comision,
-                referencia_tipo='pago',
-                referencia_id=pg.id
-            )
-            db.add(mov_out)
-            creados += 1
-    if creados:
-        db.commit()
-    return creados
+    return ejecutar_por_lotes(
+        db, "caja_empleado_movimientos",
+        [Fase("pagos", lambda s: s.query(func.max(Pago.id)).scalar(), _insertar_movimientos_empleado)],
+        lote=lote, progreso=progreso,
+    )
 
 
-def get_saldo_anterior(db: Session, fecha: date) -> float:
-    """Obtiene el saldo_final del cierre del día anterior, o 0.0 si no existe."""
-    dia_anterior = fecha - timedelta(days=1)
-    cierre_anterior = db.query(CajaCierre).filter(CajaCierre.fecha == dia_anterior).first()
-    if cierre_anterior and cierre_anterior.saldo_final is not None:
-        return cierre_anterior.saldo_final
-    return 0.0
+# === SALDO ENCADENADO ===
+# Los cierres forman un libro de saldos: el saldo_inicial de cada día es el saldo con que
+# terminó el último cierre anterior (saldo_final si está cerrado, saldo_esperado si no),
+# aunque haya días sin cierre en el medio. Todo cambio en el saldo de un día (movimientos,
+# cerrar con diferencia, reabrir) se traslada a los días siguientes con un solo UPDATE por
+# rango; la diferencia de los días cerrados se conserva.
+def _saldo_cierre():
+    return func.coalesce(CajaCierre.saldo_final, CajaCierre.saldo_esperado)
 
 
-def get_or_create_cierre(db: Session, fecha: date) -> CajaCierre:
-    """Obtiene o crea el cierre del día. Calcula saldo_inicial desde día anterior."""
+def get_saldo_anterior(db: Session, fecha: date) -> float:
+    """Saldo con que terminó el último cierre anterior a la fecha (0.0 si no hay ninguno).
+    Una búsqueda por el índice de fecha."""
+    saldo = db.query(_saldo_cierre()).filter(CajaCierre.fecha < fecha).order_by(CajaCierre.fecha.desc()).limit(1).scalar()
+    return float(saldo or 0.0)
+
+
+def propagar_saldo(db: Session, fecha: date, delta: float) -> None:
+    """Traslada `delta` al saldo de todos los cierres posteriores a la fecha. No hace commit."""
+    if not delta:
+        return
+    db.query(CajaCierre).filter(CajaCierre.fecha > fecha).update({
+        CajaCierre.saldo_inicial: CajaCierre.saldo_inicial + delta,
+        CajaCierre.saldo_esperado: CajaCierre.saldo_esperado + delta,
+        CajaCierre.saldo_final: CajaCierre.saldo_final + delta,
+    }, synchronize_session="evaluate")
+
+
+def _ajustar_neto_cierre(db: Session, cierre: CajaCierre, delta: float) -> None:
+    """El neto del día cambió en `delta`: si está cerrado mueve también su saldo_final
+    (misma diferencia) y propaga a los días siguientes."""
+    if not delta:
+        return
+    if cierre.cerrado and cierre.saldo_final is not None:
+        cierre.saldo_final += delta
+    propagar_saldo(db, cierre.fecha, delta)
+
+
+def get_or_create_cierre(db: Session, fecha: date, commit: bool = True) -> CajaCierre:
+    """Obtiene o crea el cierre del día. Calcula saldo_inicial desde día anterior.
+    Con commit=False solo hace flush, para usarlo dentro de una transacción mayor."""
     cierre = db.query(CajaCierre).filter(CajaCierre.fecha == fecha).first()
     if not cierre:
         saldo_inicial = get_saldo_anterior(db, fecha)
+        # Partir de los movimientos ya registrados para la fecha; desde aquí se mantiene por deltas
+        ingresos, egresos = totales_movimientos_dia(db, fecha)
         cierre = CajaCierre(
             fecha=fecha,
             saldo_inicial=saldo_inicial,
-            ingresos=0.0,
-            egresos=0.0,
-            saldo_esperado=saldo_inicial,
+            ingresos=ingresos,
+            egresos=egresos,
+            saldo_esperado=saldo_inicial + ingresos - egresos,
             cerrado=False
         )
         db.add(cierre)
-        db.commit()
-        db.refresh(cierre)
+        # Movimientos de un día que no tenía cierre: los días siguientes no los incluían
+        propagar_saldo(db, fecha, ingresos - egresos)
+        if commit:
+            db.commit()
+            db.refresh(cierre)
+        else:
+            db.flush()
     return cierre
 
 
-def actualizar_totales_cierre(db: Session, fecha: date):
-    """Recalcula ingresos, egresos y saldo_esperado del cierre basándose en movimientos."""
-    cierre = get_or_create_cierre(db, fecha)
+def totales_movimientos_dia(db: Session, fecha: date):
+    """Suma ingresos y egresos de la fecha en SQL (SUM ... GROUP BY tipo)."""
+    totales = dict(db.query(
+        MovimientoCaja.tipo, func.coalesce(func.sum(MovimientoCaja.monto), 0)
+    ).filter(MovimientoCaja.fecha == fecha).group_by(MovimientoCaja.tipo).all())
+    return float(totales.get("ingreso", 0.0)), float(totales.get("egreso", 0.0))
+
+
+def aplicar_movimientos_cierre(db: Session, movimientos, signo: int = 1) -> None:
+    """Aplica al cierre de cada día el delta de movimientos agregados (signo=1) o
+    eliminados (signo=-1), sin volver a leer los movimientos del día. No hace commit."""
+    deltas = {}
+    for m in movimientos:
+        ingresos, egresos = deltas.setdefault(m.fecha, [0.0, 0.0])
+        if m.tipo == "ingreso":
+            deltas[m.fecha][0] = ingresos + m.monto * signo
+        else:
+            deltas[m.fecha][1] = egresos + m.monto * signo
+    for fecha, (ingresos, egresos) in deltas.items():
+        existe = db.query(CajaCierre.id).filter(CajaCierre.fecha == fecha).first()
+        if not existe:
+            # El cierre nuevo se calcula con los movimientos ya volcados a la sesión
+            db.flush()
+            get_or_create_cierre(db, fecha, commit=False)
+            continue
+        db.query(CajaCierre).filter(CajaCierre.fecha == fecha).update({
+            CajaCierre.ingresos: CajaCierre.ingresos + ingresos,
+            CajaCierre.egresos: CajaCierre.egresos + egresos,
+            CajaCierre.saldo_esperado: CajaCierre.saldo_esperado + ingresos - egresos,
+            CajaCierre.saldo_final: CajaCierre.saldo_final + ingresos - egresos,
+        }, synchronize_session="evaluate")
+        propagar_saldo(db, fecha, ingresos - egresos)
+
+
+def actualizar_totales_cierre(db: Session, fecha: date, commit: bool = True):
+    """Recalcula desde cero ingresos, egresos y saldo_esperado del cierre (reconciliación).
+    El camino normal es aplicar_movimientos_cierre; esto se usa al cerrar/abrir el día.
+    Con commit=False incluye los movimientos pendientes de la sesión y no confirma."""
+    cierre = get_or_create_cierre(db, fecha, commit=commit)
+    if not commit:
+        db.flush()
     
-    movimientos = listar_movimientos_por_fecha(db, fecha)
-    ingresos = sum(m.monto for m in movimientos if m.tipo == "ingreso")
-    egresos = sum(m.monto for m in movimientos if m.tipo == "egreso")
+    ingresos, egresos = totales_movimientos_dia(db, fecha)
+    delta = (ingresos - egresos) - ((cierre.ingresos or 0) - (cierre.egresos or 0))
     
     cierre.ingresos = ingresos
     cierre.egresos = egresos
     cierre.saldo_esperado = cierre.saldo_inicial + ingresos - egresos
+    _ajustar_neto_cierre(db, cierre, delta)
     
-    db.commit()
-    db.refresh(cierre)
+    if commit:
+        db.commit()
+        db.refresh(cierre)
+    else:
+        db.flush()
     return cierre
 
 
+def reconciliar_cierres(db: Session, desde: date | None = None, hasta: date | None = None, corregir: bool = True):
+    """Compara los totales mantenidos por deltas con SUM ... GROUP BY fecha, tipo sobre los
+    movimientos y corrige el drift. Devuelve {fecha: (ingresos, egresos) esperados} de los
+    cierres que no coincidían."""
+    q = db.query(
+        MovimientoCaja.fecha, MovimientoCaja.tipo, func.sum(MovimientoCaja.monto)
+    )
+    cierres_q = db.query(CajaCierre)
+    if desde:
+        q = q.filter(MovimientoCaja.fecha >= desde)
+        cierres_q = cierres_q.filter(CajaCierre.fecha >= desde)
+    if hasta:
+        q = q.filter(MovimientoCaja.fecha <= hasta)
+        cierres_q = cierres_q.filter(CajaCierre.fecha <= hasta)
+
+    totales = {}
+    for fecha, tipo, monto in q.group_by(MovimientoCaja.fecha, MovimientoCaja.tipo):
+        par = totales.setdefault(fecha, [0.0, 0.0])
+        par[0 if tipo == "ingreso" else 1] += float(monto or 0)
+
+    drift = {}
+    for cierre in cierres_q.all():
+        ingresos, egresos = totales.get(cierre.fecha, (0.0, 0.0))
+        if round(cierre.ingresos or 0, 2) == round(ingresos, 2) and round(cierre.egresos or 0, 2) == round(egresos, 2):
+            continue
+        drift[cierre.fecha] = (ingresos, egresos)
+        if corregir:
+            delta = (ingresos - egresos) - ((cierre.ingresos or 0) - (cierre.egresos or 0))
+            cierre.ingresos = ingresos
+            cierre.egresos = egresos
+            cierre.saldo_esperado = (cierre.saldo_inicial or 0) + ingresos - egresos
+            _ajustar_neto_cierre(db, cierre, delta)
+    if corregir and drift:
+        db.commit()
+    return drift
+
+
+def reconstruir_saldos_cierres(db: Session) -> int:
+    """Rehace el encadenamiento de saldos de todos los cierres (bases anteriores al libro de
+    saldos, donde un día sin cierre reiniciaba el saldo_inicial en 0).
+
+    Crea el cierre de cada día con movimientos que no lo tenga (cerrado sin diferencia si ya
+    pasó, como lo dejaría el autocierre), corrige los totales y recorre los cierres en orden
+    de fecha conservando la diferencia de los cerrados. Devuelve los cierres creados.
+    """
+    hoy = date.today()
+    existentes = {f for (f,) in db.query(CajaCierre.fecha)}
+    creados = 0
+    for fecha in sorted({f for (f,) in db.query(MovimientoCaja.fecha).distinct()} - existentes):
+        db.add(CajaCierre(fecha=fecha, saldo_inicial=0.0, ingresos=0.0, egresos=0.0, saldo_esperado=0.0,
+                          saldo_final=0.0 if fecha < hoy else None, diferencia=0.0 if fecha < hoy else None,
+                          cerrado=fecha < hoy, closed_at=datetime.utcnow() if fecha < hoy else None))
+        creados += 1
+    db.flush()
+
+    totales = {}
+    for fecha, tipo, monto in db.query(
+        MovimientoCaja.fecha, MovimientoCaja.tipo, func.sum(MovimientoCaja.monto)
+    ).group_by(MovimientoCaja.fecha, MovimientoCaja.tipo):
+        totales.setdefault(fecha, [0.0, 0.0])[0 if tipo == "ingreso" else 1] += float(monto or 0)
+
+    saldo = 0.0
+    for cierre in db.query(CajaCierre).order_by(CajaCierre.fecha):
+        ingresos, egresos = totales.get(cierre.fecha, (0.0, 0.0))
+        cierre.saldo_inicial = saldo
+        cierre.ingresos = ingresos
+        cierre.egresos = egresos
+        cierre.saldo_esperado = saldo + ingresos - egresos
+        if cierre.cerrado:
+            cierre.diferencia = cierre.diferencia or 0.0
+            cierre.saldo_final = cierre.saldo_esperado + cierre.diferencia
+        saldo = cierre.saldo_final if cierre.saldo_final is not None else cierre.saldo_esperado
+    db.commit()
+    return creados
+
+
 def abrir_dia(db: Session, fecha: date, usuario_id: int | None = None) -> CajaCierre:
     """Reabre la caja del día: borra saldo_final/diferencia y marca como abierto."""
     cierre = get_or_create_cierre(db, fecha)
     if not cierre.cerrado:
         return cierre
-    # Reabrir
+    # Reabrir: el día vuelve a terminar en saldo_esperado
+    if cierre.saldo_final is not None:
+        propagar_saldo(db, fecha, cierre.saldo_esperado - cierre.saldo_final)
     cierre.cerrado = False
     cierre.saldo_final = None
     cierre.diferencia = None
@@ -190,6 +345,8 @@ def cerrar_dia(db: Session, fecha: date, saldo_final: float, usuario_id: int = N
     cierre.cerrado = True
     cierre.usuario_id = usuario_id
     cierre.closed_at = datetime.utcnow()
+    # El día siguiente abre con el saldo contado
+    propagar_saldo(db, fecha, cierre.diferencia)
     
     db.commit()
     db.refresh(cierre)
@@ -204,21 +361,51 @@ def crear_movimiento(db: Session, data) -> MovimientoCaja:
         descripcion=data.descripcion,
         monto=data.monto,
         referencia_tipo=data.referencia_tipo,
-        referencia_id=data.referencia_id
+        referencia_id=data.referencia_id,
+        prestamo_id=data.prestamo_id,
+        cliente_id=data.cliente_id,
+        cuota_numero=data.cuota_numero
     )
     db.add(movimiento)
+    aplicar_movimientos_cierre(db, [movimiento])
     db.commit()
+    invalidar_cache_metricas()
     db.refresh(movimiento)
     return movimiento
 
 
 def listar_movimientos_por_fecha(db: Session, fecha: date):
-    return db.query(MovimientoCaja).filter(MovimientoCaja.fecha == fecha).order_by(MovimientoCaja.id.asc()).all()
+    return describir_movimientos(
+        db, db.query(MovimientoCaja).filter(MovimientoCaja.fecha == fecha).order_by(MovimientoCaja.id.asc()).all()
+    )
+
+
+def listar_movimientos_paginados(db: Session, desde: Optional[date] = None, hasta: Optional[date] = None,
+                                 tipo: Optional[str] = None, categoria: Optional[str] = None,
+                                 limit: Optional[int] = 100, cursor: Optional[str] = None, con_total: bool = False,
+                                 cliente_id: Optional[int] = None, prestamo_id: Optional[int] = None):
+    """Movimientos en orden (fecha, id) paginados por keyset. limit=None trae todo el rango."""
+    q = db.query(MovimientoCaja)
+    if cliente_id:
+        q = q.filter(MovimientoCaja.cliente_id == cliente_id)
+    if prestamo_id:
+        q = q.filter(MovimientoCaja.prestamo_id == prestamo_id)
+    if desde:
+        q = q.filter(MovimientoCaja.fecha >= desde)
+    if hasta:
+        q = q.filter(MovimientoCaja.fecha <= hasta)
+    if tipo:
+        q = q.filter(MovimientoCaja.tipo == tipo)
+    if categoria:
+        q = q.filter(MovimientoCaja.categoria == categoria)
+    movimientos, siguiente, aprox = paginar(q, (MovimientoCaja.fecha, MovimientoCaja.id), limit, cursor=cursor, con_total=con_total)
+    return describir_movimientos(db, movimientos), siguiente, aprox
 
 
 def autocerrar_dias_pendientes(db: Session):
     """Cierra automáticamente todos los días anteriores a hoy que estén abiertos.
     Usa saldo_esperado como saldo_final para no introducir diferencias.
+    Devuelve la cantidad de días cerrados.
     """
     hoy = date.today()
     pendientes = db.query(CajaCierre).filter(CajaCierre.fecha < hoy, CajaCierre.cerrado == False).all()
@@ -231,103 +418,116 @@ def autocerrar_dias_pendientes(db: Session):
         c.closed_at = datetime.utcnow()
     if pendientes:
         db.commit()
+    return len(pendientes)
+
+def _describir(m: MovimientoCaja, nombres: dict) -> str:
+    nombre = (nombres.get(m.cliente_id) or f"Cliente {m.cliente_id}") if m.cliente_id else "Cliente"
+    if m.categoria == "prestamo":
+        return f"Desembolso préstamo #{m.prestamo_id} - {nombre}"
+    if m.cuota_numero:
+        return f"Cuota #{m.cuota_numero} préstamo {m.prestamo_id} - {nombre}"
+    return f"Pago #{m.referencia_id} préstamo {m.prestamo_id} - {nombre}"
+
+
+def _sin_descripcion(movimientos: list) -> list:
+    return [m for m in movimientos if m.descripcion is None and m.prestamo_id is not None
+            and m.categoria in ("prestamo", "pago") and m.referencia_tipo in ("prestamo", "pago")]
 
-def normalizar_descripciones_movimientos(db: Session):
-    """Actualiza descripciones antiguas que usan 'cliente X' para incluir el nombre real."""
-    movimientos = db.query(MovimientoCaja).all()
-    cambios = 0
+
+def _nombres_clientes(db: Session, movimientos: list) -> dict:
+    ids = {m.cliente_id for m in movimientos if m.cliente_id}
+    return dict(db.query(Cliente.id, Cliente.nombre).filter(Cliente.id.in_(ids)).all()) if ids else {}
+
+
+def describir_movimientos(db: Session, movimientos: list) -> list:
+    """Arma la descripción de los desembolsos y cobros que solo guardan referencias, con los
+    nombres de cliente en una sola consulta. El texto no se marca como cambio (no se persiste)."""
+    sin_texto = _sin_descripcion(movimientos)
+    nombres = _nombres_clientes(db, sin_texto)
+    for m in sin_texto:
+        set_committed_value(m, "descripcion", _describir(m, nombres))
+    return movimientos
+
+
+def desvincular_movimientos_prestamo(db: Session, prestamo_id: int) -> None:
+    """Antes de borrar un préstamo: sus movimientos quedan en la caja con el texto fijado y
+    sin la referencia al préstamo (que dejaría de existir)."""
+    movimientos = db.query(MovimientoCaja).filter(MovimientoCaja.prestamo_id == prestamo_id).all()
+    sin_texto = _sin_descripcion(movimientos)
+    nombres = _nombres_clientes(db, sin_texto)
+    for m in sin_texto:
+        m.descripcion = _describir(m, nombres)
     for m in movimientos:
-        if m.categoria == "prestamo" and "cliente" in (m.descripcion or "") and " - " not in m.descripcion:
-            # Extraer id cliente desde texto
-            parts = m.descripcion.split("cliente")
-            if len(parts) > 1:
-                num = parts[-1].strip()
-                try:
-                    cid = int(num)
-                    cliente = db.query(Cliente).filter(Cliente.id == cid).first()
-                    if cliente:
-                        m.descripcion = m.descripcion.replace(f"cliente {cid}", f"- {cliente.nombre}")
-                        cambios += 1
-                except ValueError:
-                    pass
-        if m.categoria == "pago" and "préstamo" in (m.descripcion or "") and " - " not in m.descripcion:
-            # Añadir nombre del cliente del préstamo
-            # Buscar número de préstamo
-            try:
-                # Buscar último número en la cadena
-                tokens = [t for t in m.descripcion.split() if t.startswith("préstamo") or t.startswith("préstamo")]
-            except Exception:
-                tokens = []
-            # Simpler: parse after word 'préstamo'
-            if "préstamo" in m.descripcion:
-                try:
-                    idx = m.descripcion.index("préstamo")
-                    resto = m.descripcion[idx+8:].strip()
-                    pid = int(resto.split()[0].replace("#","")) if resto else None
-                    if pid:
-                        prestamo = db.query(Prestamo).filter(Prestamo.id == pid).first()
-                        if prestamo:
-                            cliente = db.query(Cliente).filter(Cliente.id == prestamo.cliente_id).first()
-                            if cliente:
-                                m.descripcion = m.descripcion + f" - {cliente.nombre}"
-                                cambios += 1
-                except Exception:
-                    pass
-    if cambios:
-        db.commit()
-    return cambios
+        m.prestamo_id = None
+
+
+def _completar_referencias_movimientos(db: Session, desde: int, hasta: int) -> int:
+    """prestamo_id/cliente_id de los movimientos con id en (desde, hasta] que solo tienen referencia."""
+    rango = (MovimientoCaja.id > desde, MovimientoCaja.id <= hasta)
+    sin_prestamo = (*rango, MovimientoCaja.prestamo_id.is_(None))
+    filas = db.query(MovimientoCaja).filter(*sin_prestamo, MovimientoCaja.referencia_tipo == "prestamo").update(
+        {MovimientoCaja.prestamo_id: MovimientoCaja.referencia_id}, synchronize_session=False)
+    prestamo_del_pago = select(Pago.prestamo_id).where(Pago.id == MovimientoCaja.referencia_id).scalar_subquery()
+    filas += db.query(MovimientoCaja).filter(*sin_prestamo, MovimientoCaja.referencia_tipo == "pago").update(
+        {MovimientoCaja.prestamo_id: prestamo_del_pago}, synchronize_session=False)
+    cliente_del_prestamo = select(Prestamo.cliente_id).where(Prestamo.id == MovimientoCaja.prestamo_id).scalar_subquery()
+    db.query(MovimientoCaja).filter(*rango, MovimientoCaja.prestamo_id.isnot(None), MovimientoCaja.cliente_id.is_(None)).update(
+        {MovimientoCaja.cliente_id: cliente_del_prestamo}, synchronize_session=False)
+    # Textos viejos sin nombre de cliente ("... cliente 3", "Pago #8 préstamo 2"): se arman al leer
+    db.query(MovimientoCaja).filter(
+        *rango, MovimientoCaja.prestamo_id.isnot(None), ~MovimientoCaja.descripcion.contains(" - "),
+        or_(
+            and_(MovimientoCaja.categoria == "prestamo", MovimientoCaja.referencia_tipo == "prestamo"),
+            and_(MovimientoCaja.categoria == "pago", MovimientoCaja.referencia_tipo == "pago",
+                 MovimientoCaja.descripcion.startswith("Pago #")),
+        ),
+    ).update({MovimientoCaja.descripcion: None}, synchronize_session=False)
+    return filas
+
+
+def backfill_referencias_movimientos(db: Session, lote: int = LOTE_BACKFILL, progreso=None):
+    """Completa las referencias estructuradas de los movimientos anteriores a esas columnas.
+
+    Reemplaza a la normalización de descripciones, que recorría todos los movimientos
+    interpretando el texto y consultando préstamo y cliente uno por uno.
+    """
+    return ejecutar_por_lotes(
+        db, "referencias_movimientos",
+        [Fase("movimientos", lambda s: s.query(func.max(MovimientoCaja.id)).scalar(), _completar_referencias_movimientos)],
+        lote=lote, progreso=progreso,
+    )
 
 
 def get_cierre_caja(db: Session, fecha: date):
     """Obtiene el cierre del día con saldo_inicial, ingresos, egresos, saldo_esperado, saldo_final, cerrado.
-    Incluye cálculo de comisiones y flujo neto real."""
-    # Antes de responder, autocerrar días anteriores abiertos (olvidos al pasar 00:00)
-    autocerrar_dias_pendientes(db)
-    cierre = get_or_create_cierre(db, fecha)
-    actualizar_totales_cierre(db, fecha)
-    
-    movimientos = listar_movimientos_por_fecha(db, fecha)
-    detalle_ingresos = {}
-    detalle_egresos = {}
+    Incluye cálculo de comisiones y flujo neto real.
 
-    for m in movimientos:
-        if m.tipo == "ingreso":
-            detalle_ingresos.setdefault(m.categoria or "otros", 0.0)
-            detalle_ingresos[m.categoria or "otros"] += m.monto
-        else:
-            detalle_egresos.setdefault(m.categoria or "otros", 0.0)
-            detalle_egresos[m.categoria or "otros"] += m.monto
-
-    # Calcular comisiones del día
-    comisiones_vendedor = db.query(
-        func.sum(PagoVendedor.monto_comision)
-    ).join(Pago, PagoVendedor.pago_id == Pago.id).filter(
-        Pago.fecha_pago == fecha
-    ).scalar() or 0.0
-    
-    comisiones_cobrador = db.query(
-        func.sum(PagoCobrador.monto_comision)
-    ).join(Pago, PagoCobrador.pago_id == Pago.id).filter(
-        Pago.fecha_pago == fecha
-    ).scalar() or 0.0
-    
+    Solo lectura: si el día no tiene cierre se arma una vista con el saldo encadenado, sin
+    crearlo. Los días anteriores abiertos los cierra el mantenimiento periódico
+    (app/mantenimiento_service.py), no cada consulta.
+    """
+    return cierres_rango(db, fecha, fecha)[0]
+
+
+def _resumen_cierre(fecha, saldo_inicial, ingresos, egresos, saldo_esperado, saldo_final, diferencia, cerrado,
+                    detalle_ingresos, detalle_egresos, comisiones_vendedor, comisiones_cobrador) -> dict:
     total_comisiones = comisiones_vendedor + comisiones_cobrador
     
     # Ingresos netos (descontando comisiones que se pagarán)
-    ingresos_netos = cierre.ingresos - total_comisiones
+    ingresos_netos = ingresos - total_comisiones
     
     # Flujo neto del día
-    flujo_neto = ingresos_netos - cierre.egresos
+    flujo_neto = ingresos_netos - egresos
 
     return {
         "fecha": fecha.isoformat(),
-        "saldo_inicial": round(cierre.saldo_inicial, 2),
-        "ingresos": round(cierre.ingresos, 2),
-        "egresos": round(cierre.egresos, 2),
-        "saldo_esperado": round(cierre.saldo_esperado, 2),
-        "saldo_final": round(cierre.saldo_final, 2) if cierre.saldo_final is not None else None,
-        "diferencia": round(cierre.diferencia, 2) if cierre.diferencia is not None else None,
-        "cerrado": cierre.cerrado,
+        "saldo_inicial": round(saldo_inicial, 2),
+        "ingresos": round(ingresos, 2),
+        "egresos": round(egresos, 2),
+        "saldo_esperado": round(saldo_esperado, 2),
+        "saldo_final": round(saldo_final, 2) if saldo_final is not None else None,
+        "diferencia": round(diferencia, 2) if diferencia is not None else None,
+        "cerrado": bool(cerrado),
         "detalle_ingresos": {k: round(v, 2) for k, v in detalle_ingresos.items()},
         "detalle_egresos": {k: round(v, 2) for k, v in detalle_egresos.items()},
         "comisiones": {
@@ -336,15 +536,102 @@ def get_cierre_caja(db: Session, fecha: date):
             "total": round(total_comisiones, 2)
         },
         "flujo_neto": {
-            "ingresos_brutos": round(cierre.ingresos, 2),
+            "ingresos_brutos": round(ingresos, 2),
             "comisiones_a_pagar": round(total_comisiones, 2),
             "ingresos_netos": round(ingresos_netos, 2),
-            "egresos": round(cierre.egresos, 2),
+            "egresos": round(egresos, 2),
             "flujo_del_dia": round(flujo_neto, 2)
         }
     }
 
 
+# === REPORTE DE CIERRES POR RANGO ===
+# Un rango de días se arma con una consulta agrupada por tabla (cierres, movimientos por
+# categoría, comisiones de vendedor y de cobrador) por cada bloque de DIAS_POR_BLOQUE días,
+# sin autocerrar ni crear cierres: los días sin cierre se calculan al vuelo encadenando el
+# saldo. Los bloques acotan la memoria al transmitir rangos largos como CSV.
+DIAS_POR_BLOQUE = 31
+MAX_DIAS_REPORTE_CIERRES = 3660
+
+
+def _detalle_por_dia(db: Session, desde: date, hasta: date) -> dict:
+    detalles = {}
+    for fecha, tipo, categoria, monto in db.query(
+        MovimientoCaja.fecha, MovimientoCaja.tipo, MovimientoCaja.categoria, func.sum(MovimientoCaja.monto)
+    ).filter(MovimientoCaja.fecha >= desde, MovimientoCaja.fecha <= hasta).group_by(
+        MovimientoCaja.fecha, MovimientoCaja.tipo, MovimientoCaja.categoria
+    ):
+        detalle = detalles.setdefault(fecha, ({}, {}))[0 if tipo == "ingreso" else 1]
+        detalle[categoria or "otros"] = detalle.get(categoria or "otros", 0.0) + float(monto or 0)
+    return detalles
+
+
+def _comisiones_por_dia(db: Session, modelo, desde: date, hasta: date) -> dict:
+    return {fecha: float(monto or 0) for fecha, monto in db.query(
+        Pago.fecha_pago, func.sum(modelo.monto_comision)
+    ).join(Pago, modelo.pago_id == Pago.id).filter(
+        Pago.fecha_pago >= desde, Pago.fecha_pago <= hasta
+    ).group_by(Pago.fecha_pago)}
+
+
+def iterar_cierres_rango(db: Session, desde: date, hasta: date):
+    """Resumen de cada día de [desde, hasta] con la forma de get_cierre_caja. Solo lectura."""
+    saldo = get_saldo_anterior(db, desde)
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + timedelta(days=DIAS_POR_BLOQUE - 1), hasta)
+        cierres = {fila[0]: fila[1:] for fila in db.query(
+            CajaCierre.fecha, CajaCierre.saldo_inicial, CajaCierre.ingresos, CajaCierre.egresos,
+            CajaCierre.saldo_esperado, CajaCierre.saldo_final, CajaCierre.diferencia, CajaCierre.cerrado,
+        ).filter(CajaCierre.fecha >= inicio, CajaCierre.fecha <= fin)}
+        detalles = _detalle_por_dia(db, inicio, fin)
+        vendedor = _comisiones_por_dia(db, PagoVendedor, inicio, fin)
+        cobrador = _comisiones_por_dia(db, PagoCobrador, inicio, fin)
+        for i in range((fin - inicio).days + 1):
+            fecha = inicio + timedelta(days=i)
+            detalle_ingresos, detalle_egresos = detalles.get(fecha, ({}, {}))
+            valores = cierres.get(fecha)
+            if valores is None:
+                # Día sin cierre: abre con el saldo del anterior, no se crea nada
+                ingresos, egresos = sum(detalle_ingresos.values()), sum(detalle_egresos.values())
+                valores = (saldo, ingresos, egresos, saldo + ingresos - egresos, None, None, False)
+            saldo = valores[4] if valores[4] is not None else valores[3]
+            yield _resumen_cierre(fecha, *valores, detalle_ingresos, detalle_egresos,
+                                  vendedor.get(fecha, 0.0), cobrador.get(fecha, 0.0))
+        inicio = fin + timedelta(days=1)
+
+
+def cierres_rango(db: Session, desde: date, hasta: date) -> list:
+    return list(iterar_cierres_rango(db, desde, hasta))
+
+
+def filas_csv_cierres(db: Session, desde: date, hasta: date):
+    """Líneas CSV del reporte de cierres, una por día, con una columna por categoría."""
+    categorias = sorted({(tipo, categoria or "otros") for tipo, categoria in db.query(
+        MovimientoCaja.tipo, MovimientoCaja.categoria
+    ).filter(MovimientoCaja.fecha >= desde, MovimientoCaja.fecha <= hasta).distinct()})
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def linea(valores):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerow(valores)
+        return buffer.getvalue()
+
+    yield linea(["fecha", "saldo_inicial", "ingresos", "egresos", "saldo_esperado", "saldo_final", "diferencia",
+                 "cerrado", "comisiones_vendedor", "comisiones_cobrador", "ingresos_netos", "flujo_del_dia"]
+                + [f"{tipo}_{categoria}" for tipo, categoria in categorias])
+    for dia in iterar_cierres_rango(db, desde, hasta):
+        yield linea([
+            dia["fecha"], dia["saldo_inicial"], dia["ingresos"], dia["egresos"], dia["saldo_esperado"],
+            "" if dia["saldo_final"] is None else dia["saldo_final"], "" if dia["diferencia"] is None else dia["diferencia"],
+            int(dia["cerrado"]), dia["comisiones"]["vendedor"], dia["comisiones"]["cobrador"],
+            dia["flujo_neto"]["ingresos_netos"], dia["flujo_neto"]["flujo_del_dia"],
+        ] + [(dia["detalle_ingresos"] if tipo == "ingreso" else dia["detalle_egresos"]).get(categoria, 0)
+             for tipo, categoria in categorias])
+
+
 # ===== CAJA EMPLEADO =====
 def get_or_create_cierre_empleado(db: Session, fecha: date, empleado_id: int) -> CajaEmpleadoCierre:
     cierre = db.query(CajaEmpleadoCierre).filter(
@@ -406,6 +693,7 @@ def crear_movimiento_empleado(db: Session, fecha: date, empleado_id: int, tipo:
             referencia_id=empleado_id
         )
         db.add(centro)
+        aplicar_movimientos_cierre(db, [centro])
         db.commit()
     return mov
 
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -12,11 +14,91 @@ DATABASE_URL = os.getenv(
     "sqlite:///./gestor_prestamista.db"
 )
 
+# Perfil de base de datos: desarrollo (valores por defecto del driver) | produccion
+DB_PROFILE = os.getenv("DB_PROFILE", "desarrollo").lower()
+ES_SQLITE = DATABASE_URL.startswith("sqlite")
+ES_PRODUCCION = DB_PROFILE == "produccion"
+
+# Pragmas de SQLite en producción: WAL (lectores no bloquean al escritor), fsync solo en
+# checkpoints, caché de páginas y mmap dimensionados, temporales en memoria y espera ante locks.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "65536")),  # negativo = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+
+
+def _opciones_pool() -> dict:
+    """Opciones del pool de conexiones según el perfil y las variables DB_POOL_*.
+
+    El threadpool de FastAPI corre hasta 40 handlers síncronos a la vez; el pool debe
+    alcanzar para los concurrentes habituales y esperar (pool_timeout) en lugar de fallar.
+    """
+    opciones = {}
+    en_memoria = ES_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/") == "sqlite:")
+    if en_memoria:
+        return opciones
+    if ES_PRODUCCION:
+        opciones.update(pool_size=10, max_overflow=20, pool_timeout=30)
+        if not ES_SQLITE:
+            # MySQL/Postgres cierran conexiones ociosas (wait_timeout): validar y reciclar
+            opciones.update(pool_pre_ping=True, pool_recycle=1800)
+    for variable, clave, tipo in (
+        ("DB_POOL_SIZE", "pool_size", int),
+        ("DB_MAX_OVERFLOW", "max_overflow", int),
+        ("DB_POOL_TIMEOUT", "pool_timeout", float),
+        ("DB_POOL_RECYCLE", "pool_recycle", int),
+    ):
+        valor = os.getenv(variable)
+        if valor:
+            opciones[clave] = tipo(valor)
+    if os.getenv("DB_POOL_PRE_PING"):
+        opciones["pool_pre_ping"] = os.getenv("DB_POOL_PRE_PING").lower() in ("1", "true", "si", "yes")
+    return opciones
+
+
 # Para SQLite, agregar check_same_thread solo si es SQLite
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+connect_args = {"check_same_thread": False} if ES_SQLITE else {}
+if ES_SQLITE and ES_PRODUCCION:
+    # Espera del driver ante "database is locked" (segundos), igual que busy_timeout
+    connect_args["timeout"] = SQLITE_PRAGMAS["busy_timeout"] / 1000
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **_opciones_pool())
+
+
+def _url_async(url: str) -> str:
+    """Misma base con driver async: aiosqlite, asyncpg o aiomysql."""
+    esquema, resto = url.split("://", 1)
+    motor = esquema.split("+")[0]
+    driver = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}.get(motor)
+    return f"{motor}+{driver}://{resto}" if driver else url
+
+
+# Engine async para los endpoints de lectura (async def). Comparte base, perfil y pool.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _url_async(DATABASE_URL))
+_opciones_pool_async = _opciones_pool()
+if ES_SQLITE and _opciones_pool_async:
+    # aiosqlite usa NullPool por defecto; con opciones de pool se usa un pool con cola
+    _opciones_pool_async["poolclass"] = AsyncAdaptedQueuePool
+async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=connect_args, **_opciones_pool_async)
+
+
+def _aplicar_pragmas_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, valor in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={valor}")
+    cursor.close()
+
+
+if ES_SQLITE and ES_PRODUCCION:
+    event.listen(engine, "connect", _aplicar_pragmas_sqlite)
+    event.listen(async_engine.sync_engine, "connect", _aplicar_pragmas_sqlite)
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -27,3 +109,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency async: los endpoints la usan con `await db.run_sync(servicio, ...)`, que corre
+# el código ORM de los servicios sin ocupar un hilo del threadpool mientras espera la base
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
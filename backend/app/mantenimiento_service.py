@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.caja_service import reconciliar_cierres, autocerrar_dias_pendientes
+
+
+# === MANTENIMIENTO PERIÓDICO ===
+# Tareas recurrentes que antes corrían en el import de main.py: se ejecutan en segundo plano
+# después de que la app empieza a atender (primera corrida a los MANTENIMIENTO_DEMORA_SEG) y
+# luego cada MANTENIMIENTO_INTERVALO_SEG, en un hilo para no bloquear el event loop.
+# Intervalo 0 desactiva la tarea (p. ej. en todos los workers salvo uno).
+#
+# Es el único lugar donde se autocierran los días anteriores (GET /api/caja/cierre es solo
+# lectura): además del intervalo, hay una corrida apenas pasada la medianoche.
+MANTENIMIENTO_INTERVALO_SEG = float(os.getenv("MANTENIMIENTO_INTERVALO_SEG", "3600"))
+MANTENIMIENTO_DEMORA_SEG = float(os.getenv("MANTENIMIENTO_DEMORA_SEG", "30"))
+MARGEN_MEDIANOCHE_SEG = 60.0
+
+_tarea: Optional[asyncio.Task] = None
+_ultima = {'corridas': 0, 'errores': 0, 'ultima_duracion_ms': None, 'ultimo_resultado': None}
+
+
+def ejecutar_mantenimiento(db_factory, log=print) -> dict:
+    """Una pasada: corrige drift de totales de cierres y cierra los días anteriores abiertos."""
+    inicio = time.perf_counter()
+    db: Session = db_factory()
+    try:
+        drift = reconciliar_cierres(db)
+        if drift:
+            log(f"[Caja] Totales de {len(drift)} cierres reconciliados con los movimientos.")
+        cerrados = autocerrar_dias_pendientes(db)
+        if cerrados:
+            log(f"[Caja] {cerrados} días anteriores cerrados automáticamente.")
+    finally:
+        db.close()
+    resultado = {'cierres_reconciliados': len(drift), 'dias_autocerrados': cerrados}
+    _ultima['corridas'] += 1
+    _ultima['ultima_duracion_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    _ultima['ultimo_resultado'] = resultado
+    return resultado
+
+
+def segundos_hasta_proxima_corrida(ahora: Optional[datetime] = None) -> float:
+    """El intervalo, o menos si antes pasa la medianoche (más un margen)."""
+    ahora = ahora or datetime.now()
+    medianoche = datetime.combine(ahora.date() + timedelta(days=1), datetime.min.time())
+    return min(MANTENIMIENTO_INTERVALO_SEG, (medianoche - ahora).total_seconds() + MARGEN_MEDIANOCHE_SEG)
+
+
+async def _bucle(db_factory):
+    await asyncio.sleep(MANTENIMIENTO_DEMORA_SEG)
+    while True:
+        try:
+            await asyncio.to_thread(ejecutar_mantenimiento, db_factory)
+        except Exception as e:
+            _ultima['errores'] += 1
+            print(f"[Mantenimiento] Error: {e}")
+        await asyncio.sleep(segundos_hasta_proxima_corrida())
+
+
+def iniciar_mantenimiento(db_factory) -> Optional[asyncio.Task]:
+    """Programa la tarea en el event loop actual (llamar desde el startup de la app)."""
+    global _tarea
+    if MANTENIMIENTO_INTERVALO_SEG <= 0 or (_tarea is not None and not _tarea.done()):
+        return _tarea
+    _tarea = asyncio.get_running_loop().create_task(_bucle(db_factory))
+    return _tarea
+
+
+async def detener_mantenimiento() -> None:
+    global _tarea
+    tarea, _tarea = _tarea, None
+    if tarea is not None and not tarea.done():
+        tarea.cancel()
+        try:
+            await tarea
+        except asyncio.CancelledError:
+            pass
+
+
+def get_mantenimiento_stats() -> dict:
+    return {
+        **_ultima,
+        'activo': _tarea is not None and not _tarea.done(),
+        'intervalo_seg': MANTENIMIENTO_INTERVALO_SEG,
+    }
@@ -1,106 +1,154 @@
+import copy
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import date, datetime, timedelta
 from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.models import Cliente, Prestamo, Pago, PagoVendedor, PagoCobrador, PrestamoVendedor
-from app.amortization_service import generar_amortizacion
-
-
+from sqlalchemy import func, case, and_
+from app.models.models import Cliente, Prestamo, Pago, PagoVendedor, PagoCobrador, PrestamoVendedor, Cuota, PRESTAMO_CON_SALDO
+from app.portfolio_stats_service import leer_portfolio_stats
+from app.scoping_service import prestamos_del_vendedor, vendedor_tiene_prestamos
+
+
+# === CACHE DE MÉTRICAS ===
+# Resultados en memoria del proceso. Las escrituras (préstamos, pagos, caja) llaman a
+# invalidar_cache_metricas(), que incrementa la versión y descarta las entradas;
+# el TTL acota la desactualización cuando hay varios workers.
+METRICS_CACHE_MAX = int(os.getenv("METRICS_CACHE_MAX", "256"))
+METRICS_CACHE_TTL = float(os.getenv("METRICS_CACHE_TTL", "60"))
+
+_cache_lock = threading.Lock()
+_cache_entradas: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_version = 0
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidaciones': 0}
+
+
+def invalidar_cache_metricas() -> None:
+    """Invalida todos los resultados cacheados. Llamar después del commit de una escritura."""
+    global _cache_version
+    with _cache_lock:
+        _cache_version += 1
+        _cache_entradas.clear()
+        _cache_stats['invalidaciones'] += 1
+
+
+def get_cache_stats() -> dict:
+    with _cache_lock:
+        total = _cache_stats['hits'] + _cache_stats['misses']
+        return {
+            **_cache_stats,
+            'hit_rate': round(_cache_stats['hits'] / total, 4) if total else 0.0,
+            'entradas': len(_cache_entradas),
+            'max_entradas': METRICS_CACHE_MAX,
+            'ttl_segundos': METRICS_CACHE_TTL,
+            'version': _cache_version,
+        }
+
+
+def cache_metricas(func):
+    """Cachea el resultado por función, argumentos (sin la sesión) y fecha del día.
+
+    Los argumentos se normalizan contra la firma (con sus valores por defecto), así f(db, x),
+    f(db, x=x) y f(db) con x por defecto comparten la entrada."""
+    firma = inspect.signature(func)
+    sesion = next(iter(firma.parameters))
+
+    @functools.wraps(func)
+    def wrapper(db: Session, *args, **kwargs):
+        if METRICS_CACHE_MAX <= 0:
+            return func(db, *args, **kwargs)
+        argumentos = firma.bind(db, *args, **kwargs)
+        argumentos.apply_defaults()
+        clave = (func.__name__, tuple((k, v) for k, v in argumentos.arguments.items() if k != sesion), date.today())
+        ahora = time.monotonic()
+        with _cache_lock:
+            entrada = _cache_entradas.get(clave)
+            if entrada is not None and entrada[0] == _cache_version and entrada[1] > ahora:
+                _cache_entradas.move_to_end(clave)
+                _cache_stats['hits'] += 1
+                return copy.deepcopy(entrada[2])
+            _cache_stats['misses'] += 1
+            version = _cache_version
+
+        resultado = func(db, *args, **kwargs)
+
+        with _cache_lock:
+            # Si hubo una escritura mientras se calculaba, no guardar un resultado viejo
+            if version == _cache_version:
+                _cache_entradas[clave] = (version, ahora + METRICS_CACHE_TTL, copy.deepcopy(resultado))
+                _cache_entradas.move_to_end(clave)
+                while len(_cache_entradas) > METRICS_CACHE_MAX:
+                    _cache_entradas.popitem(last=False)
+                    _cache_stats['evictions'] += 1
+        return resultado
+    return wrapper
+
+
+@cache_metricas
 def get_summary_metrics(db: Session, empleado_id: Optional[int] = None) -> dict:
     today = date.today()
 
-    # Si hay empleado_id, filtrar por vendedor usando PrestamoVendedor
-    prestamos_query = db.query(Prestamo)
-    pagos_query = db.query(Pago)
-    
-    if empleado_id:
-        # Obtener IDs de préstamos del vendedor
-        prestamos_ids = db.query(PrestamoVendedor.prestamo_id).filter(
-            PrestamoVendedor.empleado_id == empleado_id
-        ).distinct().all()
-        prestamo_ids_list = [p[0] for p in prestamos_ids]
-        
-        if prestamo_ids_list:
-            prestamos_query = prestamos_query.filter(Prestamo.id.in_(prestamo_ids_list))
-            pagos_query = pagos_query.filter(Pago.prestamo_id.in_(prestamo_ids_list))
-            
-            # Clientes únicos de esos préstamos
-            cliente_ids = db.query(Prestamo.cliente_id).filter(Prestamo.id.in_(prestamo_ids_list)).distinct().all()
-            total_clientes = len(cliente_ids)
-        else:
-            total_clientes = 0
-    else:
-        total_clientes = db.query(func.count(Cliente.id)).scalar() or 0
-
-    total_prestamos = prestamos_query.count() or 0
-    total_pagos = pagos_query.count() or 0
-
-    monto_total_recaudado = pagos_query.with_entities(func.coalesce(func.sum(Pago.monto), 0)).scalar() or 0.0
-    saldo_pendiente_total = prestamos_query.with_entities(func.coalesce(func.sum(Prestamo.saldo_pendiente), 0)).scalar() or 0.0
-
-    # Calcular prestado, esperado e intereses iterando préstamos filtrados
-    todos_prestamos = prestamos_query.all()
-    monto_total_prestado = 0.0
-    monto_total_esperado = 0.0
-    intereses_generados = 0.0
-    
-    for p in todos_prestamos:
-        capital = float(p.monto)
-        tasa = float(p.tasa_interes)
-        interes = capital * (tasa / 100.0)
-        total = capital + interes
-        
-        monto_total_prestado += capital
-        monto_total_esperado += total
-        intereses_generados += interes
-
-    prestamos_activos_query = prestamos_query.filter(Prestamo.saldo_pendiente > 0, Prestamo.estado == 'activo')
-    prestamos_activos = prestamos_activos_query.count() or 0
-    
-    prestamos_vencidos_query = prestamos_query.filter(
-        Prestamo.saldo_pendiente > 0,
-        Prestamo.fecha_vencimiento < today
+    # Si hay empleado_id, filtrar por vendedor usando PrestamoVendedor (semi-join, sin listas de IDs)
+    filtrar_vendedor = bool(empleado_id) and vendedor_tiene_prestamos(db, empleado_id)
+
+    def _del_vendedor(prestamo_id_col):
+        return prestamo_id_col.in_(prestamos_del_vendedor(empleado_id))
+
+    # Totales acumulados: lectura por clave de portfolio_stats (global o del vendedor)
+    stats = leer_portfolio_stats(db, empleado_id if filtrar_vendedor else None)
+    stats_global = leer_portfolio_stats(db) if filtrar_vendedor else stats
+    total_prestamos = stats['total_prestamos']
+    total_pagos = stats['total_pagos']
+    prestamos_activos = stats['prestamos_activos']
+    saldo_pendiente_total = float(stats['saldo_pendiente_total'])
+    monto_total_prestado = float(stats['monto_total_prestado'])
+    intereses_generados = float(stats['intereses_generados'])
+    monto_total_esperado = monto_total_prestado + intereses_generados
+    monto_total_recaudado = float(stats['monto_total_recaudado'])
+    total_comisiones_vendedor = float(stats_global['comisiones_vendedor'])
+    total_comisiones_cobrador = float(stats_global['comisiones_cobrador'])
+
+    # Lo que depende de la fecha o de clientes distintos se consulta en SQL
+    con_saldo = Prestamo.saldo_pendiente > 0
+    prestamos_agg = db.query(
+        func.count(case((and_(con_saldo, Prestamo.fecha_vencimiento < today), 1))),
+        func.count(func.distinct(Prestamo.cliente_id)),
+        func.count(func.distinct(case((con_saldo, Prestamo.cliente_id))))
     )
-    prestamos_vencidos = prestamos_vencidos_query.count() or 0
-
-    pagos_hoy_query = pagos_query.filter(Pago.fecha_pago == today)
-    pagos_hoy = pagos_hoy_query.count() or 0
+    pagos_hoy_q = db.query(func.count(Pago.id)).filter(Pago.fecha_pago == today)
+    if filtrar_vendedor:
+        prestamos_agg = prestamos_agg.filter(_del_vendedor(Prestamo.id))
+        pagos_hoy_q = pagos_hoy_q.filter(_del_vendedor(Pago.prestamo_id))
+    prestamos_vencidos, clientes_con_prestamos, clientes_activos = prestamos_agg.one()
+    pagos_hoy = pagos_hoy_q.scalar() or 0
+
+    if not empleado_id:
+        total_clientes = db.query(func.count(Cliente.id)).scalar() or 0
+    elif filtrar_vendedor:
+        # Clientes únicos de los préstamos del vendedor
+        total_clientes = clientes_con_prestamos
+    else:
+        total_clientes = 0
+        clientes_activos = 0
 
     average_loan_size = (monto_total_prestado / total_prestamos) if total_prestamos > 0 else 0.0
     ticket_promedio_pago = (monto_total_recaudado / total_pagos) if total_pagos > 0 else 0.0
 
-    # Clientes activos: count distinct de cliente_id donde saldo > 0
-    if empleado_id:
-        if prestamo_ids_list:
-            clientes_activos = db.query(func.count(func.distinct(Prestamo.cliente_id))).filter(
-                Prestamo.saldo_pendiente > 0,
-                Prestamo.id.in_(prestamo_ids_list)
-            ).scalar() or 0
-        else:
-            clientes_activos = 0
-    else:
-        clientes_activos = db.query(func.count(func.distinct(Prestamo.cliente_id))).filter(
-            Prestamo.saldo_pendiente > 0
-        ).scalar() or 0
-    
     # Calcular tasa de activación (clientes con préstamos activos / total clientes)
     activation_rate = (clientes_activos / total_clientes) if total_clientes > 0 else 0.0
     
-    # Calcular comisiones (totales históricas globales)
-    total_comisiones_vendedor = db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).scalar() or 0.0
-    total_comisiones_cobrador = db.query(func.coalesce(func.sum(PagoCobrador.monto_comision), 0)).scalar() or 0.0
+    # Comisiones (totales históricas globales)
     total_comisiones = total_comisiones_vendedor + total_comisiones_cobrador
 
-    # Si se filtra por empleado, calcular sus ganancias históricas (todas las comisiones)
+    # Si se filtra por empleado, sus ganancias históricas (todas las comisiones)
     mis_ganancias = None
     if empleado_id:
-        mis_vendedor = db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).filter(
-            PagoVendedor.empleado_id == empleado_id
-        ).scalar() or 0.0
-        mis_cobrador = db.query(func.coalesce(func.sum(PagoCobrador.monto_comision), 0)).filter(
-            PagoCobrador.empleado_id == empleado_id
-        ).scalar() or 0.0
-        mis_ganancias = round(mis_vendedor + mis_cobrador, 2)
+        mis = leer_portfolio_stats(db, empleado_id) if not filtrar_vendedor else stats
+        mis_ganancias = round(float(mis['comisiones_vendedor']) + float(mis['comisiones_cobrador']), 2)
     
     # Ganancias netas sin intereses: recaudado - comisiones pagadas.
     ganancias_netas = monto_total_recaudado - total_comisiones
@@ -141,21 +189,15 @@ def get_summary_metrics(db: Session, empleado_id: Optional[int] = None) -> dict:
 
 def get_due_today(db: Session) -> dict:
     """Monto esperado a cobrar hoy y cantidad de cuotas con fecha de hoy."""
-    today = date.today().isoformat()
-    monto = 0.0
-    count = 0
-
-    prestamos = db.query(Prestamo).all()
-    for p in prestamos:
-        cuotas = generar_amortizacion(p, db)
-        for c in cuotas:
-            if c['fecha'] == today:
-                monto += float(c['monto'] or 0)
-                count += 1
+    today = date.today()
+    monto, count = db.query(
+        func.coalesce(func.sum(Cuota.monto), 0),
+        func.count(Cuota.id)
+    ).filter(Cuota.fecha_vencimiento == today).one()
 
     return {
-        'fecha': today,
-        'monto_esperado_hoy': round(monto, 2),
+        'fecha': today.isoformat(),
+        'monto_esperado_hoy': round(float(monto), 2),
         'cuotas_hoy': count
     }
 
@@ -166,25 +208,22 @@ def get_due_next(db: Session, days: int = 7) -> dict:
     base = date.today()
     limit = base + timedelta(days=days)
 
-    total_monto = 0.0
-    total_count = 0
-    por_dia = {}
-
-    prestamos = db.query(Prestamo).all()
-    for p in prestamos:
-        cuotas = generar_amortizacion(p, db)
-        for c in cuotas:
-            f = c['fecha']
-            # rango: (hoy, hoy+days]
-            if base.isoformat() < f <= limit.isoformat():
-                total_monto += float(c['monto'] or 0)
-                total_count += 1
-                por_dia.setdefault(f, {'fecha': f, 'monto': 0.0, 'cantidad': 0})
-                por_dia[f]['monto'] += float(c['monto'] or 0)
-                por_dia[f]['cantidad'] += 1
-
-    # Ordenar por fecha
-    detalle = [por_dia[k] for k in sorted(por_dia.keys())]
+    # rango: (hoy, hoy+days]
+    filas = db.query(
+        Cuota.fecha_vencimiento,
+        func.sum(Cuota.monto),
+        func.count(Cuota.id)
+    ).filter(
+        Cuota.fecha_vencimiento > base,
+        Cuota.fecha_vencimiento <= limit
+    ).group_by(Cuota.fecha_vencimiento).order_by(Cuota.fecha_vencimiento).all()
+
+    detalle = [
+        {'fecha': f.isoformat(), 'monto': float(monto or 0), 'cantidad': cantidad}
+        for f, monto, cantidad in filas
+    ]
+    total_monto = sum(d['monto'] for d in detalle)
+    total_count = sum(d['cantidad'] for d in detalle)
 
     return {
         'desde': base.isoformat(),
@@ -195,6 +234,7 @@ def get_due_next(db: Session, days: int = 7) -> dict:
     }
 
 
+@cache_metricas
 def get_kpis(db: Session) -> dict:
     """Combina resumen + esperado hoy + recaudado hoy y cálculos derivados."""
     summary = get_summary_metrics(db)
@@ -241,10 +281,10 @@ def get_daily_simple(db: Session, days: int = 1) -> dict:
     today_date = date.today()
     start_date = today_date - timedelta(days=days - 1)
 
-    # Préstamos creados en el período (principal y con intereses)
+    # Préstamos creados en el período (principal y con intereses); rango sargable sobre created_at
     prestado_hoy = db.query(func.coalesce(func.sum(Prestamo.monto), 0)).filter(
-        func.date(Prestamo.created_at) >= start_date,
-        func.date(Prestamo.created_at) <= today_date
+        Prestamo.created_at >= datetime.combine(start_date, datetime.min.time()),
+        Prestamo.created_at < datetime.combine(today_date + timedelta(days=1), datetime.min.time())
     ).scalar() or 0.0
 
     # Cobrado en el período (pagos realizados)
@@ -253,18 +293,10 @@ def get_daily_simple(db: Session, days: int = 1) -> dict:
         Pago.fecha_pago <= today_date
     ).scalar() or 0.0
 
-    # Por cobrar en el período (monto esperado de cuotas con fecha en el rango)
-    # Generar tabla de amortización para todos los préstamos activos
-    prestamos_activos = db.query(Prestamo).filter(Prestamo.saldo_pendiente > 0).all()
-    por_cobrar_hoy = 0.0
-    for prestamo in prestamos_activos:
-        amortizacion = generar_amortizacion(prestamo, db)
-        for cuota in amortizacion:
-            from datetime import datetime as dt
-            fecha_cuota = dt.fromisoformat(cuota['fecha']).date()
-            if start_date <= fecha_cuota <= today_date:
-                if cuota['estado'] != 'Pagado':  # Solo cuotas pendientes o vencidas
-                    por_cobrar_hoy += cuota['monto']
+    # Por cobrar en el período (cuotas pendientes o vencidas de préstamos activos con fecha en el rango)
+    por_cobrar_hoy = _cuotas_pendientes_en_rango(db, start_date, today_date).with_entities(
+        func.coalesce(func.sum(Cuota.monto), 0)
+    ).scalar() or 0.0
 
     return {
         'fecha': today_date.isoformat(),
@@ -288,16 +320,13 @@ def get_period_metrics(db: Session, period_type: str, start_date: date, end_date
         Prestamo.fecha_inicio <= end_date
     )
     
-    # Filtrar por empleado si no es admin
+    # Filtrar por empleado si no es admin (semi-join con sus préstamos, sin listas de IDs).
+    # Cobrado y por cobrar solo se acotan si el empleado tiene préstamos como vendedor.
+    del_vendedor = None
     if empleado_id:
-        prestamos_ids = db.query(PrestamoVendedor.prestamo_id).filter(
-            PrestamoVendedor.empleado_id == empleado_id
-        ).distinct().all()
-        prestamo_ids_list = [p[0] for p in prestamos_ids]
-        if prestamo_ids_list:
-            prestamos_query = prestamos_query.filter(Prestamo.id.in_(prestamo_ids_list))
-        else:
-            prestamos_query = prestamos_query.filter(Prestamo.id == -1)  # No results
+        prestamos_query = prestamos_query.filter(Prestamo.id.in_(prestamos_del_vendedor(empleado_id)))
+        if vendedor_tiene_prestamos(db, empleado_id):
+            del_vendedor = prestamos_del_vendedor(empleado_id)
     
     prestamos_periodo = prestamos_query.all()
     
@@ -323,30 +352,15 @@ def get_period_metrics(db: Session, period_type: str, start_date: date, end_date
         Pago.fecha_pago >= start_date,
         Pago.fecha_pago <= end_date
     )
-    if empleado_id and prestamo_ids_list:
-        pagos_query = pagos_query.filter(Pago.prestamo_id.in_(prestamo_ids_list))
+    if del_vendedor is not None:
+        pagos_query = pagos_query.filter(Pago.prestamo_id.in_(del_vendedor))
     cobrado = pagos_query.scalar() or 0.0
 
     # Por cobrar (cuotas programadas pendientes en el rango)
-    prestamos_activos_query = db.query(Prestamo).filter(Prestamo.saldo_pendiente > 0)
-    if empleado_id and prestamo_ids_list:
-        prestamos_activos_query = prestamos_activos_query.filter(Prestamo.id.in_(prestamo_ids_list))
-    prestamos_activos = prestamos_activos_query.all()
-    por_cobrar = 0.0
-    try:
-        for prestamo in prestamos_activos:
-            try:
-                for cuota in generar_amortizacion(prestamo, db):
-                    from datetime import datetime as dt
-                    fecha_cuota = dt.fromisoformat(cuota['fecha']).date()
-                    if start_date <= fecha_cuota <= end_date and cuota['estado'] != 'Pagado':
-                        por_cobrar += cuota['monto']
-            except Exception as e:
-                print(f"Error procesando amortización para préstamo {prestamo.id}: {e}")
-                continue
-    except Exception as e:
-        print(f"Error en cálculo de por_cobrar: {e}")
-        por_cobrar = 0.0
+    por_cobrar_query = _cuotas_pendientes_en_rango(db, start_date, end_date)
+    if del_vendedor is not None:
+        por_cobrar_query = por_cobrar_query.filter(Prestamo.id.in_(del_vendedor))
+    por_cobrar = por_cobrar_query.with_entities(func.coalesce(func.sum(Cuota.monto), 0)).scalar() or 0.0
 
     # Comisiones pagadas en el período (filtradas por empleado si corresponde)
     comisiones_vendedor_query = db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).join(
@@ -398,59 +412,41 @@ def get_expectativas(db: Session, start_date: date, end_date: Optional[date] = N
     if end_date is None:
         end_date = start_date
 
-    prestamos_activos_query = db.query(Prestamo).filter(Prestamo.saldo_pendiente > 0)
+    cuotas_query = _cuotas_pendientes_en_rango(db, start_date, end_date)
     
-    # Filtrar por empleado si no es admin
+    # Filtrar por empleado si no es admin (semi-join con sus préstamos, sin listas de IDs)
     if empleado_id:
-        prestamos_ids = db.query(PrestamoVendedor.prestamo_id).filter(
-            PrestamoVendedor.empleado_id == empleado_id
-        ).distinct().all()
-        prestamo_ids_list = [p[0] for p in prestamos_ids]
-        if prestamo_ids_list:
-            prestamos_activos_query = prestamos_activos_query.filter(Prestamo.id.in_(prestamo_ids_list))
-        else:
-            prestamos_activos_query = prestamos_activos_query.filter(Prestamo.id == -1)  # No results
-    
-    prestamos_activos = prestamos_activos_query.all()
-    monto_esperado = 0.0
-    cantidad_cuotas = 0
+        cuotas_query = cuotas_query.filter(Prestamo.id.in_(prestamos_del_vendedor(empleado_id)))
+    
+    # Cuotas pendientes o vencidas del rango, agrupadas por préstamo
+    por_prestamo = cuotas_query.with_entities(
+        Prestamo.id,
+        Prestamo.cuotas_totales,
+        func.sum(Cuota.monto),
+        func.count(Cuota.id)
+    ).group_by(Prestamo.id, Prestamo.cuotas_totales).all()
+
+    monto_esperado = sum(float(monto or 0) for _, _, monto, _ in por_prestamo)
+    cantidad_cuotas = sum(cantidad for _, _, _, cantidad in por_prestamo)
     ganancias_esperadas = 0.0
 
-    try:
-        for prestamo in prestamos_activos:
-            try:
-                amortizacion = generar_amortizacion(prestamo, db)
-                # Si se solicita por empleado (vendedor), calcular su comisión esperada distribuida por cuota
-                per_cuota_comision = 0.0
-                if empleado_id:
-                    try:
-                        reg = db.query(PrestamoVendedor).filter(
-                            PrestamoVendedor.prestamo_id == prestamo.id,
-                            PrestamoVendedor.empleado_id == empleado_id
-                        ).first()
-                        if reg and (reg.monto_comision or 0) > 0:
-                            total_cuotas = prestamo.cuotas_totales or len(amortizacion) or 0
-                            if total_cuotas > 0:
-                                per_cuota_comision = float(reg.monto_comision) / float(total_cuotas)
-                    except Exception as e:
-                        print(f"Error obteniendo comisión vendedor para préstamo {prestamo.id}: {e}")
-                for cuota in amortizacion:
-                    from datetime import datetime as dt
-                    fecha_cuota = dt.fromisoformat(cuota['fecha']).date()
-                    if start_date <= fecha_cuota <= end_date:
-                        if cuota['estado'] != 'Pagado':  # Solo cuotas pendientes o vencidas
-                            monto_esperado += cuota['monto']
-                            cantidad_cuotas += 1
-                            if per_cuota_comision > 0:
-                                ganancias_esperadas += per_cuota_comision
-            except Exception as e:
-                print(f"Error procesando expectativas para préstamo {prestamo.id}: {e}")
+    # Si se solicita por empleado (vendedor), calcular su comisión esperada distribuida por cuota
+    if empleado_id and por_prestamo:
+        # Comisiones del vendedor por préstamo (ya acotadas a sus préstamos por el índice)
+        comisiones = dict(db.query(PrestamoVendedor.prestamo_id, PrestamoVendedor.monto_comision).filter(
+            PrestamoVendedor.empleado_id == empleado_id,
+            PrestamoVendedor.monto_comision > 0
+        ).all())
+        sin_total = [pid for pid, total, _, _ in por_prestamo if pid in comisiones and not total]
+        totales_materializados = dict(db.query(Cuota.prestamo_id, func.count(Cuota.id)).filter(
+            Cuota.prestamo_id.in_(sin_total)
+        ).group_by(Cuota.prestamo_id).all()) if sin_total else {}
+        for pid, total, _, cantidad in por_prestamo:
+            if pid not in comisiones:
                 continue
-    except Exception as e:
-        print(f"Error en get_expectativas: {e}")
-        monto_esperado = 0.0
-        cantidad_cuotas = 0
-        ganancias_esperadas = 0.0
+            total_cuotas = total or totales_materializados.get(pid, 0)
+            if total_cuotas > 0:
+                ganancias_esperadas += float(comisiones[pid]) / float(total_cuotas) * cantidad
 
     result = {
         'start_date': start_date.isoformat(),
@@ -464,6 +460,17 @@ def get_expectativas(db: Session, start_date: date, end_date: Optional[date] = N
     return result
 
 
+def _cuotas_pendientes_en_rango(db: Session, start_date: date, end_date: date):
+    """Cuotas no pagadas con vencimiento en [start_date, end_date] de préstamos con saldo."""
+    return db.query(Cuota).join(Prestamo, Cuota.prestamo_id == Prestamo.id).filter(
+        Cuota.fecha_vencimiento >= start_date,
+        Cuota.fecha_vencimiento <= end_date,
+        Cuota.estado != 'pagado',
+        PRESTAMO_CON_SALDO
+    )
+
+
+@cache_metricas
 def get_segment_metrics(db: Session, dimension: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
     """Agrupa préstamos por dimensión solicitada."""
     query = db.query(Prestamo)
@@ -553,6 +560,7 @@ def get_segment_metrics(db: Session, dimension: str, start_date: Optional[date]
     }
 
 
+@cache_metricas
 def get_top_clientes(db: Session, limit: int = 10) -> dict:
     """Obtiene los top clientes por diferentes métricas."""
     # Top por monto total prestado
@@ -575,15 +583,21 @@ def get_top_clientes(db: Session, limit: int = 10) -> dict:
         func.count(Prestamo.id).desc()
     ).limit(limit).all()
 
-    # Top por monto pendiente (clientes con más deuda)
+    # Top por monto pendiente (clientes con más deuda): se agrega sobre el índice parcial
+    # de préstamos con saldo y luego se unen solo esos clientes
+    deuda = db.query(
+        Prestamo.cliente_id.label('cliente_id'),
+        func.sum(Prestamo.saldo_pendiente).label('saldo_pendiente'),
+        func.count(Prestamo.id).label('prestamos_activos')
+    ).filter(PRESTAMO_CON_SALDO).group_by(Prestamo.cliente_id).subquery()
     top_deudores = db.query(
         Cliente.id,
         Cliente.nombre,
-        func.sum(Prestamo.saldo_pendiente).label('saldo_pendiente'),
-        func.count(Prestamo.id).label('prestamos_activos')
-    ).join(Prestamo).filter(Prestamo.saldo_pendiente > 0).group_by(
-        Cliente.id, Cliente.nombre
-    ).order_by(func.sum(Prestamo.saldo_pendiente).desc()).limit(limit).all()
+        deuda.c.saldo_pendiente,
+        deuda.c.prestamos_activos
+    ).join(deuda, deuda.c.cliente_id == Cliente.id).order_by(
+        deuda.c.saldo_pendiente.desc(), Cliente.id
+    ).limit(limit).all()
 
     return {
         'top_por_monto': [
@@ -613,22 +627,21 @@ def get_top_clientes(db: Session, limit: int = 10) -> dict:
     }
 
 
+@cache_metricas
 def get_rentabilidad(db: Session) -> dict:
     """Calcula métricas de rentabilidad del negocio."""
-    # Total prestado (capital)
-    capital_invertido = db.query(func.coalesce(func.sum(Prestamo.monto), 0)).scalar() or 0.0
-    
-    # Total recaudado
-    total_recaudado = db.query(func.coalesce(func.sum(Pago.monto), 0)).scalar() or 0.0
+    # Totales acumulados desde portfolio_stats (mantenidos en cada escritura)
+    stats = leer_portfolio_stats(db)
+    capital_invertido = float(stats['monto_total_prestado'])
+    total_recaudado = float(stats['monto_total_recaudado'])
     
     # Comisiones pagadas
-    comisiones_vendedor = db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).scalar() or 0.0
-    comisiones_cobrador = db.query(func.coalesce(func.sum(PagoCobrador.monto_comision), 0)).scalar() or 0.0
+    comisiones_vendedor = float(stats['comisiones_vendedor'])
+    comisiones_cobrador = float(stats['comisiones_cobrador'])
     total_comisiones = comisiones_vendedor + comisiones_cobrador
     
     # Capital en riesgo (prestado pero aún no cobrado completamente)
-    prestamos_activos = db.query(Prestamo).filter(Prestamo.saldo_pendiente > 0).all()
-    capital_en_riesgo = sum(float(p.monto) for p in prestamos_activos)  # type: ignore[arg-type]
+    capital_en_riesgo = float(stats['capital_en_riesgo'])
 
     # Capital recuperado = capital invertido que ya volvió
     capital_recuperado = capital_invertido - capital_en_riesgo
@@ -649,23 +662,11 @@ def get_rentabilidad(db: Session) -> dict:
     margen = (ganancias_netas / total_recaudado) if total_recaudado > 0 else 0.0
     
     # Saldo pendiente por cobrar
-    por_cobrar = db.query(func.coalesce(func.sum(Prestamo.saldo_pendiente), 0)).scalar() or 0.0
-    
-    # Nota: capital_en_riesgo ya calculado arriba
+    por_cobrar = float(stats['saldo_pendiente_total'])
     
-    # Calcular total esperado e intereses generados
-    todos_prestamos = db.query(Prestamo).all()
-    monto_total_esperado = 0.0
-    intereses_generados_total = 0.0
-    
-    for p in todos_prestamos:
-        capital = float(p.monto)
-        tasa = float(p.tasa_interes)
-        interes = capital * (tasa / 100.0)
-        total = capital + interes
-        
-        monto_total_esperado += total
-        intereses_generados_total += interes
+    # Total esperado e intereses generados
+    intereses_generados_total = float(stats['intereses_generados'])
+    monto_total_esperado = capital_invertido + intereses_generados_total
     
     # Nuevas métricas
     # 1. Tasa de Recuperación: cuánto del capital ya recuperaste
@@ -676,14 +677,14 @@ def get_rentabilidad(db: Session) -> dict:
     
     # 3. Clientes activos
     clientes_activos = db.query(func.count(func.distinct(Prestamo.cliente_id))).filter(
-        Prestamo.saldo_pendiente > 0
+        PRESTAMO_CON_SALDO
     ).scalar() or 0
     
     # 4. Costo de Adquisición (comisiones por cliente activo)
     costo_adquisicion = (total_comisiones / clientes_activos) if clientes_activos > 0 else 0.0
     
     # 5. Valor Promedio por Préstamo
-    total_prestamos = db.query(func.count(Prestamo.id)).scalar() or 0
+    total_prestamos = stats['total_prestamos']
     valor_promedio_prestamo = (capital_invertido / total_prestamos) if total_prestamos > 0 else 0.0
     
     # 6. Ratio Comisiones/Ganancias
@@ -696,21 +697,13 @@ def get_rentabilidad(db: Session) -> dict:
     intereses_pendientes = por_cobrar - capital_en_riesgo if por_cobrar > capital_en_riesgo else 0.0
     
     # 9. Tiempo Promedio de Recuperación (en días)
-    prestamos_pagados = db.query(Prestamo).filter(Prestamo.saldo_pendiente == 0).all()
-    if prestamos_pagados:
-        tiempos = []
-        for p in prestamos_pagados:
-            if p.fecha_inicio and p.fecha_vencimiento:
-                dias = (p.fecha_vencimiento - p.fecha_inicio).days
-                tiempos.append(dias)
-        tiempo_promedio = sum(tiempos) / len(tiempos) if tiempos else 0
-    else:
-        tiempo_promedio = 0
+    prestamos_pagados = stats['prestamos_pagados']
+    tiempo_promedio = (stats['dias_recuperacion'] / prestamos_pagados) if prestamos_pagados else 0
     
     # 10. Tasa de Morosidad
-    total_prestamos_count = db.query(func.count(Prestamo.id)).scalar() or 0
+    total_prestamos_count = total_prestamos
     prestamos_vencidos = db.query(func.count(Prestamo.id)).filter(
-        Prestamo.saldo_pendiente > 0,
+        PRESTAMO_CON_SALDO,
         Prestamo.fecha_vencimiento < date.today()
     ).scalar() or 0
     tasa_morosidad = (prestamos_vencidos / total_prestamos_count) if total_prestamos_count > 0 else 0.0
@@ -749,51 +742,87 @@ def get_rentabilidad(db: Session) -> dict:
     }
 
 
-def get_evolucion_temporal(db: Session, periodo_dias: int = 30) -> dict:
-    """Obtiene la evolución de métricas clave en los últimos N días."""
-    from datetime import timedelta
+def _inicio_bucket(fecha: date, granularity: str) -> date:
+    """Devuelve la fecha que identifica el bucket (día, lunes de la semana o primer día del mes)."""
+    if granularity == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    if granularity == 'mes':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def _como_fecha(valor) -> date:
+    # SQLite devuelve func.date() como texto; otros motores devuelven date
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def get_evolucion_temporal(db: Session, periodo_dias: int = 30, granularity: str = 'dia') -> dict:
+    """Obtiene la evolución de métricas clave en los últimos N días.
+
+    Una consulta agrupada por serie (préstamos y pagos); los días se agrupan por
+    semana o mes en Python y los buckets sin movimientos se completan con ceros.
+    """
     today = date.today()
     start = today - timedelta(days=periodo_dias - 1)
-    
-    # Generar lista de fechas
-    fechas = []
+
+    # Rango sargable sobre created_at (sin envolver la columna en el filtro)
+    desde_dt = datetime.combine(start, datetime.min.time())
+    hasta_dt = datetime.combine(today + timedelta(days=1), datetime.min.time())
+    dia_prestamo = func.date(Prestamo.created_at)
+    prestamos_por_dia = db.query(
+        dia_prestamo,
+        func.coalesce(func.sum(Prestamo.monto), 0),
+        func.count(Prestamo.id)
+    ).filter(
+        Prestamo.created_at >= desde_dt,
+        Prestamo.created_at < hasta_dt
+    ).group_by(dia_prestamo).all()
+
+    pagos_por_dia = db.query(
+        Pago.fecha_pago,
+        func.coalesce(func.sum(Pago.monto), 0),
+        func.count(Pago.id)
+    ).filter(
+        Pago.fecha_pago >= start,
+        Pago.fecha_pago <= today
+    ).group_by(Pago.fecha_pago).all()
+
+    # Buckets en orden, incluidos los vacíos
+    buckets = {}
     current = start
     while current <= today:
-        fechas.append(current)
+        clave = _inicio_bucket(current, granularity)
+        if clave not in buckets:
+            buckets[clave] = {'prestado': 0.0, 'cobrado': 0.0, 'num_prestamos': 0, 'num_pagos': 0}
         current += timedelta(days=1)
-    
-    # Datos por día
-    evolucion = []
-    for fecha in fechas:
-        # Préstamos creados ese día
-        prestado = db.query(func.coalesce(func.sum(Prestamo.monto), 0)).filter(
-            func.date(Prestamo.created_at) == fecha
-        ).scalar() or 0.0
-        
-        # Pagos recibidos ese día
-        cobrado = db.query(func.coalesce(func.sum(Pago.monto), 0)).filter(
-            Pago.fecha_pago == fecha
-        ).scalar() or 0.0
-        
-        # Cantidad de operaciones
-        num_prestamos = db.query(func.count(Prestamo.id)).filter(
-            func.date(Prestamo.created_at) == fecha
-        ).scalar() or 0
-        
-        num_pagos = db.query(func.count(Pago.id)).filter(
-            Pago.fecha_pago == fecha
-        ).scalar() or 0
-        
-        evolucion.append({
-            'fecha': fecha.isoformat(),
-            'prestado': round(prestado, 2),
-            'cobrado': round(cobrado, 2),
-            'num_prestamos': num_prestamos,
-            'num_pagos': num_pagos
-        })
-    
+
+    for dia, monto, cantidad in prestamos_por_dia:
+        bucket = buckets[_inicio_bucket(_como_fecha(dia), granularity)]
+        bucket['prestado'] += float(monto)
+        bucket['num_prestamos'] += cantidad
+    for dia, monto, cantidad in pagos_por_dia:
+        bucket = buckets[_inicio_bucket(_como_fecha(dia), granularity)]
+        bucket['cobrado'] += float(monto)
+        bucket['num_pagos'] += cantidad
+
+    evolucion = [
+        {
+            'fecha': clave.isoformat(),
+            'prestado': round(b['prestado'], 2),
+            'cobrado': round(b['cobrado'], 2),
+            'num_prestamos': b['num_prestamos'],
+            'num_pagos': b['num_pagos']
+        }
+        for clave, b in buckets.items()
+    ]
+
     return {
         'periodo_dias': periodo_dias,
+        'granularity': granularity,
         'start_date': start.isoformat(),
         'end_date': today.isoformat(),
         'evolucion': evolucion
@@ -0,0 +1,150 @@
+import os
+import time
+from functools import partial
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.models import SchemaVersion, MovimientoCaja, Usuario
+from app.caja_service import (backfill_caja_movimientos, backfill_caja_empleado_movimientos, backfill_referencias_movimientos,
+                              reconstruir_saldos_cierres)
+from app.amortization_service import backfill_cuotas
+from app.portfolio_stats_service import asegurar_portfolio_stats
+from app.backfill_service import progreso_log
+
+
+# === MIGRACIONES DE DATOS VERSIONADAS ===
+# Los backfills que antes corrían en cada arranque (y en cada worker) se aplican una sola vez
+# y quedan registrados en schema_version. Con todo aplicado, el arranque solo lee esa tabla:
+# el costo ya no crece con el historial. Cada migración es idempotente (se puede repetir sin
+# duplicar datos) y se agrega al final de la lista con la versión siguiente; nunca se
+# renumeran ni se quitan las ya publicadas.
+#
+# Con varios workers, el primero que inserta la fila de la versión (estado en_curso) la
+# ejecuta y los demás la saltean. Una fila en_curso más vieja que MIGRACION_RECLAMO_VENCIDO_SEG
+# se considera abandonada (proceso caído a mitad) y se vuelve a reclamar.
+MIGRACIONES_AL_INICIAR = os.getenv("MIGRACIONES_AL_INICIAR", "true").lower() in ("1", "true", "si", "yes")
+MIGRACION_RECLAMO_VENCIDO_SEG = float(os.getenv("MIGRACION_RECLAMO_VENCIDO_SEG", "1800"))
+
+
+def _retirada(db: Session) -> str:
+    """Migración que ya no hace nada: se conserva la versión para no renumerar las siguientes."""
+    return "retirada"
+
+
+def _asegurar_columnas(db: Session, modelo, columnas: list) -> list:
+    """Agrega a una tabla existente las columnas nuevas del modelo y crea sus índices
+    (create_all solo crea tablas que faltan). Devuelve las columnas agregadas."""
+    conexion = db.connection()
+    tabla = modelo.__table__
+    existentes = {c["name"] for c in inspect(conexion).get_columns(tabla.name)}
+    agregadas = [c for c in columnas if c not in existentes]
+    ddl = conexion.dialect.ddl_compiler(conexion.dialect, None)
+    for nombre in agregadas:
+        columna = tabla.c[nombre]
+        definicion = f"{nombre} {columna.type.compile(dialect=conexion.dialect)}"
+        # Una columna NOT NULL solo se puede agregar con su server_default (rellena las filas existentes)
+        defecto = ddl.get_column_default_string(columna)
+        if defecto is not None:
+            definicion += f" DEFAULT {defecto}" + ("" if columna.nullable else " NOT NULL")
+        conexion.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {definicion}"))
+    for indice in tabla.indexes:
+        if any(c.name in columnas for c in indice.columns):
+            indice.create(conexion, checkfirst=True)
+    db.commit()
+    return agregadas
+
+
+def referencias_movimientos(db: Session, progreso=None) -> str:
+    agregadas = _asegurar_columnas(db, MovimientoCaja, ["prestamo_id", "cliente_id", "cuota_numero"])
+    completados = backfill_referencias_movimientos(db, progreso=progreso)
+    return f"columnas agregadas: {len(agregadas)}, movimientos referenciados: {completados}"
+
+
+def token_version_usuarios(db: Session) -> str:
+    agregadas = _asegurar_columnas(db, Usuario, ["token_version"])
+    return f"columnas agregadas: {len(agregadas)}"
+
+
+MIGRACIONES = [
+    (1, "backfill_caja_movimientos",
+     partial(backfill_caja_movimientos, progreso=progreso_log("caja_movimientos"))),
+    # Reemplazada por las referencias estructuradas de la v6 (la descripción se arma al leer)
+    (2, "normalizar_descripciones_movimientos", _retirada),
+    (3, "backfill_caja_empleado_movimientos",
+     partial(backfill_caja_empleado_movimientos, progreso=progreso_log("caja_empleado_movimientos"))),
+    (4, "backfill_cuotas", backfill_cuotas),
+    (5, "asegurar_portfolio_stats", asegurar_portfolio_stats),
+    (6, "referencias_movimientos",
+     partial(referencias_movimientos, progreso=progreso_log("referencias_movimientos"))),
+    (7, "reconstruir_saldos_cierres", reconstruir_saldos_cierres),
+    # Bases anteriores a los claims del token: sin la columna falla toda consulta de Usuario
+    (8, "token_version_usuarios", token_version_usuarios),
+]
+
+
+def versiones_aplicadas(db: Session) -> set:
+    return {v for (v,) in db.query(SchemaVersion.version).filter(SchemaVersion.estado == "aplicada")}
+
+
+def migraciones_pendientes(db: Session) -> list:
+    aplicadas = versiones_aplicadas(db)
+    return [(v, nombre, fn) for v, nombre, fn in MIGRACIONES if v not in aplicadas]
+
+
+def _reclamar(db: Session, version: int, nombre: str) -> bool:
+    """Inserta la fila en_curso de la versión. False si otro proceso la tiene (o ya la aplicó)."""
+    ahora = datetime.utcnow()
+    try:
+        db.add(SchemaVersion(version=version, nombre=nombre, estado="en_curso", iniciada_at=ahora))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+    vencida = ahora - timedelta(seconds=MIGRACION_RECLAMO_VENCIDO_SEG)
+    # Retomar un reclamo abandonado: el UPDATE condicional lo gana un solo proceso
+    tomadas = db.query(SchemaVersion).filter(
+        SchemaVersion.version == version,
+        SchemaVersion.estado == "en_curso",
+        SchemaVersion.iniciada_at < vencida,
+    ).update({SchemaVersion.iniciada_at: ahora}, synchronize_session=False)
+    db.commit()
+    return tomadas == 1
+
+
+def aplicar_migraciones(db_factory, log=print) -> list:
+    """Aplica en orden las migraciones pendientes. Devuelve [(version, nombre, resultado)].
+
+    Las siguientes pueden depender de las anteriores, así que se detiene en la primera que
+    falla (se borra su reclamo) o que está en curso en otro proceso (ese proceso sigue con el
+    resto en orden); lo que quede se aplica en el próximo arranque o con migrate_pendientes.py.
+    """
+    aplicadas = []
+    db: Session = db_factory()
+    try:
+        for version, nombre, fn in migraciones_pendientes(db):
+            if not _reclamar(db, version, nombre):
+                log(f"[Migraciones] v{version} {nombre}: en curso en otro proceso, se detiene")
+                break
+            inicio = time.perf_counter()
+            try:
+                resultado = fn(db)
+            except Exception as e:
+                db.rollback()
+                db.query(SchemaVersion).filter(SchemaVersion.version == version).delete()
+                db.commit()
+                log(f"[Migraciones] ✗ v{version} {nombre}: {e}")
+                break
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            db.query(SchemaVersion).filter(SchemaVersion.version == version).update({
+                SchemaVersion.estado: "aplicada",
+                SchemaVersion.resultado: str(resultado)[:200],
+                SchemaVersion.duracion_ms: round(duracion_ms, 1),
+                SchemaVersion.aplicada_at: datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+            log(f"[Migraciones] ✓ v{version} {nombre}: {resultado} ({duracion_ms:.0f} ms)")
+            aplicadas.append((version, nombre, resultado))
+    finally:
+        db.close()
+    return aplicadas
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, DateTime, Index, literal_column, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.database import Base
@@ -16,6 +16,7 @@ class Usuario(Base):
     email = Column(String(100))
     role = Column(String(20), default="admin")  # admin | vendedor | cobrador
     empleado_id = Column(Integer, ForeignKey("empleados.id"), nullable=True)
+    token_version = Column(Integer, default=0, nullable=False, server_default="0")  # claim "ver": subirla revoca los tokens emitidos antes
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -35,15 +36,29 @@ class Cliente(Base):
     prestamos = relationship("Prestamo", back_populates="cliente")
 
 
+# Predicado de los índices parciales de cartera con saldo (SQLite/PostgreSQL; en MySQL
+# el índice se crea completo)
+_CON_SALDO = text("saldo_pendiente > 0")
+
+
 class Prestamo(Base):
     __tablename__ = "prestamos"
+    __table_args__ = (
+        # Vencidos: saldo > 0 y fecha_vencimiento < hoy
+        Index("ix_prestamos_con_saldo_vencimiento", "fecha_vencimiento",
+              sqlite_where=_CON_SALDO, postgresql_where=_CON_SALDO),
+        # Clientes activos / top deudores
+        Index("ix_prestamos_con_saldo_cliente", "cliente_id", "saldo_pendiente",
+              sqlite_where=_CON_SALDO, postgresql_where=_CON_SALDO),
+        Index("ix_prestamos_estado_vencimiento", "estado", "fecha_vencimiento"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False, index=True)
     monto = Column(Float, nullable=False)
     tasa_interes = Column(Float, nullable=False)  # Porcentaje
     plazo_dias = Column(Integer, nullable=False)
-    fecha_inicio = Column(Date, nullable=False)
+    fecha_inicio = Column(Date, nullable=False, index=True)
     fecha_vencimiento = Column(Date, nullable=False)
     monto_total = Column(Float, nullable=False)  # Monto + interés
     saldo_pendiente = Column(Float, nullable=False)
@@ -54,20 +69,32 @@ class Prestamo(Base):
     cuotas_pagadas = Column(Integer, default=0)
     valor_cuota = Column(Float, default=0.0)
     saldo_cuota = Column(Float, default=0.0)  # + debe más, - tiene a favor
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     # Relaciones
     cliente = relationship("Cliente", back_populates="prestamos")
     pagos = relationship("Pago", back_populates="prestamo")
+    cuotas = relationship("Cuota", back_populates="prestamo", order_by="Cuota.numero")
+    # Solo lectura (detalle con carga anticipada); las escrituras usan las tablas directamente
+    vendedores = relationship("PrestamoVendedor", viewonly=True, order_by="PrestamoVendedor.id")
+
+
+# Usar en los filtros "con saldo" para que SQLite pueda elegir los índices parciales:
+# compara contra un literal, no contra un parámetro enlazado.
+PRESTAMO_CON_SALDO = Prestamo.saldo_pendiente > literal_column("0")
 
 
 class Pago(Base):
     __tablename__ = "pagos"
+    __table_args__ = (
+        # Pagos de un préstamo (también cubre prestamo_id solo) y por préstamo en un rango de fechas
+        Index("ix_pagos_prestamo_fecha", "prestamo_id", "fecha_pago"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     prestamo_id = Column(Integer, ForeignKey("prestamos.id"), nullable=False)
     monto = Column(Float, nullable=False)
-    fecha_pago = Column(Date, nullable=False)
+    fecha_pago = Column(Date, nullable=False, index=True)
     metodo_pago = Column(String(50))  # efectivo, transferencia, etc.
     notas = Column(String(200))
     tipo_pago = Column(String(20), default="parcial")  # cuota, parcial, total
@@ -75,6 +102,45 @@ class Pago(Base):
     
     # Relación
     prestamo = relationship("Prestamo", back_populates="pagos")
+    comisiones_cobrador = relationship("PagoCobrador", viewonly=True, order_by="PagoCobrador.id")
+    comisiones_vendedor = relationship("PagoVendedor", viewonly=True, order_by="PagoVendedor.id")
+
+
+# === CUOTAS (cronograma materializado) ===
+class Cuota(Base):
+    __tablename__ = "cuotas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prestamo_id = Column(Integer, ForeignKey("prestamos.id"), nullable=False, index=True)
+    numero = Column(Integer, nullable=False)
+    fecha_vencimiento = Column(Date, nullable=False, index=True)
+    monto = Column(Float, nullable=False)
+    estado = Column(String(20), default="pendiente")  # pendiente | pagado (vencido se deriva al leer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relación
+    prestamo = relationship("Prestamo", back_populates="cuotas")
+
+
+# === CONTADORES DE CARTERA (mantenidos incrementalmente) ===
+class PortfolioStats(Base):
+    __tablename__ = "portfolio_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empleado_id = Column(Integer, ForeignKey("empleados.id"), nullable=True, unique=True)  # NULL = global
+    total_prestamos = Column(Integer, default=0)
+    monto_total_prestado = Column(Float, default=0.0)
+    intereses_generados = Column(Float, default=0.0)
+    saldo_pendiente_total = Column(Float, default=0.0)
+    prestamos_activos = Column(Integer, default=0)  # saldo > 0 y estado activo
+    capital_en_riesgo = Column(Float, default=0.0)  # capital de préstamos con saldo > 0
+    prestamos_pagados = Column(Integer, default=0)  # saldo == 0
+    dias_recuperacion = Column(Integer, default=0)  # suma de plazos de préstamos pagados
+    total_pagos = Column(Integer, default=0)
+    monto_total_recaudado = Column(Float, default=0.0)
+    comisiones_vendedor = Column(Float, default=0.0)  # global: todas; empleado: las propias
+    comisiones_cobrador = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 
 # === EMPLEADOS ===
@@ -94,9 +160,12 @@ class Empleado(Base):
 
 class PagoCobrador(Base):
     __tablename__ = "pagos_cobradores"
+    __table_args__ = (
+        Index("ix_pagos_cobradores_empleado_created", "empleado_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    pago_id = Column(Integer, ForeignKey("pagos.id"), nullable=False)
+    pago_id = Column(Integer, ForeignKey("pagos.id"), nullable=False, index=True)
     empleado_id = Column(Integer, ForeignKey("empleados.id"), nullable=True)
     empleado_nombre = Column(String(100))  # seguridad por si se elimina el empleado
     porcentaje = Column(Float, nullable=False)  # % del pago (no del préstamo)
@@ -106,9 +175,12 @@ class PagoCobrador(Base):
 
 class PagoVendedor(Base):
     __tablename__ = "pagos_vendedores"
+    __table_args__ = (
+        Index("ix_pagos_vendedores_empleado_created", "empleado_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    pago_id = Column(Integer, ForeignKey("pagos.id"), nullable=False)
+    pago_id = Column(Integer, ForeignKey("pagos.id"), nullable=False, index=True)
     empleado_id = Column(Integer, ForeignKey("empleados.id"), nullable=True)
     empleado_nombre = Column(String(100))  # seguridad por si se elimina el empleado
     porcentaje = Column(Float, nullable=False)  # % del pago según préstamo
@@ -119,9 +191,13 @@ class PagoVendedor(Base):
 # === COMISION VENDEDOR POR PRÉSTAMO ===
 class PrestamoVendedor(Base):
     __tablename__ = "prestamos_vendedores"
+    __table_args__ = (
+        # Filtro por vendedor (EXISTS / IN sobre prestamo_id) sin tocar la tabla
+        Index("ix_prestamos_vendedores_empleado_prestamo", "empleado_id", "prestamo_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    prestamo_id = Column(Integer, ForeignKey("prestamos.id"), nullable=False)
+    prestamo_id = Column(Integer, ForeignKey("prestamos.id"), nullable=False, index=True)
     empleado_id = Column(Integer, ForeignKey("empleados.id"), nullable=True)
     empleado_nombre = Column(String(100))  # respaldo del nombre
     porcentaje = Column(Float, nullable=False)  # % sobre base
@@ -130,19 +206,32 @@ class PrestamoVendedor(Base):
     monto_comision = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Relación (solo lectura)
+    empleado = relationship("Empleado", viewonly=True)
+
 
 # === MOVIMIENTOS DE CAJA ===
 class MovimientoCaja(Base):
     __tablename__ = "caja_movimientos"
+    __table_args__ = (
+        Index("ix_caja_movimientos_referencia", "referencia_tipo", "referencia_id"),
+        Index("ix_caja_movimientos_prestamo_fecha", "prestamo_id", "fecha"),
+        Index("ix_caja_movimientos_cliente_fecha", "cliente_id", "fecha"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    fecha = Column(Date, nullable=False)
+    fecha = Column(Date, nullable=False, index=True)
     tipo = Column(String(20), nullable=False)  # ingreso | egreso
     categoria = Column(String(50), nullable=True)  # desembolso_prestamo, pago_cuota, ajuste, gastos_operativos, ingreso_extra
     descripcion = Column(String(200), nullable=True)
     monto = Column(Float, nullable=False)
     referencia_tipo = Column(String(30), nullable=True)  # prestamo | pago | manual
     referencia_id = Column(Integer, nullable=True)
+    # Referencias estructuradas de los movimientos automáticos (desembolsos, cuotas, comisiones).
+    # Con descripcion vacía, el texto se arma al leer (describir_movimientos) con el nombre actual
+    prestamo_id = Column(Integer, ForeignKey("prestamos.id"), nullable=True)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=True)
+    cuota_numero = Column(Integer, nullable=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -168,6 +257,10 @@ class CajaCierre(Base):
 # === CAJA EMPLEADO (rendición) ===
 class CajaEmpleadoMovimiento(Base):
     __tablename__ = "caja_empleado_movimientos"
+    __table_args__ = (
+        Index("ix_caja_empleado_mov_empleado_fecha", "empleado_id", "fecha"),
+        Index("ix_caja_empleado_mov_referencia", "referencia_tipo", "referencia_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     fecha = Column(Date, nullable=False)
@@ -198,3 +291,29 @@ class CajaEmpleadoCierre(Base):
     cerrado = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+
+
+# === VERSIONES DE ESQUEMA / MIGRACIONES DE DATOS ===
+class SchemaVersion(Base):
+    """Una fila por migración de datos (app/migraciones_service.py) reclamada o aplicada."""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    nombre = Column(String(100), nullable=False)
+    estado = Column(String(20), nullable=False, default="en_curso")  # en_curso | aplicada
+    resultado = Column(String(200), nullable=True)
+    duracion_ms = Column(Float, nullable=True)
+    iniciada_at = Column(DateTime, default=datetime.utcnow)
+    aplicada_at = Column(DateTime, nullable=True)
+
+
+class BackfillCheckpoint(Base):
+    """Avance de un backfill por lotes (app/backfill_service.py); se borra al terminar."""
+    __tablename__ = "backfill_checkpoints"
+
+    nombre = Column(String(100), primary_key=True)
+    fase = Column(Integer, nullable=False, default=0)  # índice de la fase en curso
+    ultimo_id = Column(Integer, nullable=False, default=0)  # último id de origen ya procesado
+    topes = Column(String(200), nullable=False)  # id máximo de cada fase al iniciar ("530,1234")
+    procesados = Column(Integer, nullable=False, default=0)  # filas insertadas hasta ahora
+    actualizado_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,87 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import and_, or_, func, select, Date, DateTime
+from sqlalchemy.orm import Query
+
+
+# === PAGINACIÓN POR KEYSET ===
+# Las listas se ordenan por una clave única y estable ((id) o (fecha, id)) y cada página
+# continúa desde la última fila de la anterior (WHERE clave > cursor), así el costo no
+# crece con la profundidad como con OFFSET. El cursor es opaco para el cliente.
+LIMITE_MAXIMO = 1000
+TOPE_TOTAL_APROX = 10000  # el total aproximado cuenta hasta acá y luego informa "10000+"
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(valores: tuple) -> str:
+    crudo = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in valores])
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, columnas: tuple) -> list:
+    """Valores de la clave guardados en el cursor, convertidos al tipo de cada columna."""
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(crudo)
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise CursorInvalido("Cursor inválido")
+        convertidos = []
+        for columna, valor in zip(columnas, valores):
+            if isinstance(columna.type, DateTime):
+                valor = datetime.fromisoformat(valor)
+            elif isinstance(columna.type, Date):
+                valor = date.fromisoformat(valor)
+            convertidos.append(valor)
+        return convertidos
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido("Cursor inválido") from e
+
+
+def _despues_de(columnas: tuple, valores: list):
+    """(a, b) > (x, y) expandido como a > x OR (a = x AND b > y): usa el índice en todo motor."""
+    condiciones = []
+    for i, columna in enumerate(columnas):
+        iguales = [columnas[j] == valores[j] for j in range(i)]
+        condiciones.append(and_(*iguales, columna > valores[i]))
+    return or_(*condiciones)
+
+
+def total_aproximado(q: Query, tope: int = TOPE_TOTAL_APROX) -> str:
+    """Conteo de la consulta filtrada acotado a `tope` filas: exacto si hay menos, "tope+" si no."""
+    sub = q.order_by(None).with_entities(q.column_descriptions[0]["entity"].id).limit(tope + 1).subquery()
+    n = q.session.execute(select(func.count()).select_from(sub)).scalar() or 0
+    return f"{tope}+" if n > tope else str(n)
+
+
+def paginar(q: Query, columnas: tuple, limit: int, cursor: Optional[str] = None, skip: int = 0,
+            con_total: bool = False) -> tuple:
+    """Página de `q` ordenada por `columnas` (la última debe ser única, p. ej. id).
+
+    Con cursor se continúa desde la clave que codifica (skip se ignora); sin cursor se
+    respeta skip para los clientes que todavía paginan por offset. Devuelve
+    (filas, siguiente_cursor o None, total aproximado o None).
+    """
+    total = total_aproximado(q) if con_total else None
+    q = q.order_by(*columnas)
+    if cursor:
+        q = q.filter(_despues_de(columnas, decodificar_cursor(cursor, columnas)))
+    elif skip:
+        q = q.offset(skip)
+    filas = q.limit(limit).all()
+    siguiente = None
+    if len(filas) == limit:
+        ultima = filas[-1]
+        siguiente = codificar_cursor(tuple(getattr(ultima, c.key) for c in columnas))
+    return filas, siguiente, total
+
+
+def aplicar_encabezados(response, siguiente: Optional[str], total: Optional[str]) -> None:
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
+    if total is not None:
+        response.headers["X-Total-Aprox"] = total
@@ -0,0 +1,180 @@
+from typing import Optional
+from app.models.models import Pago, Prestamo, PagoCobrador, PagoVendedor, PrestamoVendedor, Empleado, MovimientoCaja, CajaEmpleadoMovimiento
+
+
+def aplicar_pago_en_cuotas(prestamo: Prestamo, monto: float, tipo_pago: str) -> None:
+    """Aplica un pago al préstamo en memoria: avanza cuotas, descuenta saldo y actualiza el estado."""
+    # === LÓGICA DE CUOTAS ===
+    # Calcular cuánto debe en la cuota actual (valor_cuota + saldo_cuota)
+    monto_cuota_actual = prestamo.valor_cuota + prestamo.saldo_cuota
+
+    # Aplicar el pago
+    diferencia = monto_cuota_actual - monto
+
+    # Manejo según tipo de pago
+    if tipo_pago == "total":
+        # Pago total: intenta pagar todo el saldo pendiente
+        monto_restante = monto
+
+        while monto_restante > 0 and prestamo.cuotas_pagadas < prestamo.cuotas_totales:
+            monto_cuota = prestamo.valor_cuota + prestamo.saldo_cuota
+
+            if monto_restante >= monto_cuota:
+                # Paga la cuota completa
+                monto_restante -= monto_cuota
+                prestamo.cuotas_pagadas += 1
+                prestamo.saldo_cuota = 0.0
+            else:
+                # No alcanza para la cuota completa
+                prestamo.saldo_cuota = monto_cuota - monto_restante
+                monto_restante = 0
+                break
+
+        # Si queda dinero sobrante en la última cuota
+        if monto_restante > 0:
+            prestamo.saldo_cuota = -monto_restante
+
+    else:
+        # Pago de cuota o parcial: misma lógica
+        # Avanzar a siguiente cuota SIEMPRE
+        prestamo.cuotas_pagadas += 1
+        prestamo.saldo_cuota = diferencia
+
+    # Actualizar saldo pendiente del préstamo
+    prestamo.saldo_pendiente -= monto
+
+    # Estados finales según cuotas y saldo
+    if prestamo.cuotas_pagadas >= prestamo.cuotas_totales:
+        prestamo.cuotas_pagadas = prestamo.cuotas_totales
+        if prestamo.saldo_pendiente <= 0:
+            prestamo.estado = "pagado"
+            prestamo.saldo_pendiente = max(0, prestamo.saldo_pendiente)
+            prestamo.saldo_cuota = 0.0
+        else:
+            # Terminó las cuotas pero quedó deuda: marcar como impago
+            prestamo.estado = "impago"
+            # El saldo_pendiente queda como deuda final
+    elif prestamo.saldo_pendiente <= 0:
+        # Saldo cubierto antes de agotar cuotas
+        prestamo.estado = "pagado"
+        prestamo.saldo_pendiente = 0.0
+        prestamo.saldo_cuota = 0.0
+
+
+def registros_de_pago(
+    db_pago: Pago,
+    num_cuota: int,
+    cliente_id: Optional[int],
+    cobrador_id: Optional[int],
+    cobrador_nombre: Optional[str],
+    cobrador: Optional[Empleado],
+    porcentaje_cobrador: Optional[float],
+    es_admin: bool,
+    prestamo_vendedor: Optional[PrestamoVendedor],
+):
+    """Arma los registros derivados de un pago ya aplicado (con id asignado): movimientos de caja,
+    movimientos del empleado y comisiones. `num_cuota` es cuotas_pagadas del préstamo justo
+    después de aplicar este pago. No los agrega a la sesión.
+
+    Devuelve (registros, comisiones) con comisiones como tuplas (tipo, empleado_id, monto).
+    """
+    registros = []
+    comisiones = []
+
+    # Movimiento de caja automático (ingreso por pago). La descripción se arma al listar
+    registros.append(MovimientoCaja(
+        fecha=db_pago.fecha_pago,
+        tipo="ingreso",
+        categoria="pago",
+        monto=db_pago.monto,
+        referencia_tipo="pago",
+        referencia_id=db_pago.id,
+        prestamo_id=db_pago.prestamo_id,
+        cliente_id=cliente_id,
+        cuota_numero=num_cuota,
+        usuario_id=None  # TODO: obtener del token
+    ))
+
+    if cobrador_id:
+        # Movimiento empleado (ingreso por pago). El pago es nuevo, así que no
+        # puede tener movimientos de empleado previos.
+        registros.append(CajaEmpleadoMovimiento(
+            fecha=db_pago.fecha_pago,
+            empleado_id=cobrador_id,
+            tipo='ingreso',
+            categoria='pago',
+            descripcion=f"Pago #{db_pago.id} préstamo {db_pago.prestamo_id}",
+            monto=db_pago.monto,
+            referencia_tipo='pago',
+            referencia_id=db_pago.id
+        ))
+
+        # Comisión del cobrador (admin asigna inmediata) o placeholder (cobrador pendiente)
+        empleado_nombre_final = cobrador.nombre if cobrador else (cobrador_nombre or 'Cobrador')
+        if porcentaje_cobrador is not None and es_admin:
+            porcentaje = float(porcentaje_cobrador)
+            monto_comision = round(float(db_pago.monto) * porcentaje / 100.0, 2)
+        else:
+            # pendiente aprobación
+            porcentaje = 0.0
+            monto_comision = 0.0
+        registros.append(PagoCobrador(
+            pago_id=db_pago.id,
+            empleado_id=cobrador_id,
+            empleado_nombre=empleado_nombre_final,
+            porcentaje=porcentaje,
+            monto_comision=monto_comision
+        ))
+        comisiones.append(('cobrador', cobrador_id, monto_comision))
+        if monto_comision > 0:
+            registros.append(MovimientoCaja(
+                fecha=db_pago.fecha_pago,
+                tipo="egreso",
+                categoria="comision",
+                descripcion=f"Comisión cobrador pago #{db_pago.id} préstamo {db_pago.prestamo_id}",
+                monto=monto_comision,
+                referencia_tipo="pago",
+                referencia_id=db_pago.id,
+                prestamo_id=db_pago.prestamo_id,
+                cliente_id=cliente_id,
+                usuario_id=None
+            ))
+            registros.append(CajaEmpleadoMovimiento(
+                fecha=db_pago.fecha_pago,
+                empleado_id=cobrador_id,
+                tipo='egreso',
+                categoria='comision',
+                descripcion=f"Comisión cobrador pago #{db_pago.id}",
+                monto=monto_comision,
+                referencia_tipo='pago',
+                referencia_id=db_pago.id
+            ))
+
+    # Comisión del vendedor si existe en el préstamo
+    if prestamo_vendedor and prestamo_vendedor.porcentaje > 0:
+        # Calcular comisión del vendedor sobre el monto del pago
+        porcentaje_vendedor = float(prestamo_vendedor.porcentaje)
+        monto_comision_vendedor = round(float(db_pago.monto) * porcentaje_vendedor / 100.0, 2)
+        registros.append(PagoVendedor(
+            pago_id=db_pago.id,
+            empleado_id=prestamo_vendedor.empleado_id,
+            empleado_nombre=prestamo_vendedor.empleado_nombre,
+            porcentaje=porcentaje_vendedor,
+            monto_comision=monto_comision_vendedor
+        ))
+        comisiones.append(('vendedor', prestamo_vendedor.empleado_id, monto_comision_vendedor))
+        # Movimiento de caja como egreso por comisión de vendedor
+        registros.append(MovimientoCaja(
+            fecha=db_pago.fecha_pago,
+            tipo="egreso",
+            categoria="comision",
+            descripcion=f"Comisión vendedor pago #{db_pago.id} préstamo {db_pago.prestamo_id}",
+            monto=monto_comision_vendedor,
+            referencia_tipo="pago",
+            referencia_id=db_pago.id,
+            prestamo_id=db_pago.prestamo_id,
+            cliente_id=cliente_id,
+            usuario_id=None
+        ))
+
+    return registros, comisiones
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+
+# === POOL DE HASHING DE CONTRASEÑAS ===
+# bcrypt es CPU puro (~250 ms con costo 12) y libera el GIL, así que un pool de hilos propio
+# alcanza para sacarlo del threadpool de requests. El pool es chico (no más hilos que
+# núcleos) y la cola está acotada: en un pico de logins los excedentes reciben 503 en lugar
+# de acaparar la CPU que necesitan el resto de los endpoints.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_MAX = int(os.getenv("PASSWORD_QUEUE_MAX", "64"))  # en cola + en proceso
+
+
+class PoolPasswordSaturado(Exception):
+    """Hay PASSWORD_QUEUE_MAX operaciones pendientes; reintentar más tarde."""
+
+
+_pool_lock = threading.Lock()
+_pool: "ThreadPoolExecutor | None" = None
+_stats = {'completadas': 0, 'rechazadas': 0, 'rehashes': 0, 'en_cola': 0, 'en_proceso': 0, 'max_pendientes': 0}
+_esperas_ms: deque = deque(maxlen=2000)
+_duraciones_ms: deque = deque(maxlen=2000)
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+        return _pool
+
+
+def _hashpw(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _checkpw(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def _encolar(fn, *args):
+    """Envía la operación al pool registrando espera en cola y duración."""
+    encolado = time.perf_counter()
+
+    def tarea():
+        inicio = time.perf_counter()
+        with _pool_lock:
+            _stats['en_cola'] -= 1
+            _stats['en_proceso'] += 1
+            _esperas_ms.append((inicio - encolado) * 1000)
+        try:
+            return fn(*args)
+        finally:
+            with _pool_lock:
+                _stats['en_proceso'] -= 1
+                _stats['completadas'] += 1
+                _duraciones_ms.append((time.perf_counter() - inicio) * 1000)
+
+    executor = _executor()
+    with _pool_lock:
+        pendientes = _stats['en_cola'] + _stats['en_proceso']
+        if pendientes >= PASSWORD_QUEUE_MAX:
+            _stats['rechazadas'] += 1
+            raise PoolPasswordSaturado()
+        _stats['en_cola'] += 1
+        _stats['max_pendientes'] = max(_stats['max_pendientes'], pendientes + 1)
+    return executor.submit(tarea)
+
+
+async def verificar_password(password: str, hashed: str) -> bool:
+    return await asyncio.wrap_future(_encolar(_checkpw, password, hashed))
+
+
+async def hashear_password(password: str) -> str:
+    return await asyncio.wrap_future(_encolar(_hashpw, password))
+
+
+def verificar_password_sync(password: str, hashed: str) -> bool:
+    """Para handlers síncronos y scripts: bloquea el hilo actual hasta que el pool responda."""
+    return _encolar(_checkpw, password, hashed).result()
+
+
+def hashear_password_sync(password: str) -> str:
+    return _encolar(_hashpw, password).result()
+
+
+def costo_hash(hashed: str) -> int:
+    """Factor de costo de un hash bcrypt ($2b$12$... -> 12)."""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def necesita_rehash(hashed: str) -> bool:
+    """True si el hash se generó con un costo distinto de BCRYPT_ROUNDS."""
+    return costo_hash(hashed) != BCRYPT_ROUNDS
+
+
+def registrar_rehash() -> None:
+    with _pool_lock:
+        _stats['rehashes'] += 1
+
+
+def _percentil(valores, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))], 1)
+
+
+def get_password_pool_stats() -> dict:
+    with _pool_lock:
+        esperas, duraciones = list(_esperas_ms), list(_duraciones_ms)
+        return {
+            **_stats,
+            'workers': PASSWORD_WORKERS,
+            'max_cola': PASSWORD_QUEUE_MAX,
+            'bcrypt_rounds': BCRYPT_ROUNDS,
+            'espera_p50_ms': _percentil(esperas, 0.5),
+            'espera_p99_ms': _percentil(esperas, 0.99),
+            'duracion_p50_ms': _percentil(duraciones, 0.5),
+        }
+
+
+def cerrar_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
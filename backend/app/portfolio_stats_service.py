@@ -0,0 +1,250 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, select
+from app.models.models import Prestamo, Pago, PagoVendedor, PagoCobrador, PrestamoVendedor, PortfolioStats
+
+
+CAMPOS_CONTADORES = (
+    'total_prestamos', 'monto_total_prestado', 'intereses_generados', 'saldo_pendiente_total',
+    'prestamos_activos', 'capital_en_riesgo', 'prestamos_pagados', 'dias_recuperacion',
+    'total_pagos', 'monto_total_recaudado', 'comisiones_vendedor', 'comisiones_cobrador',
+)
+CAMPOS_ENTEROS = {'total_prestamos', 'prestamos_activos', 'prestamos_pagados', 'dias_recuperacion', 'total_pagos'}
+TOLERANCIA_DRIFT = 0.005
+
+
+def _vacio() -> dict:
+    return {c: (0 if c in CAMPOS_ENTEROS else 0.0) for c in CAMPOS_CONTADORES}
+
+
+def _valores_prestamo(prestamo: Prestamo) -> dict:
+    monto = float(prestamo.monto or 0)
+    saldo = float(prestamo.saldo_pendiente or 0)
+    pagado = saldo == 0
+    dias = 0
+    if pagado and prestamo.fecha_inicio and prestamo.fecha_vencimiento:
+        dias = (prestamo.fecha_vencimiento - prestamo.fecha_inicio).days
+    return {
+        'total_prestamos': 1,
+        'monto_total_prestado': monto,
+        'intereses_generados': monto * float(prestamo.tasa_interes or 0) / 100.0,
+        'saldo_pendiente_total': saldo,
+        'prestamos_activos': 1 if saldo > 0 and prestamo.estado == 'activo' else 0,
+        'capital_en_riesgo': monto if saldo > 0 else 0.0,
+        'prestamos_pagados': 1 if pagado else 0,
+        'dias_recuperacion': dias,
+    }
+
+
+def snapshot_prestamos(db: Session, prestamos: dict) -> dict:
+    """Contribución actual de varios préstamos ({prestamo_id: Prestamo|None}) a los contadores:
+    sus campos, sus pagos y los vendedores asignados, en dos consultas agrupadas.
+    `None` representa un préstamo inexistente o eliminado (sus pagos, si quedaron, siguen contando)."""
+    db.flush()
+    ids = list(prestamos)
+    pagos = {
+        prestamo_id: (cantidad, float(total))
+        for prestamo_id, cantidad, total in db.query(
+            Pago.prestamo_id, func.count(Pago.id), func.coalesce(func.sum(Pago.monto), 0)
+        ).filter(Pago.prestamo_id.in_(ids)).group_by(Pago.prestamo_id)
+    }
+    empleados = {prestamo_id: set() for prestamo_id in ids}
+    for prestamo_id, empleado_id in db.query(PrestamoVendedor.prestamo_id, PrestamoVendedor.empleado_id).filter(
+        PrestamoVendedor.prestamo_id.in_(ids),
+        PrestamoVendedor.empleado_id.isnot(None)
+    ).distinct():
+        empleados[prestamo_id].add(empleado_id)
+
+    snapshots = {}
+    for prestamo_id, prestamo in prestamos.items():
+        valores = _vacio()
+        if prestamo is not None:
+            valores.update(_valores_prestamo(prestamo))
+        valores['total_pagos'], valores['monto_total_recaudado'] = pagos.get(prestamo_id, (0, 0.0))
+        snapshots[prestamo_id] = {'valores': valores, 'empleados': empleados[prestamo_id]}
+    return snapshots
+
+
+def snapshot_prestamo(db: Session, prestamo_id: int, prestamo: Optional[Prestamo] = None) -> dict:
+    """Contribución actual de un préstamo a los contadores (ver snapshot_prestamos)."""
+    return snapshot_prestamos(db, {prestamo_id: prestamo})[prestamo_id]
+
+
+def _sumar(db: Session, empleado_id: Optional[int], deltas: dict) -> None:
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    filtro = PortfolioStats.empleado_id.is_(None) if empleado_id is None else PortfolioStats.empleado_id == empleado_id
+    valores = {getattr(PortfolioStats, k): getattr(PortfolioStats, k) + v for k, v in deltas.items()}
+    valores[PortfolioStats.updated_at] = datetime.utcnow()
+    actualizadas = db.query(PortfolioStats).filter(filtro).update(valores, synchronize_session=False)
+    if not actualizadas and empleado_id is not None:
+        # Primera contribución del empleado: la fila parte de cero
+        fila = PortfolioStats(empleado_id=empleado_id, **_vacio())
+        for k, v in deltas.items():
+            setattr(fila, k, v)
+        db.add(fila)
+        db.flush()
+
+
+def _acumular_cambio(acumulado: dict, antes: Optional[dict], despues: Optional[dict]) -> None:
+    antes = antes or {'valores': _vacio(), 'empleados': set()}
+    despues = despues or {'valores': _vacio(), 'empleados': set()}
+    filas = {None: (antes['valores'], despues['valores'])}
+    for empleado_id in antes['empleados'] | despues['empleados']:
+        filas[empleado_id] = (
+            antes['valores'] if empleado_id in antes['empleados'] else _vacio(),
+            despues['valores'] if empleado_id in despues['empleados'] else _vacio(),
+        )
+    for empleado_id, (valores_antes, valores_despues) in filas.items():
+        deltas = acumulado.setdefault(empleado_id, _vacio())
+        for c in CAMPOS_CONTADORES:
+            deltas[c] += valores_despues[c] - valores_antes[c]
+
+
+def aplicar_cambio_prestamo(db: Session, antes: Optional[dict], despues: Optional[dict]) -> None:
+    """Aplica (despues - antes) a la fila global y a las de los vendedores afectados.
+    No hace commit: debe ir en la misma transacción que la escritura."""
+    acumulado = {}
+    _acumular_cambio(acumulado, antes, despues)
+    for empleado_id, deltas in acumulado.items():
+        _sumar(db, empleado_id, deltas)
+
+
+def aplicar_cambios_prestamos(db: Session, antes: dict, despues: dict) -> None:
+    """Como aplicar_cambio_prestamo para varios préstamos ({prestamo_id: snapshot}),
+    con un único UPDATE por fila de contadores."""
+    acumulado = {}
+    for prestamo_id in set(antes) | set(despues):
+        _acumular_cambio(acumulado, antes.get(prestamo_id), despues.get(prestamo_id))
+    for empleado_id, deltas in acumulado.items():
+        _sumar(db, empleado_id, deltas)
+
+
+def aplicar_comision(db: Session, tipo: str, empleado_id: Optional[int], delta: float) -> None:
+    """Suma `delta` a las comisiones de vendedor o cobrador (global y del empleado). No hace commit."""
+    campo = 'comisiones_vendedor' if tipo == 'vendedor' else 'comisiones_cobrador'
+    _sumar(db, None, {campo: delta})
+    if empleado_id:
+        _sumar(db, empleado_id, {campo: delta})
+
+
+def calcular_portfolio_stats(db: Session) -> dict:
+    """Recalcula los contadores desde las tablas base. Devuelve {empleado_id|None: valores}."""
+    esperado = {None: _vacio()}
+    saldo_cero = Prestamo.saldo_pendiente == 0
+    columnas_prestamo = (
+        func.count(Prestamo.id),
+        func.coalesce(func.sum(Prestamo.monto), 0),
+        func.coalesce(func.sum(Prestamo.monto * Prestamo.tasa_interes / 100.0), 0),
+        func.coalesce(func.sum(Prestamo.saldo_pendiente), 0),
+        func.count(case(((Prestamo.saldo_pendiente > 0) & (Prestamo.estado == 'activo'), 1))),
+        func.coalesce(func.sum(case((Prestamo.saldo_pendiente > 0, Prestamo.monto), else_=0)), 0),
+        func.count(case((saldo_cero, 1))),
+    )
+    nombres_prestamo = (
+        'total_prestamos', 'monto_total_prestado', 'intereses_generados', 'saldo_pendiente_total',
+        'prestamos_activos', 'capital_en_riesgo', 'prestamos_pagados',
+    )
+    columnas_pago = (func.count(Pago.id), func.coalesce(func.sum(Pago.monto), 0))
+
+    def _asignar(destino, nombres, fila):
+        for nombre, valor in zip(nombres, fila):
+            destino[nombre] = valor if nombre in CAMPOS_ENTEROS else float(valor or 0)
+
+    def _dias_recuperacion(filas):
+        # La resta de fechas depende del motor; se suma en Python sobre los préstamos pagados
+        total = {}
+        for clave, inicio, fin in filas:
+            if inicio and fin:
+                total[clave] = total.get(clave, 0) + (fin - inicio).days
+        return total
+
+    _asignar(esperado[None], nombres_prestamo, db.query(*columnas_prestamo).one())
+    _asignar(esperado[None], ('total_pagos', 'monto_total_recaudado'), db.query(*columnas_pago).one())
+    esperado[None]['dias_recuperacion'] = _dias_recuperacion(
+        (None, inicio, fin) for inicio, fin in
+        db.query(Prestamo.fecha_inicio, Prestamo.fecha_vencimiento).filter(saldo_cero)
+    ).get(None, 0)
+    esperado[None]['comisiones_vendedor'] = float(db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).scalar())
+    esperado[None]['comisiones_cobrador'] = float(db.query(func.coalesce(func.sum(PagoCobrador.monto_comision), 0)).scalar())
+
+    # Por vendedor: préstamos asignados en prestamos_vendedores (cada préstamo cuenta una vez por empleado)
+    asignaciones = select(PrestamoVendedor.prestamo_id, PrestamoVendedor.empleado_id).where(
+        PrestamoVendedor.empleado_id.isnot(None)
+    ).distinct().subquery()
+    for empleado_id, *fila in db.query(asignaciones.c.empleado_id, *columnas_prestamo).select_from(Prestamo).join(
+        asignaciones, asignaciones.c.prestamo_id == Prestamo.id
+    ).group_by(asignaciones.c.empleado_id):
+        _asignar(esperado.setdefault(empleado_id, _vacio()), nombres_prestamo, fila)
+    for empleado_id, *fila in db.query(asignaciones.c.empleado_id, *columnas_pago).select_from(Pago).join(
+        asignaciones, asignaciones.c.prestamo_id == Pago.prestamo_id
+    ).group_by(asignaciones.c.empleado_id):
+        _asignar(esperado.setdefault(empleado_id, _vacio()), ('total_pagos', 'monto_total_recaudado'), fila)
+    dias = _dias_recuperacion(
+        db.query(asignaciones.c.empleado_id, Prestamo.fecha_inicio, Prestamo.fecha_vencimiento).select_from(Prestamo).join(
+            asignaciones, asignaciones.c.prestamo_id == Prestamo.id
+        ).filter(saldo_cero)
+    )
+    for empleado_id, total in dias.items():
+        esperado[empleado_id]['dias_recuperacion'] = total
+
+    # Comisiones propias de cada empleado
+    for modelo, campo in ((PagoVendedor, 'comisiones_vendedor'), (PagoCobrador, 'comisiones_cobrador')):
+        for empleado_id, total in db.query(modelo.empleado_id, func.sum(modelo.monto_comision)).filter(
+            modelo.empleado_id.isnot(None)
+        ).group_by(modelo.empleado_id):
+            esperado.setdefault(empleado_id, _vacio())[campo] = float(total or 0)
+    return esperado
+
+
+def reconciliar_portfolio_stats(db: Session, corregir: bool = True) -> dict:
+    """Compara los contadores guardados con los recalculados desde las tablas base.
+
+    Devuelve el drift por fila: {empleado_id|None: {campo: (guardado, esperado)}}.
+    Con `corregir=True` reescribe las filas con los valores esperados y hace commit.
+    """
+    esperado = calcular_portfolio_stats(db)
+    filas = {f.empleado_id: f for f in db.query(PortfolioStats).all()}
+    drift = {}
+    for empleado_id in set(esperado) | set(filas):
+        valores = esperado.get(empleado_id, _vacio())
+        fila = filas.get(empleado_id)
+        diferencias = {}
+        for campo in CAMPOS_CONTADORES:
+            guardado = getattr(fila, campo) if fila is not None else None
+            if guardado is None or abs(float(guardado) - float(valores[campo])) > TOLERANCIA_DRIFT:
+                diferencias[campo] = (guardado, valores[campo])
+        if diferencias:
+            drift[empleado_id] = diferencias
+            if corregir:
+                if fila is None:
+                    fila = PortfolioStats(empleado_id=empleado_id)
+                    db.add(fila)
+                for campo in CAMPOS_CONTADORES:
+                    setattr(fila, campo, valores[campo])
+                fila.updated_at = datetime.utcnow()
+    if corregir and drift:
+        db.commit()
+    return drift
+
+
+def asegurar_portfolio_stats(db: Session) -> bool:
+    """Construye los contadores si todavía no existe la fila global. Devuelve True si los creó."""
+    existe = db.query(PortfolioStats.id).filter(PortfolioStats.empleado_id.is_(None)).first()
+    if existe:
+        return False
+    reconciliar_portfolio_stats(db, corregir=True)
+    return True
+
+
+def leer_portfolio_stats(db: Session, empleado_id: Optional[int] = None) -> dict:
+    """Lee la fila global (o la del empleado) en una sola consulta por clave."""
+    filtro = PortfolioStats.empleado_id.is_(None) if empleado_id is None else PortfolioStats.empleado_id == empleado_id
+    fila = db.query(PortfolioStats).filter(filtro).first()
+    if fila is None and empleado_id is None and asegurar_portfolio_stats(db):
+        fila = db.query(PortfolioStats).filter(filtro).first()
+    if fila is None:
+        return _vacio()
+    return {c: (getattr(fila, c) or 0) for c in CAMPOS_CONTADORES}
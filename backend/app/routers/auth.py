@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt, JWTError
-import bcrypt
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.database import get_db
+from app.database.database import get_db, get_async_db
 from app.models.models import Usuario
+from app.auth_service import (
+    Principal, AUTH_TRUST_CLAIMS, METODOS_SOLO_LECTURA, claims_de_usuario, principal_desde_claims,
+    principal_cacheado, cargar_principal, invalidar_principal, get_principal_cache_stats,
+)
+from app.password_service import (
+    PoolPasswordSaturado, verificar_password, hashear_password, verificar_password_sync,
+    hashear_password_sync, necesita_rehash, registrar_rehash, get_password_pool_stats,
+)
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -56,11 +64,25 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 # Funciones de utilidad
+def _pool_saturado():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Demasiados inicios de sesión simultáneos, reintente en unos segundos",
+        headers={"Retry-After": "1"},
+    )
+
+# bcrypt corre en el pool acotado de password_service, no en el hilo del request
 def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    try:
+        return verificar_password_sync(plain_password, hashed_password)
+    except PoolPasswordSaturado:
+        raise _pool_saturado()
 
 def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        return hashear_password_sync(password)
+    except PoolPasswordSaturado:
+        raise _pool_saturado()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -72,7 +94,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """Principal (id, username, role, empleado_id) del token, sin consultar la base si está
+    cacheado o, con AUTH_TRUST_CLAIMS, si el request es de solo lectura.
+
+    Es async para no ocupar un hilo del threadpool por request: la caché y los claims se
+    resuelven en el event loop y la consulta, cuando hace falta, va por la sesión async
+    (que se comparte con el endpoint si este también usa get_async_db)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
@@ -86,20 +115,28 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(Usuario).filter(Usuario.username == token_data.username).first()
-    if user is None:
+
+    if AUTH_TRUST_CLAIMS and request.method in METODOS_SOLO_LECTURA:
+        principal = principal_desde_claims(payload)
+        if principal is not None:
+            return principal
+    version = payload.get("ver", 0)
+    principal = principal_cacheado(token_data.username, version)
+    if principal is None:
+        principal = await db.run_sync(cargar_principal, token_data.username, version)
+        await db.rollback()  # termina la lectura: la conexión vuelve al pool mientras corre el endpoint
+    if principal is None:
         raise credentials_exception
-    return user
+    return principal
 
 # Rutas
-def require_admin(current_user: Usuario = Depends(get_current_user)):
+async def require_admin(current_user: Principal = Depends(get_current_user)):
     if getattr(current_user, 'role', 'admin') != 'admin':
         raise HTTPException(status_code=403, detail="Solo administradores pueden crear usuarios")
     return current_user
 
 @router.post("/admin/create-user", response_model=UserResponse)
-def admin_create_user(user: UserCreate, db: Session = Depends(get_db), admin: Usuario = Depends(require_admin)):
+def admin_create_user(user: UserCreate, db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     db_user = db.query(Usuario).filter(Usuario.username == user.username).first()
     if db_user:
         raise HTTPException(status_code=400, detail="El usuario ya existe")
@@ -120,12 +157,28 @@ def admin_create_user(user: UserCreate, db: Session = Depends(get_db), admin: Us
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    invalidar_principal(new_user.username)
     return new_user
 
+def _buscar_usuario(db: Session, username: str):
+    return db.query(Usuario).filter(Usuario.username == username).first()
+
+def _guardar_hash(db: Session, usuario_id: int, hashed: str):
+    db.query(Usuario).filter(Usuario.id == usuario_id).update({Usuario.hashed_password: hashed})
+
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(Usuario).filter(Usuario.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await db.run_sync(_buscar_usuario, form_data.username)
+    try:
+        valida = user is not None and await verificar_password(form_data.password, user.hashed_password)
+        if valida and necesita_rehash(user.hashed_password):
+            # BCRYPT_ROUNDS cambió: regenerar el hash con el costo actual ahora que tenemos la clave
+            await db.run_sync(_guardar_hash, user.id, await hashear_password(form_data.password))
+            await db.commit()
+            registrar_rehash()
+    except PoolPasswordSaturado:
+        raise _pool_saturado()
+    if not valida:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario o contraseña incorrectos",
@@ -134,7 +187,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=claims_de_usuario(user), expires_delta=access_token_expires
     )
     return {
         "access_token": access_token,
@@ -145,11 +198,14 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     }
 
 @router.get("/me", response_model=UserResponse)
-def read_users_me(current_user: Usuario = Depends(get_current_user)):
-    return current_user
+def read_users_me(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
+    if usuario is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return usuario
 
 @router.get("/usuarios", response_model=list[UserResponse])
-def list_usuarios(db: Session = Depends(get_db), admin: Usuario = Depends(require_admin)):
+def list_usuarios(db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     usuarios = db.query(Usuario).all()
     return usuarios
 
@@ -162,16 +218,25 @@ class UserUpdate(BaseModel):
     password: Optional[str] = None  # permitir cambio de contraseña
 
 @router.put("/me", response_model=UserResponse)
-def update_me(datos: UserUpdate, db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+def update_me(datos: UserUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
+    if usuario is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     cambios = datos.model_dump(exclude_unset=True)
     if 'password' in cambios:
         hashed = get_password_hash(cambios.pop('password'))
-        setattr(current_user, 'hashed_password', hashed)
+        setattr(usuario, 'hashed_password', hashed)
     for k, v in cambios.items():
-        setattr(current_user, k, v)
+        setattr(usuario, k, v)
     db.commit()
-    db.refresh(current_user)
-    return current_user
+    db.refresh(usuario)
+    invalidar_principal(usuario.username)
+    return usuario
+
+@router.get("/stats")
+def auth_stats(admin: Principal = Depends(require_admin)):
+    """Caché de usuarios autenticados y cola del pool de bcrypt (espera, rechazos, rehashes)."""
+    return {"principales": get_principal_cache_stats(), "passwords": get_password_pool_stats()}
 
 @router.post("/logout")
 def logout():
@@ -1,25 +1,55 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, date
-from app.database.database import get_db
+from typing import Optional
+from app.database.database import get_db, get_async_db, SessionLocal
 from app.schemas.schemas import (
     MovimientoCajaCreate, MovimientoCaja, CierreCaja, CerrarDiaRequest, CajaCierreResponse, AbrirDiaRequest,
     CajaEmpleadoMovimientoCreate, CajaEmpleadoMovimiento, CajaEmpleadoResumen, CajaEmpleadoCerrarRequest, CajaEmpleadoAbrirRequest
 )
 from app.caja_service import (
-    crear_movimiento, listar_movimientos_por_fecha, get_cierre_caja, cerrar_dia, actualizar_totales_cierre, get_or_create_cierre, abrir_dia,
+    crear_movimiento, get_cierre_caja, cerrar_dia, get_or_create_cierre, abrir_dia,
     crear_movimiento_empleado, calcular_resumen_empleado, cerrar_dia_empleado, abrir_dia_empleado,
-    listar_movimientos_empleado_por_fecha
+    listar_movimientos_empleado_por_fecha, listar_movimientos_paginados, cierres_rango, filas_csv_cierres,
+    MAX_DIAS_REPORTE_CIERRES
 )
+from app.pagination_service import aplicar_encabezados, CursorInvalido, LIMITE_MAXIMO
 from app.routers.auth import get_current_user
 from app.models.models import Usuario
 
 router = APIRouter(prefix="/api/caja", tags=["Caja"])
 
 @router.get("/movimientos", response_model=list[MovimientoCaja])
-def listar_movimientos(fecha: str = Query(..., description="Fecha YYYY-MM-DD"), db: Session = Depends(get_db)):
-    f = datetime.strptime(fecha, "%Y-%m-%d").date()
-    return listar_movimientos_por_fecha(db, f)
+def listar_movimientos(
+    response: Response,
+    fecha: Optional[str] = Query(None, description="Fecha YYYY-MM-DD (equivale a desde=hasta=fecha)"),
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    tipo: Optional[str] = Query(None, pattern="^(ingreso|egreso)$"),
+    categoria: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    prestamo_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO, description="Por defecto: el día completo con `fecha`, 100 si no"),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    total: bool = Query(False, description="Informar X-Total-Aprox (conteo acotado)"),
+    db: Session = Depends(get_db)
+):
+    """Movimientos de caja en orden (fecha, id), paginados con `cursor` = X-Next-Cursor."""
+    if fecha:
+        desde = hasta = datetime.strptime(fecha, "%Y-%m-%d").date()
+    elif limit is None:
+        limit = 100
+    try:
+        movimientos, siguiente, aprox = listar_movimientos_paginados(
+            db, desde, hasta, tipo, categoria, limit=limit, cursor=cursor, con_total=total,
+            cliente_id=cliente_id, prestamo_id=prestamo_id
+        )
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    aplicar_encabezados(response, siguiente, aprox)
+    return movimientos
 
 @router.post("/movimientos", response_model=MovimientoCaja)
 def crear_movimiento_endpoint(data: MovimientoCajaCreate, db: Session = Depends(get_db)):
@@ -27,15 +57,41 @@ def crear_movimiento_endpoint(data: MovimientoCajaCreate, db: Session = Depends(
     cierre = get_or_create_cierre(db, data.fecha)
     if cierre.cerrado:
         raise HTTPException(status_code=400, detail="El día está cerrado. Debes abrir la caja para registrar movimientos.")
-    mov = crear_movimiento(db, data)
-    # Recalcular totales del cierre para ese día
-    actualizar_totales_cierre(db, data.fecha)
-    return mov
+    # crear_movimiento aplica el delta al cierre del día
+    return crear_movimiento(db, data)
 
 @router.get("/cierre", response_model=CierreCaja)
-def cierre_caja(fecha: str = Query(date.today().isoformat(), description="Fecha YYYY-MM-DD"), db: Session = Depends(get_db)):
+async def cierre_caja(fecha: str = Query(date.today().isoformat(), description="Fecha YYYY-MM-DD"), db: AsyncSession = Depends(get_async_db)):
     f = datetime.strptime(fecha, "%Y-%m-%d").date()
-    return get_cierre_caja(db, f)
+    return await db.run_sync(get_cierre_caja, f)
+
+def _csv_cierres(desde: date, hasta: date):
+    # Sesión propia: la del request se libera antes de terminar de transmitir
+    db = SessionLocal()
+    try:
+        yield from filas_csv_cierres(db, desde, hasta)
+    finally:
+        db.close()
+
+@router.get("/cierres", response_model=list[CierreCaja])
+async def cierres_caja(
+    desde: date,
+    hasta: date,
+    formato: str = Query("json", pattern="^(json|csv)$", description="csv transmite el reporte por bloques"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Resumen diario del rango: saldo inicial, ingresos y egresos por categoría, comisiones y
+    flujo neto. Solo lectura: no autocierra ni crea cierres."""
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser posterior o igual a 'desde'")
+    if (hasta - desde).days >= MAX_DIAS_REPORTE_CIERRES:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {MAX_DIAS_REPORTE_CIERRES} días")
+    if formato == "csv":
+        return StreamingResponse(
+            _csv_cierres(desde, hasta), media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="cierres_{desde}_{hasta}.csv"'},
+        )
+    return await db.run_sync(cierres_rango, desde, hasta)
 
 @router.post("/cerrar-dia", response_model=CajaCierreResponse)
 def cerrar_dia_endpoint(request: CerrarDiaRequest, db: Session = Depends(get_db)):
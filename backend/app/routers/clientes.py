@@ -1,50 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
-from app.database.database import get_db
-from app.models.models import Cliente, Prestamo, Usuario
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database.database import get_db, get_async_db
+from app.models.models import Cliente, Prestamo, Usuario, PRESTAMO_CON_SALDO
 from app.schemas.schemas import Cliente as ClienteSchema, ClienteCreate, ClienteUpdate
 from app.routers.auth import get_current_user
+from app.metrics_service import invalidar_cache_metricas
+from app.pagination_service import paginar, aplicar_encabezados, CursorInvalido, LIMITE_MAXIMO
+from app.scoping_service import filtro_clientes, aplicar_alcance
 
 router = APIRouter()
 
-@router.get("/", response_model=List[ClienteSchema])
-def get_clientes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
-    """Obtener clientes según el rol del usuario"""
+def _listar_clientes(db: Session, skip: int, limit: int, current_user: Usuario, cursor: Optional[str] = None,
+                     nombre: Optional[str] = None, con_saldo: bool = False, con_total: bool = False):
+    """Obtener clientes según el rol del usuario, paginados por id (ver pagination_service)"""
     try:
-        # Si es admin, ve todos los clientes
-        if current_user.role == 'admin':
-            clientes = db.query(Cliente).offset(skip).limit(limit).all()
-            return clientes
-        
-        # Si es vendedor o cobrador, solo ve clientes con préstamos donde está asignado
-        from app.models.models import PrestamoVendedor
-        if current_user.role == 'cobrador':
-            # Clientes de préstamos sin vendedor (préstamos administrados por admin)
-            vendedores_subq = db.query(PrestamoVendedor.prestamo_id).distinct().subquery()
-            clientes_ids = db.query(Prestamo.cliente_id).filter(~Prestamo.id.in_(vendedores_subq)).distinct().all()
-            cliente_ids_list = [c[0] for c in clientes_ids]
-            if not cliente_ids_list:
-                return []
-            clientes = db.query(Cliente).filter(Cliente.id.in_(cliente_ids_list)).offset(skip).limit(limit).all()
-            return clientes
-        # Vendedor: clientes de sus préstamos
-        if not current_user.empleado_id:
-            return []
-        prestamos_ids = db.query(PrestamoVendedor.prestamo_id).filter(PrestamoVendedor.empleado_id == current_user.empleado_id).distinct().all()
-        if not prestamos_ids:
-            return []
-        prestamo_ids_list = [p[0] for p in prestamos_ids]
-        clientes_ids = db.query(Prestamo.cliente_id).filter(Prestamo.id.in_(prestamo_ids_list)).distinct().all()
-        cliente_ids_list = [c[0] for c in clientes_ids]
-        if not cliente_ids_list:
-            return []
-        clientes = db.query(Cliente).filter(Cliente.id.in_(cliente_ids_list)).offset(skip).limit(limit).all()
-        return clientes
+        # Admin: todos; vendedor y cobrador: clientes con préstamos en su alcance (scoping_service)
+        q = aplicar_alcance(db.query(Cliente), filtro_clientes(current_user))
+
+        if nombre:
+            q = q.filter(Cliente.nombre.ilike(f"%{nombre}%"))
+        if con_saldo:
+            # Índice parcial ix_prestamos_con_saldo_cliente
+            q = q.filter(Cliente.id.in_(select(Prestamo.cliente_id).where(PRESTAMO_CON_SALDO)))
+        return paginar(q, (Cliente.id,), limit, cursor=cursor, skip=skip, con_total=con_total)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error en get_clientes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/", response_model=List[ClienteSchema])
+async def get_clientes(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    nombre: Optional[str] = Query(None, description="Parte del nombre"),
+    con_saldo: bool = Query(False, description="Solo clientes con algún préstamo con saldo pendiente"),
+    total: bool = Query(False, description="Informar X-Total-Aprox (conteo acotado)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Obtener clientes según el rol del usuario.
+
+    Orden estable por id. La siguiente página se pide con `cursor` = encabezado X-Next-Cursor
+    (ausente en la última página); `skip` se mantiene para clientes que paginan por offset.
+    """
+    clientes, siguiente, aprox = await db.run_sync(
+        _listar_clientes, skip, limit, current_user, cursor, nombre, con_saldo, total
+    )
+    aplicar_encabezados(response, siguiente, aprox)
+    return clientes
+
 @router.get("/{cliente_id}", response_model=ClienteSchema)
 def get_cliente(cliente_id: int, db: Session = Depends(get_db)):
     """Obtener un cliente por ID"""
@@ -59,6 +70,7 @@ def create_cliente(cliente: ClienteCreate, db: Session = Depends(get_db)):
     db_cliente = Cliente(**cliente.model_dump())
     db.add(db_cliente)
     db.commit()
+    invalidar_cache_metricas()
     db.refresh(db_cliente)
     return db_cliente
 
@@ -74,6 +86,7 @@ def update_cliente(cliente_id: int, cliente: ClienteUpdate, db: Session = Depend
         setattr(db_cliente, key, value)
     
     db.commit()
+    invalidar_cache_metricas()
     db.refresh(db_cliente)
     return db_cliente
 
@@ -86,4 +99,5 @@ def delete_cliente(cliente_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_cliente)
     db.commit()
+    invalidar_cache_metricas()
     return None
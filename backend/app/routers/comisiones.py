@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import date, datetime
 from typing import Optional
 from app.database.database import get_db
 from app.models.models import PrestamoVendedor, PagoVendedor, PagoCobrador, Prestamo, Pago, Empleado
+from app.pagination_service import paginar, aplicar_encabezados, CursorInvalido, LIMITE_MAXIMO
 
 router = APIRouter()
 
@@ -62,68 +63,131 @@ def resumen_comisiones_vendedor(
     }
 
 
-@router.get("/vendedor/detalle")
-def detalle_comisiones_vendedor(
-    vendedor_id: int,
-    db: Session = Depends(get_db)
-):
-    """
-    Detalle por préstamo de las comisiones de un vendedor específico.
+def _detalle_comisiones_vendedor(db: Session, vendedor_id: int, orden: str, limit: Optional[int],
+                                 cursor: Optional[str], skip: int, desde: Optional[date], hasta: Optional[date]):
+    """Detalle y totales en dos consultas agrupadas (no una por préstamo).
+
+    Lo cobrado por préstamo sale de una subconsulta agregada de pagos_vendedores (GROUP BY
+    prestamo_id) unida a prestamos_vendedores y prestamos; los totales son un SUM sobre el mismo
+    conjunto filtrado, así no dependen de la página pedida.
     """
-    
-    # Obtener información del vendedor
-    vendedor = db.query(Empleado).filter(Empleado.id == vendedor_id).first()
+    vendedor = db.query(Empleado.id, Empleado.nombre).filter(Empleado.id == vendedor_id).first()
     if not vendedor:
-        return {"error": "Vendedor no encontrado"}
-    
-    # Obtener todos los préstamos del vendedor
-    prestamos_vendedor = db.query(PrestamoVendedor).filter(
-        PrestamoVendedor.empleado_id == vendedor_id
-    ).all()
-    
-    detalle = []
-    
-    for pv in prestamos_vendedor:
-        prestamo = db.query(Prestamo).filter(Prestamo.id == pv.prestamo_id).first()
-        if not prestamo:
-            continue
-        
-        # Calcular comisiones cobradas de este préstamo
-        comisiones_cobradas_prestamo = db.query(
-            func.sum(PagoVendedor.monto_comision)
-        ).join(Pago, PagoVendedor.pago_id == Pago.id).filter(
-            Pago.prestamo_id == prestamo.id,
-            PagoVendedor.empleado_id == vendedor_id
-        ).scalar() or 0.0
-        
-        detalle.append({
-            "prestamo_id": prestamo.id,
-            "cliente_id": prestamo.cliente_id,
-            "monto_prestamo": prestamo.monto,
-            "monto_total": prestamo.monto_total,
-            "cuotas_totales": prestamo.cuotas_totales,
-            "cuotas_pagadas": prestamo.cuotas_pagadas,
-            "estado": prestamo.estado,
-            "porcentaje_vendedor": pv.porcentaje,
-            "comision_esperada": pv.monto_comision,
-            "comision_cobrada": round(comisiones_cobradas_prestamo, 2),
-            "comision_pendiente": round(pv.monto_comision - comisiones_cobradas_prestamo, 2)
-        })
-    
+        return None
+
+    cobradas = (
+        db.query(Pago.prestamo_id.label("prestamo_id"),
+                 func.sum(PagoVendedor.monto_comision).label("cobrada"))
+        .join(Pago, PagoVendedor.pago_id == Pago.id)
+        .filter(PagoVendedor.empleado_id == vendedor_id)
+        .group_by(Pago.prestamo_id)
+        .subquery()
+    )
+    cobrada = func.coalesce(cobradas.c.cobrada, 0.0)
+    # pendiente descendente = (cobrada - esperada) ascendente: el keyset solo avanza con ">"
+    orden_pendiente = (cobrada - PrestamoVendedor.monto_comision).label("orden_pendiente")
+
+    base = (
+        db.query(PrestamoVendedor)
+        .join(Prestamo, Prestamo.id == PrestamoVendedor.prestamo_id)
+        .outerjoin(cobradas, cobradas.c.prestamo_id == PrestamoVendedor.prestamo_id)
+        .filter(PrestamoVendedor.empleado_id == vendedor_id)
+    )
+    if desde:
+        base = base.filter(Prestamo.fecha_inicio >= desde)
+    if hasta:
+        base = base.filter(Prestamo.fecha_inicio <= hasta)
+
+    totales = base.with_entities(
+        func.count(PrestamoVendedor.id),
+        func.coalesce(func.sum(PrestamoVendedor.monto_comision), 0.0),
+        func.coalesce(func.sum(cobradas.c.cobrada), 0.0),
+    ).one()
+
+    q = base.with_entities(
+        PrestamoVendedor.id,
+        PrestamoVendedor.prestamo_id,
+        Prestamo.cliente_id,
+        Prestamo.monto,
+        Prestamo.monto_total,
+        Prestamo.cuotas_totales,
+        Prestamo.cuotas_pagadas,
+        Prestamo.estado,
+        PrestamoVendedor.porcentaje,
+        PrestamoVendedor.monto_comision,
+        cobrada.label("cobrada"),
+        orden_pendiente,
+    )
+    # (prestamo_id, id) sigue ix_prestamos_vendedores_empleado_prestamo; id desempata si se repite
+    if orden == "pendiente":
+        columnas = (orden_pendiente, PrestamoVendedor.id)
+    else:
+        columnas = (PrestamoVendedor.prestamo_id, PrestamoVendedor.id)
+    if limit is None and not cursor:
+        q = q.order_by(*columnas)
+        filas, siguiente = (q.offset(skip) if skip else q).all(), None
+    else:
+        filas, siguiente, _ = paginar(q, columnas, limit or LIMITE_MAXIMO, cursor=cursor, skip=skip)
+
+    cantidad, esperada_total, cobrada_total = totales
     return {
         "vendedor": {
             "id": vendedor.id,
             "nombre": vendedor.nombre
         },
-        "prestamos": detalle,
+        "prestamos": [
+            {
+                "prestamo_id": f.prestamo_id,
+                "cliente_id": f.cliente_id,
+                "monto_prestamo": f.monto,
+                "monto_total": f.monto_total,
+                "cuotas_totales": f.cuotas_totales,
+                "cuotas_pagadas": f.cuotas_pagadas,
+                "estado": f.estado,
+                "porcentaje_vendedor": f.porcentaje,
+                "comision_esperada": f.monto_comision,
+                "comision_cobrada": round(f.cobrada, 2),
+                "comision_pendiente": round(f.monto_comision - f.cobrada, 2)
+            }
+            for f in filas
+        ],
         "totales": {
-            "comision_esperada_total": sum(p["comision_esperada"] for p in detalle),
-            "comision_cobrada_total": sum(p["comision_cobrada"] for p in detalle),
-            "comision_pendiente_total": sum(p["comision_pendiente"] for p in detalle)
-        }
+            "cantidad_prestamos": cantidad,
+            "comision_esperada_total": round(esperada_total, 2),
+            "comision_cobrada_total": round(cobrada_total, 2),
+            "comision_pendiente_total": round(esperada_total - cobrada_total, 2)
+        },
+        "siguiente_cursor": siguiente,
     }
 
 
+@router.get("/vendedor/detalle")
+def detalle_comisiones_vendedor(
+    response: Response,
+    vendedor_id: int,
+    orden: str = Query("prestamo", pattern="^(prestamo|pendiente)$",
+                       description="prestamo: alta del préstamo; pendiente: mayor comisión pendiente primero"),
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO, description="Sin limit ni cursor: todos"),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    skip: int = 0,
+    fecha_desde: Optional[date] = Query(None, description="fecha_inicio del préstamo desde (incluida)"),
+    fecha_hasta: Optional[date] = Query(None, description="fecha_inicio del préstamo hasta (incluida)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Detalle por préstamo de las comisiones de un vendedor específico.
+    Los totales cubren todos los préstamos del filtro, no solo la página devuelta.
+    """
+    try:
+        detalle = _detalle_comisiones_vendedor(db, vendedor_id, orden, limit, cursor, skip, fecha_desde, fecha_hasta)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if detalle is None:
+        return {"error": "Vendedor no encontrado"}
+    aplicar_encabezados(response, detalle["siguiente_cursor"], None)
+    return detalle
+
+
 @router.get("/cobrador/resumen")
 def resumen_comisiones_cobrador(
     cobrador_id: Optional[int] = None,
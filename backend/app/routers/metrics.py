@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date, datetime, timedelta
 from calendar import monthrange
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models.models import Usuario
 from app.metrics_service import (
     get_summary_metrics,
@@ -12,15 +12,22 @@ from app.metrics_service import (
     get_daily_simple,
     get_period_metrics,
     get_expectativas,
-    get_segment_metrics
+    get_segment_metrics,
+    get_top_clientes,
+    get_rentabilidad,
+    get_evolucion_temporal,
+    get_cache_stats
 )
 from app.schemas.schemas import SummaryMetrics, KPIMetrics, DailySimpleMetrics, SegmentResponse
 from app.routers.auth import get_current_user
 
 router = APIRouter()
 
+# Endpoints de lectura async: los servicios (ORM síncrono) corren con db.run_sync sobre el
+# engine async, así las llamadas en paralelo del dashboard no ocupan hilos del threadpool
+
 @router.get("/summary", response_model=SummaryMetrics)
-def metrics_summary(db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def metrics_summary(db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Obtener métricas financieras resumidas del sistema."""
     try:
         # Si es admin, muestra todo
@@ -28,7 +35,7 @@ def metrics_summary(db: Session = Depends(get_db), current_user: Usuario = Depen
         if current_user.role != 'admin':
             empleado_id = current_user.empleado_id
         
-        data = get_summary_metrics(db, empleado_id)
+        data = await db.run_sync(get_summary_metrics, empleado_id)
         return data
     except Exception as e:
         print(f"Error en metrics_summary: {e}")
@@ -36,36 +43,36 @@ def metrics_summary(db: Session = Depends(get_db), current_user: Usuario = Depen
 
 
 @router.get("/due-today")
-def metrics_due_today(db: Session = Depends(get_db)):
+async def metrics_due_today(db: AsyncSession = Depends(get_async_db)):
     """Monto esperado y cantidad de cuotas con fecha de hoy."""
-    return get_due_today(db)
+    return await db.run_sync(get_due_today)
 
 
 @router.get("/due-next")
-def metrics_due_next(days: int = 7, db: Session = Depends(get_db)):
+async def metrics_due_next(days: int = 7, db: AsyncSession = Depends(get_async_db)):
     """Monto y cantidad de cuotas que vencen en los próximos N días (excluye hoy)."""
-    return get_due_next(db, days)
+    return await db.run_sync(get_due_next, days)
 
 
 @router.get("/kpis", response_model=KPIMetrics)
-def metrics_kpis(db: Session = Depends(get_db)):
+async def metrics_kpis(db: AsyncSession = Depends(get_async_db)):
     """KPIs consolidados para la franja superior del dashboard."""
-    return get_kpis(db)
+    return await db.run_sync(get_kpis)
 
 
 @router.get("/daily-simple", response_model=DailySimpleMetrics)
-def metrics_daily_simple(days: int = 1, db: Session = Depends(get_db)):
+async def metrics_daily_simple(days: int = 1, db: AsyncSession = Depends(get_async_db)):
     """Resumen simplificado del período (1, 7 o 30 días) para caja principal."""
-    return get_daily_simple(db, days)
+    return await db.run_sync(get_daily_simple, days)
 
 
 @router.get("/period/date")
-def metrics_period_date(date: str = Query(...), db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def metrics_period_date(date: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Métricas de un día específico."""
     try:
         target_date = datetime.strptime(date, '%Y-%m-%d').date()
         empleado_id = None if current_user.role == 'admin' else current_user.empleado_id
-        result = get_period_metrics(db, 'date', target_date, empleado_id=empleado_id)
+        result = await db.run_sync(get_period_metrics, 'date', target_date, empleado_id=empleado_id)
         return result
     except Exception as e:
         import traceback
@@ -74,16 +81,16 @@ def metrics_period_date(date: str = Query(...), db: Session = Depends(get_db), c
 
 
 @router.get("/period/week")
-def metrics_period_week(start_date: str = Query(...), end_date: str = Query(...), db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def metrics_period_week(start_date: str = Query(...), end_date: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Métricas de una semana específica."""
     start = datetime.strptime(start_date, '%Y-%m-%d').date()
     end = datetime.strptime(end_date, '%Y-%m-%d').date()
     empleado_id = None if current_user.role == 'admin' else current_user.empleado_id
-    return get_period_metrics(db, 'week', start, end, empleado_id=empleado_id)
+    return await db.run_sync(get_period_metrics, 'week', start, end, empleado_id=empleado_id)
 
 
 @router.get("/period/month")
-def metrics_period_month(month: str = Query(...), db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def metrics_period_month(month: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Métricas de un mes específico (formato YYYY-MM)."""
     year, month_num = map(int, month.split('-'))
     start = date(year, month_num, 1)
@@ -91,29 +98,29 @@ def metrics_period_month(month: str = Query(...), db: Session = Depends(get_db),
     _, last_day = monthrange(year, month_num)
     end = date(year, month_num, last_day)
     empleado_id = None if current_user.role == 'admin' else current_user.empleado_id
-    return get_period_metrics(db, 'month', start, end, empleado_id=empleado_id)
+    return await db.run_sync(get_period_metrics, 'month', start, end, empleado_id=empleado_id)
 
 
 @router.get("/expectativas/date")
-def expectativas_date(date: str = Query(...), db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def expectativas_date(date: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Expectativas de cobro para una fecha específica."""
     target_date = datetime.strptime(date, '%Y-%m-%d').date()
     # Solo filtrar por empleado si es vendedor; cobradores no tienen asignación de préstamos
     empleado_id = current_user.empleado_id if current_user.role == 'vendedor' else None
-    return get_expectativas(db, target_date, empleado_id=empleado_id)
+    return await db.run_sync(get_expectativas, target_date, empleado_id=empleado_id)
 
 
 @router.get("/expectativas/week")
-def expectativas_week(start_date: str = Query(...), end_date: str = Query(...), db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def expectativas_week(start_date: str = Query(...), end_date: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Expectativas de cobro para una semana específica."""
     start = datetime.strptime(start_date, '%Y-%m-%d').date()
     end = datetime.strptime(end_date, '%Y-%m-%d').date()
     empleado_id = current_user.empleado_id if current_user.role == 'vendedor' else None
-    return get_expectativas(db, start, end, empleado_id=empleado_id)
+    return await db.run_sync(get_expectativas, start, end, empleado_id=empleado_id)
 
 
 @router.get("/expectativas/month")
-def expectativas_month(month: str = Query(...), db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+async def expectativas_month(month: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
     """Expectativas de cobro para un mes específico (formato YYYY-MM)."""
     year, month_num = map(int, month.split('-'))
     start = date(year, month_num, 1)
@@ -121,37 +128,44 @@ def expectativas_month(month: str = Query(...), db: Session = Depends(get_db), c
     _, last_day = monthrange(year, month_num)
     end = date(year, month_num, last_day)
     empleado_id = current_user.empleado_id if current_user.role == 'vendedor' else None
-    return get_expectativas(db, start, end, empleado_id=empleado_id)
+    return await db.run_sync(get_expectativas, start, end, empleado_id=empleado_id)
 
 
 @router.get("/segment", response_model=SegmentResponse)
-def metrics_segment(
+async def metrics_segment(
     dimension: str = Query(..., description="Dimensión: frecuencia_pago | estado | tamano | antiguedad | morosidad"),
     start_date: str = Query(None),
     end_date: str = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     sd = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
     ed = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
-    return get_segment_metrics(db, dimension, sd, ed)
+    return await db.run_sync(get_segment_metrics, dimension, sd, ed)
 
 
 @router.get("/top-clientes")
-def metrics_top_clientes(limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db)):
+async def metrics_top_clientes(limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_async_db)):
     """Obtiene los top clientes por diferentes métricas."""
-    from app.metrics_service import get_top_clientes
-    return get_top_clientes(db, limit)
+    return await db.run_sync(get_top_clientes, limit)
 
 
 @router.get("/rentabilidad")
-def metrics_rentabilidad(db: Session = Depends(get_db)):
+async def metrics_rentabilidad(db: AsyncSession = Depends(get_async_db)):
     """Calcula métricas de rentabilidad del negocio."""
-    from app.metrics_service import get_rentabilidad
-    return get_rentabilidad(db)
+    return await db.run_sync(get_rentabilidad)
 
 
 @router.get("/evolucion")
-def metrics_evolucion(periodo_dias: int = Query(30, ge=7, le=365), db: Session = Depends(get_db)):
+async def metrics_evolucion(
+    periodo_dias: int = Query(30, ge=7, le=365),
+    granularity: str = Query('dia', pattern='^(dia|semana|mes)$', description="Agrupación: dia | semana | mes"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Obtiene la evolución de métricas clave en los últimos N días."""
-    from app.metrics_service import get_evolucion_temporal
-    return get_evolucion_temporal(db, periodo_dias)
+    return await db.run_sync(get_evolucion_temporal, periodo_dias, granularity)
+
+
+@router.get("/cache-stats")
+async def metrics_cache_stats(current_user: Usuario = Depends(get_current_user)):
+    """Estadísticas del cache de métricas (hits, misses, entradas, invalidaciones)."""
+    return get_cache_stats()
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import date
-from app.database.database import get_db
-from app.models.models import Pago, Prestamo, PagoCobrador, PagoVendedor, PrestamoVendedor, Empleado, MovimientoCaja, Cliente, Usuario
-from app.schemas.schemas import Pago as PagoSchema, PagoCreate, PagoCobrador as PagoCobradorSchema, PagoVendedor as PagoVendedorSchema, AprobarPagoCobrador
-from app.caja_service import actualizar_totales_cierre, get_or_create_cierre
+from app.database.database import get_db, get_async_db
+from app.models.models import Pago, Prestamo, PagoCobrador, PagoVendedor, PrestamoVendedor, Empleado, MovimientoCaja, Usuario
+from app.schemas.schemas import Pago as PagoSchema, PagoCreate, PagoLoteResponse, PagoCobrador as PagoCobradorSchema, PagoVendedor as PagoVendedorSchema, AprobarPagoCobrador
+from app.caja_service import aplicar_movimientos_cierre, get_or_create_cierre
+from app.amortization_service import actualizar_estado_cuotas
 from app.models.models import CajaEmpleadoMovimiento
 from app.routers.auth import get_current_user
+from app.metrics_service import invalidar_cache_metricas
+from app.portfolio_stats_service import snapshot_prestamo, snapshot_prestamos, aplicar_cambio_prestamo, aplicar_cambios_prestamos, aplicar_comision
+from app.pagos_service import aplicar_pago_en_cuotas, registros_de_pago
+from app.pagination_service import paginar, aplicar_encabezados, CursorInvalido, LIMITE_MAXIMO
+from app.scoping_service import filtro_pagos, aplicar_alcance
 
 router = APIRouter()
 
@@ -27,57 +35,55 @@ def preview_cobrador(monto: float, porcentaje: float):
     monto_comision = round(float(monto) * float(porcentaje) / 100.0, 2)
     return {"monto_comision": monto_comision}
 
-@router.get("/", response_model=List[PagoSchema])
-def get_pagos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
-    """Obtener pagos según el rol del usuario"""
+def _listar_pagos(db: Session, skip: int, limit: int, current_user: Usuario, cursor: Optional[str] = None,
+                  prestamo_id: Optional[int] = None, cliente_id: Optional[int] = None,
+                  desde: Optional[date] = None, hasta: Optional[date] = None, con_total: bool = False):
+    """Obtener pagos según el rol del usuario, paginados por id (ver pagination_service)"""
     try:
-        # Si es admin, ve todos los pagos
-        if current_user.role == 'admin':
-            pagos = db.query(Pago).offset(skip).limit(limit).all()
-            return pagos
-        
-        # Para empleados sin ID asignado
-        if not current_user.empleado_id:
-            return []
-        
-        # Si es vendedor: pagos de sus préstamos (con PrestamoVendedor)
-        if current_user.role == 'vendedor':
-            prestamos_ids = db.query(PrestamoVendedor.prestamo_id).filter(
-                PrestamoVendedor.empleado_id == current_user.empleado_id
-            ).distinct().all()
-            
-            if not prestamos_ids:
-                return []
-            
-            prestamo_ids_list = [p[0] for p in prestamos_ids]
-            pagos = db.query(Pago).filter(
-                Pago.prestamo_id.in_(prestamo_ids_list)
-            ).offset(skip).limit(limit).all()
-            return pagos
-        
-        # Si es cobrador: solo sus pagos (registros en PagoCobrador)
-        if current_user.role == 'cobrador':
-            # Obtener IDs de pagos donde el cobrador está registrado
-            pagos_ids = db.query(PagoCobrador.pago_id).filter(
-                PagoCobrador.empleado_id == current_user.empleado_id
-            ).distinct().all()
-            
-            if not pagos_ids:
-                return []
-            
-            pago_ids_list = [p[0] for p in pagos_ids]
-            pagos = db.query(Pago).filter(
-                Pago.id.in_(pago_ids_list)
-            ).offset(skip).limit(limit).all()
-            return pagos
-        
-        # Rol no reconocido
-        return []
-        
+        # Admin: todos; vendedor: pagos de sus préstamos; cobrador: los que registró (scoping_service)
+        q = aplicar_alcance(db.query(Pago), filtro_pagos(current_user))
+
+        if prestamo_id:
+            q = q.filter(Pago.prestamo_id == prestamo_id)
+        if cliente_id:
+            q = q.filter(Pago.prestamo_id.in_(select(Prestamo.id).where(Prestamo.cliente_id == cliente_id)))
+        if desde:
+            q = q.filter(Pago.fecha_pago >= desde)
+        if hasta:
+            q = q.filter(Pago.fecha_pago <= hasta)
+        return paginar(q, (Pago.id,), limit, cursor=cursor, skip=skip, con_total=con_total)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error en get_pagos: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/", response_model=List[PagoSchema])
+async def get_pagos(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    prestamo_id: Optional[int] = None,
+    cliente_id: Optional[int] = None,
+    desde: Optional[date] = Query(None, description="fecha_pago desde (incluida)"),
+    hasta: Optional[date] = Query(None, description="fecha_pago hasta (incluida)"),
+    total: bool = Query(False, description="Informar X-Total-Aprox (conteo acotado)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Obtener pagos según el rol del usuario.
+
+    Orden estable por id. La siguiente página se pide con `cursor` = encabezado X-Next-Cursor
+    (ausente en la última página); `skip` se mantiene para clientes que paginan por offset.
+    """
+    pagos, siguiente, aprox = await db.run_sync(
+        _listar_pagos, skip, limit, current_user, cursor, prestamo_id, cliente_id, desde, hasta, total
+    )
+    aplicar_encabezados(response, siguiente, aprox)
+    return pagos
+
 @router.get("/{pago_id}", response_model=PagoSchema)
 def get_pago(pago_id: int, db: Session = Depends(get_db)):
     """Obtener un pago por ID"""
@@ -127,208 +133,150 @@ def create_pago(pago: PagoCreate, db: Session = Depends(get_db), current_user: U
         cobrador_id = current_user.empleado_id
         porcentaje_cobrador = None  # se aprobará luego por admin
     
-    # Bloquear si el día está cerrado
-    cierre_hoy = get_or_create_cierre(db, pago_data['fecha_pago'])
+    # Validar el porcentaje del cobrador antes de escribir nada
+    if cobrador_id and porcentaje_cobrador is not None and getattr(current_user, 'role', None) == 'admin':
+        if porcentaje_cobrador < 0 or porcentaje_cobrador > 100:
+            raise HTTPException(status_code=400, detail="El porcentaje del cobrador debe estar entre 0 y 100")
+
+    # Todo el registro del pago es una sola transacción (un commit al final); bloquear si el día está cerrado
+    cierre_hoy = get_or_create_cierre(db, pago_data['fecha_pago'], commit=False)
     if cierre_hoy.cerrado:
         raise HTTPException(status_code=400, detail="El día está cerrado. Abre la caja para registrar pagos.")
 
+    antes = snapshot_prestamo(db, prestamo.id, prestamo)
     db_pago = Pago(**pago_data)
     db.add(db_pago)
-    
-    # === LÓGICA DE CUOTAS ===
-    # Calcular cuánto debe en la cuota actual (valor_cuota + saldo_cuota)
-    monto_cuota_actual = prestamo.valor_cuota + prestamo.saldo_cuota
-    
-    # Aplicar el pago
-    diferencia = monto_cuota_actual - pago.monto
-    
-    # Manejo según tipo de pago
-    if pago.tipo_pago == "total":
-        # Pago total: intenta pagar todo el saldo pendiente
-        monto_restante = pago.monto
-        
-        while monto_restante > 0 and prestamo.cuotas_pagadas < prestamo.cuotas_totales:
-            monto_cuota = prestamo.valor_cuota + prestamo.saldo_cuota
-            
-            if monto_restante >= monto_cuota:
-                # Paga la cuota completa
-                monto_restante -= monto_cuota
-                prestamo.cuotas_pagadas += 1
-                prestamo.saldo_cuota = 0.0
-            else:
-                # No alcanza para la cuota completa
-                prestamo.saldo_cuota = monto_cuota - monto_restante
-                monto_restante = 0
-                break
-        
-        # Si queda dinero sobrante en la última cuota
-        if monto_restante > 0:
-            prestamo.saldo_cuota = -monto_restante
-    
-    else:
-        # Pago de cuota o parcial: misma lógica
-        # Avanzar a siguiente cuota SIEMPRE
-        prestamo.cuotas_pagadas += 1
-        prestamo.saldo_cuota = diferencia
-    
-    # Actualizar saldo pendiente del préstamo
-    prestamo.saldo_pendiente -= pago.monto
-    
-    # Estados finales según cuotas y saldo
-    if prestamo.cuotas_pagadas >= prestamo.cuotas_totales:
-        prestamo.cuotas_pagadas = prestamo.cuotas_totales
-        if prestamo.saldo_pendiente <= 0:
-            prestamo.estado = "pagado"
-            prestamo.saldo_pendiente = max(0, prestamo.saldo_pendiente)
-            prestamo.saldo_cuota = 0.0
-        else:
-            # Terminó las cuotas pero quedó deuda: marcar como impago
-            prestamo.estado = "impago"
-            # El saldo_pendiente queda como deuda final
-    elif prestamo.saldo_pendiente <= 0:
-        # Saldo cubierto antes de agotar cuotas
-        prestamo.estado = "pagado"
-        prestamo.saldo_pendiente = 0.0
-        prestamo.saldo_cuota = 0.0
-    
-    db.commit()
-    db.refresh(db_pago)
+    db.flush()  # asigna db_pago.id para las referencias de los movimientos
+    aplicar_pago_en_cuotas(prestamo, pago.monto, pago.tipo_pago)
 
-    # Crear movimiento de caja automático (ingreso por pago)
-    cliente = db.query(Cliente).filter(Cliente.id == prestamo.cliente_id).first()
-    cliente_nombre = cliente.nombre if cliente else f"Cliente {prestamo.cliente_id}"
-    num_cuota = prestamo.cuotas_pagadas
-    
-    movimiento_caja = MovimientoCaja(
-        fecha=db_pago.fecha_pago,
-        tipo="ingreso",
-        categoria="pago",
-        descripcion=f"Cuota #{num_cuota} préstamo {db_pago.prestamo_id} - {cliente_nombre}",
-        monto=db_pago.monto,
-        referencia_tipo="pago",
-        referencia_id=db_pago.id,
-        usuario_id=None  # TODO: obtener del token
+    # Reflejar en el cronograma las cuotas cubiertas por este pago
+    actualizar_estado_cuotas(db, prestamo)
+    aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, prestamo.id, prestamo))
+
+    cobrador = db.query(Empleado).filter(Empleado.id == cobrador_id).first() if cobrador_id else None
+    prestamo_vendedor = db.query(PrestamoVendedor).filter(
+        PrestamoVendedor.prestamo_id == prestamo.id
+    ).first()
+    nuevos, comisiones = registros_de_pago(
+        db_pago, prestamo.cuotas_pagadas, prestamo.cliente_id, cobrador_id, cobrador_nombre, cobrador,
+        porcentaje_cobrador, getattr(current_user, 'role', None) == 'admin', prestamo_vendedor
     )
-    db.add(movimiento_caja)
+    for tipo, empleado_id, monto_comision in comisiones:
+        aplicar_comision(db, tipo, empleado_id, monto_comision)
+
+    db.add_all(nuevos)
+    # Sumar al cierre del día solo los movimientos de este pago
+    aplicar_movimientos_cierre(db, [r for r in nuevos if isinstance(r, MovimientoCaja)])
     db.commit()
+    db.refresh(db_pago)
 
-    # Movimiento empleado (ingreso por pago) si hay cobrador (explícito o automático)
-    if cobrador_id:
-        existe_emp_mov = db.query(CajaEmpleadoMovimiento).filter(
-            CajaEmpleadoMovimiento.empleado_id == cobrador_id,
-            CajaEmpleadoMovimiento.referencia_tipo == 'pago',
-            CajaEmpleadoMovimiento.referencia_id == db_pago.id,
-            CajaEmpleadoMovimiento.tipo == 'ingreso'
-        ).first()
-        if not existe_emp_mov:
-            mov_emp_ing = CajaEmpleadoMovimiento(
-                fecha=db_pago.fecha_pago,
-                empleado_id=cobrador_id,
-                tipo='ingreso',
-                categoria='pago',
-                descripcion=f"Pago #{db_pago.id} préstamo {db_pago.prestamo_id}",
-                monto=db_pago.monto,
-                referencia_tipo='pago',
-                referencia_id=db_pago.id
-            )
-            db.add(mov_emp_ing)
-            db.commit()
-    
-    # Actualizar totales del cierre del día
-    actualizar_totales_cierre(db, db_pago.fecha_pago)
-
-    # Crear registro de comisión del cobrador si corresponde (admin asigna inmediata) o placeholder (cobrador pendiente)
-    if cobrador_id:
-        empleado = db.query(Empleado).filter(Empleado.id == cobrador_id).first()
-        empleado_nombre_final = empleado.nombre if empleado else (cobrador_nombre or 'Cobrador')
-        if porcentaje_cobrador is not None and getattr(current_user, 'role', None) == 'admin':
+    invalidar_cache_metricas()
+    return db_pago
+
+
+MAX_PAGOS_LOTE = 500
+
+
+@router.post("/batch", response_model=PagoLoteResponse)
+def create_pagos_lote(pagos: List[PagoCreate], db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
+    """Registrar varios pagos de una vez (rendición de ruta del cobrador).
+
+    Cada pago se valida como en create_pago y se informa su resultado; los rechazados no
+    afectan al resto. Los aceptados se graban en una sola transacción con inserciones por lote.
+    """
+    if len(pagos) > MAX_PAGOS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_PAGOS_LOTE} pagos por lote")
+    if not pagos:
+        return {'procesados': 0, 'registrados': 0, 'rechazados': 0, 'resultados': []}
+
+    hoy = date.today()
+    rol = getattr(current_user, 'role', None)
+    es_admin = rol == 'admin'
+    cierre_hoy = get_or_create_cierre(db, hoy, commit=False)
+    if cierre_hoy.cerrado:
+        raise HTTPException(status_code=400, detail="El día está cerrado. Abre la caja para registrar pagos.")
+
+    # Precargar préstamos, vendedores y cobradores en pocas consultas
+    prestamo_ids = {p.prestamo_id for p in pagos}
+    prestamos = {p.id: p for p in db.query(Prestamo).filter(Prestamo.id.in_(prestamo_ids))}
+    vendedores = {}
+    for registro in db.query(PrestamoVendedor).filter(
+        PrestamoVendedor.prestamo_id.in_(prestamo_ids)
+    ).order_by(PrestamoVendedor.id):
+        vendedores.setdefault(registro.prestamo_id, registro)
+    if rol == 'cobrador' and current_user.empleado_id:
+        cobrador_ids = {current_user.empleado_id}
+    else:
+        cobrador_ids = {p.cobrador_id for p in pagos if p.cobrador_id}
+    cobradores = {e.id: e for e in db.query(Empleado).filter(Empleado.id.in_(cobrador_ids))} if cobrador_ids else {}
+    antes = snapshot_prestamos(db, prestamos)
+
+    resultados = [None] * len(pagos)
+    aceptados = []
+    for indice, pago in enumerate(pagos):
+        prestamo = prestamos.get(pago.prestamo_id)
+        if not prestamo:
+            resultados[indice] = {'indice': indice, 'ok': False, 'status_code': 404, 'error': "Préstamo no encontrado"}
+            continue
+        if rol == 'cobrador' and prestamo.id in vendedores:
+            resultados[indice] = {'indice': indice, 'ok': False, 'status_code': 403, 'error': "El cobrador solo puede cobrar préstamos creados por Admin (este préstamo tiene vendedor asociado)"}
+            continue
+        # El saldo ya refleja los pagos anteriores del mismo lote
+        if pago.monto > prestamo.saldo_pendiente:
+            resultados[indice] = {'indice': indice, 'ok': False, 'status_code': 400, 'error': f"El monto del pago (${pago.monto:.2f}) excede el saldo pendiente (${prestamo.saldo_pendiente:.2f})"}
+            continue
+
+        pago_data = pago.model_dump()
+        pago_data['fecha_pago'] = hoy  # Forzar fecha de hoy
+        cobrador_id = pago_data.pop('cobrador_id', None)
+        cobrador_nombre = pago_data.pop('cobrador_nombre', None)
+        porcentaje_cobrador = pago_data.pop('porcentaje_cobrador', None)
+        if rol == 'cobrador' and current_user.empleado_id:
+            cobrador_id = current_user.empleado_id
+            porcentaje_cobrador = None  # se aprobará luego por admin
+        if cobrador_id and porcentaje_cobrador is not None and es_admin:
             if porcentaje_cobrador < 0 or porcentaje_cobrador > 100:
-                raise HTTPException(status_code=400, detail="El porcentaje del cobrador debe estar entre 0 y 100")
-            porcentaje = float(porcentaje_cobrador)
-            monto_comision = round(float(pago.monto) * porcentaje / 100.0, 2)
-        else:
-            # pendiente aprobación
-            porcentaje = 0.0
-            monto_comision = 0.0
-        registro = PagoCobrador(
-            pago_id=db_pago.id,
-            empleado_id=cobrador_id,
-            empleado_nombre=empleado_nombre_final,
-            porcentaje=porcentaje,
-            monto_comision=monto_comision
-        )
-        db.add(registro)
-        db.commit()
-        if monto_comision > 0:
-            mov_comision_cobrador = MovimientoCaja(
-                fecha=db_pago.fecha_pago,
-                tipo="egreso",
-                categoria="comision",
-                descripcion=f"Comisión cobrador pago #{db_pago.id} préstamo {db_pago.prestamo_id}",
-                monto=monto_comision,
-                referencia_tipo="pago",
-                referencia_id=db_pago.id,
-                usuario_id=None
+                resultados[indice] = {'indice': indice, 'ok': False, 'status_code': 400, 'error': "El porcentaje del cobrador debe estar entre 0 y 100"}
+                continue
+
+        aplicar_pago_en_cuotas(prestamo, pago.monto, pago.tipo_pago)
+        aceptados.append((indice, Pago(**pago_data), prestamo, prestamo.cuotas_pagadas, cobrador_id, cobrador_nombre, porcentaje_cobrador))
+
+    if aceptados:
+        db.add_all([a[1] for a in aceptados])
+        db.flush()  # inserta los pagos por lote y asigna sus ids para las referencias
+        for prestamo in {a[2].id: a[2] for a in aceptados}.values():
+            actualizar_estado_cuotas(db, prestamo)
+        aplicar_cambios_prestamos(db, antes, snapshot_prestamos(db, prestamos))
+
+        nuevos = []
+        comisiones = {}
+        for indice, db_pago, prestamo, num_cuota, cobrador_id, cobrador_nombre, porcentaje_cobrador in aceptados:
+            registros, comisiones_pago = registros_de_pago(
+                db_pago, num_cuota, prestamo.cliente_id, cobrador_id, cobrador_nombre, cobradores.get(cobrador_id),
+                porcentaje_cobrador, es_admin, vendedores.get(prestamo.id)
             )
-            db.add(mov_comision_cobrador)
-            db.commit()
-            existe_emp_com = db.query(CajaEmpleadoMovimiento).filter(
-                CajaEmpleadoMovimiento.empleado_id == cobrador_id,
-                CajaEmpleadoMovimiento.referencia_tipo == 'pago',
-                CajaEmpleadoMovimiento.referencia_id == db_pago.id,
-                CajaEmpleadoMovimiento.tipo == 'egreso',
-                CajaEmpleadoMovimiento.categoria == 'comision'
-            ).first()
-            if not existe_emp_com:
-                mov_emp_com = CajaEmpleadoMovimiento(
-                    fecha=db_pago.fecha_pago,
-                    empleado_id=cobrador_id,
-                    tipo='egreso',
-                    categoria='comision',
-                    descripcion=f"Comisión cobrador pago #{db_pago.id}",
-                    monto=monto_comision,
-                    referencia_tipo='pago',
-                    referencia_id=db_pago.id
-                )
-                db.add(mov_emp_com)
-                db.commit()
-        actualizar_totales_cierre(db, db_pago.fecha_pago)
-
-    # Registrar comisión del vendedor si existe en el préstamo
-    prestamo_vendedor = db.query(PrestamoVendedor).filter(
-        PrestamoVendedor.prestamo_id == prestamo.id
-    ).first()
-    
-    if prestamo_vendedor and prestamo_vendedor.porcentaje > 0:
-        # Calcular comisión del vendedor sobre el monto del pago
-        porcentaje_vendedor = float(prestamo_vendedor.porcentaje)
-        monto_comision_vendedor = round(float(pago.monto) * porcentaje_vendedor / 100.0, 2)
-        
-        registro_vendedor = PagoVendedor(
-            pago_id=db_pago.id,
-            empleado_id=prestamo_vendedor.empleado_id,
-            empleado_nombre=prestamo_vendedor.empleado_nombre,
-            porcentaje=porcentaje_vendedor,
-            monto_comision=monto_comision_vendedor
-        )
-        db.add(registro_vendedor)
-        db.commit()
-        # Registrar movimiento de caja como egreso por comisión de vendedor
-        mov_comision_vendedor = MovimientoCaja(
-            fecha=db_pago.fecha_pago,
-            tipo="egreso",
-            categoria="comision",
-            descripcion=f"Comisión vendedor pago #{db_pago.id} préstamo {db_pago.prestamo_id}",
-            monto=monto_comision_vendedor,
-            referencia_tipo="pago",
-            referencia_id=db_pago.id,
-            usuario_id=None
-        )
-        db.add(mov_comision_vendedor)
+            nuevos.extend(registros)
+            for tipo, empleado_id, monto_comision in comisiones_pago:
+                comisiones[(tipo, empleado_id)] = comisiones.get((tipo, empleado_id), 0.0) + monto_comision
+        for (tipo, empleado_id), monto_comision in comisiones.items():
+            aplicar_comision(db, tipo, empleado_id, monto_comision)
+        db.add_all(nuevos)
+
+        # Deltas agrupados por día sobre los cierres afectados
+        aplicar_movimientos_cierre(db, [r for r in nuevos if isinstance(r, MovimientoCaja)])
+        for indice, db_pago, *_ in aceptados:
+            resultados[indice] = {'indice': indice, 'ok': True, 'status_code': 201, 'pago': PagoSchema.model_validate(db_pago)}
         db.commit()
-        actualizar_totales_cierre(db, db_pago.fecha_pago)
+        invalidar_cache_metricas()
 
-    return db_pago
+    registrados = len(aceptados)
+    return {
+        'procesados': len(pagos),
+        'registrados': registrados,
+        'rechazados': len(pagos) - registrados,
+        'resultados': resultados
+    }
 
 
 @router.get("/{pago_id}/cobrador", response_model=PagoCobradorSchema)
@@ -361,6 +309,8 @@ def aprobar_comision_cobrador(pago_id: int, datos: AprobarPagoCobrador, db: Sess
     if not empleado:
         raise HTTPException(status_code=404, detail="Empleado cobrador no encontrado")
     monto_comision = round(float(pago.monto) * porcentaje / 100.0, 2)
+    aplicar_comision(db, 'cobrador', registro.empleado_id, -(registro.monto_comision or 0.0))
+    aplicar_comision(db, 'cobrador', empleado.id, monto_comision)
     registro.empleado_id = empleado.id
     registro.empleado_nombre = empleado.nombre
     registro.porcentaje = porcentaje
@@ -376,9 +326,12 @@ def aprobar_comision_cobrador(pago_id: int, datos: AprobarPagoCobrador, db: Sess
         monto=monto_comision,
         referencia_tipo="pago",
         referencia_id=pago.id,
+        prestamo_id=pago.prestamo_id,
+        cliente_id=pago.prestamo.cliente_id if pago.prestamo else None,
         usuario_id=None
     )
     db.add(mov_comision_cobrador)
+    aplicar_movimientos_cierre(db, [mov_comision_cobrador])
     db.commit()
     mov_emp_com = CajaEmpleadoMovimiento(
         fecha=pago.fecha_pago,
@@ -392,7 +345,7 @@ def aprobar_comision_cobrador(pago_id: int, datos: AprobarPagoCobrador, db: Sess
     )
     db.add(mov_emp_com)
     db.commit()
-    actualizar_totales_cierre(db, pago.fecha_pago)
+    invalidar_cache_metricas()
     return registro
 
 
@@ -413,11 +366,16 @@ def delete_pago(pago_id: int, db: Session = Depends(get_db)):
     
     # Restaurar el saldo del préstamo
     prestamo = db.query(Prestamo).filter(Prestamo.id == db_pago.prestamo_id).first()
+    prestamo_id = db_pago.prestamo_id
+    antes = snapshot_prestamo(db, prestamo_id, prestamo)
     if prestamo:
         prestamo.saldo_pendiente += db_pago.monto
         if prestamo.estado == "pagado":
             prestamo.estado = "activo"
+        actualizar_estado_cuotas(db, prestamo)
     
     db.delete(db_pago)
+    aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, prestamo_id, prestamo))
     db.commit()
+    invalidar_cache_metricas()
     return None
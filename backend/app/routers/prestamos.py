@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import timedelta, date
-from app.database.database import get_db
-from app.models.models import Prestamo, Cliente, Empleado, PrestamoVendedor, MovimientoCaja, Usuario
-from app.schemas.schemas import Prestamo as PrestamoSchema, PrestamoCreate, PrestamoUpdate, RefinanciacionCreate, Cuota, PrestamoVendedor as PrestamoVendedorSchema, AprobarPrestamo
-from app.amortization_service import generar_amortizacion
-from app.caja_service import actualizar_totales_cierre, get_or_create_cierre
+from app.database.database import get_db, get_async_db
+from app.models.models import Prestamo, Cliente, Empleado, PrestamoVendedor, MovimientoCaja, Usuario, Cuota, Pago, PagoVendedor
+from app.schemas.schemas import Prestamo as PrestamoSchema, PrestamoCreate, PrestamoUpdate, RefinanciacionCreate, Cuota as CuotaSchema, PrestamoVendedor as PrestamoVendedorSchema, AprobarPrestamo, Pago as PagoSchema, PrestamoCompleto
+from app.amortization_service import generar_amortizacion, materializar_cuotas, actualizar_estado_cuotas
+from app.caja_service import aplicar_movimientos_cierre, get_or_create_cierre, desvincular_movimientos_prestamo
 from app.routers.auth import get_current_user
+from app.metrics_service import invalidar_cache_metricas
+from app.portfolio_stats_service import snapshot_prestamo, aplicar_cambio_prestamo
+from app.pagination_service import paginar, aplicar_encabezados, CursorInvalido, LIMITE_MAXIMO
+from app.scoping_service import filtro_prestamos, aplicar_alcance
 
 router = APIRouter()
 
@@ -26,47 +32,53 @@ def preview_vendedor(monto: float, tasa_interes: float, porcentaje: float, base:
     monto_comision = monto_base * (porcentaje / 100.0)
     return {"monto_base": round(monto_base, 2), "monto_comision": round(monto_comision, 2)}
 
-@router.get("/", response_model=List[PrestamoSchema])
-def get_prestamos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: Usuario = Depends(get_current_user)):
-    """Obtener préstamos según el rol del usuario"""
+def _listar_prestamos(db: Session, skip: int, limit: int, current_user: Usuario, cursor: Optional[str] = None,
+                      estado: Optional[str] = None, cliente_id: Optional[int] = None,
+                      desde: Optional[date] = None, hasta: Optional[date] = None, con_total: bool = False):
+    """Obtener préstamos según el rol del usuario, paginados por id (ver pagination_service)"""
     try:
-        # Si es admin, ve todos los préstamos
-        if current_user.role == 'admin':
-            prestamos = db.query(Prestamo).offset(skip).limit(limit).all()
-            return prestamos
-        
-        # Si es cobrador: puede ver (y luego cobrar) solo préstamos creados por admin
-        # Regla implementada: préstamos SIN registro en PrestamoVendedor (ningún vendedor asociado)
-        if current_user.role == 'cobrador':
-            from sqlalchemy import exists
-            # Subconsulta de IDs con vendedor
-            vendedores_subq = db.query(PrestamoVendedor.prestamo_id).distinct().subquery()
-            prestamos = db.query(Prestamo).filter(~Prestamo.id.in_(vendedores_subq)).offset(skip).limit(limit).all()
-            return prestamos
-        
-        # Si es vendedor, solo ve préstamos donde está asignado como vendedor
-        if not current_user.empleado_id:
-            return []
-        
-        # Obtener IDs de préstamos donde el usuario está asignado
-        prestamos_ids = db.query(PrestamoVendedor.prestamo_id).filter(
-            PrestamoVendedor.empleado_id == current_user.empleado_id
-        ).distinct().all()
-        
-        if not prestamos_ids:
-            return []
-        
-        prestamo_ids_list = [p[0] for p in prestamos_ids]
-        
-        prestamos = db.query(Prestamo).filter(
-            Prestamo.id.in_(prestamo_ids_list)
-        ).offset(skip).limit(limit).all()
-        
-        return prestamos
+        # Admin: todo; cobrador: préstamos sin vendedor; vendedor: los asignados (scoping_service)
+        q = aplicar_alcance(db.query(Prestamo), filtro_prestamos(current_user))
+
+        if estado:
+            q = q.filter(Prestamo.estado == estado)
+        if cliente_id:
+            q = q.filter(Prestamo.cliente_id == cliente_id)
+        if desde:
+            q = q.filter(Prestamo.fecha_inicio >= desde)
+        if hasta:
+            q = q.filter(Prestamo.fecha_inicio <= hasta)
+        return paginar(q, (Prestamo.id,), limit, cursor=cursor, skip=skip, con_total=con_total)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error en get_prestamos: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    prestamos = db.query(Prestamo).offset(skip).limit(limit).all()
+
+
+@router.get("/", response_model=List[PrestamoSchema])
+async def get_prestamos(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    estado: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    desde: Optional[date] = Query(None, description="fecha_inicio desde (incluida)"),
+    hasta: Optional[date] = Query(None, description="fecha_inicio hasta (incluida)"),
+    total: bool = Query(False, description="Informar X-Total-Aprox (conteo acotado)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Obtener préstamos según el rol del usuario.
+
+    Orden estable por id. La siguiente página se pide con `cursor` = encabezado X-Next-Cursor
+    (ausente en la última página); `skip` se mantiene para clientes que paginan por offset.
+    """
+    prestamos, siguiente, aprox = await db.run_sync(
+        _listar_prestamos, skip, limit, current_user, cursor, estado, cliente_id, desde, hasta, total
+    )
+    aplicar_encabezados(response, siguiente, aprox)
     return prestamos
 
 @router.get("/{prestamo_id}", response_model=PrestamoSchema)
@@ -132,28 +144,30 @@ def create_prestamo(prestamo: PrestamoCreate, db: Session = Depends(get_db), cur
     )
     
     db.add(db_prestamo)
+    db.flush()
+    # Persistir el cronograma de cuotas junto con el préstamo
+    materializar_cuotas(db, db_prestamo)
+    aplicar_cambio_prestamo(db, None, snapshot_prestamo(db, db_prestamo.id, db_prestamo))
     db.commit()
     db.refresh(db_prestamo)
 
-    # Crear movimiento de caja automático (egreso por desembolso)
-    cliente = db.query(Cliente).filter(Cliente.id == db_prestamo.cliente_id).first()
-    cliente_nombre = cliente.nombre if cliente else f"Cliente {db_prestamo.cliente_id}"
-    
+    # Crear movimiento de caja automático (egreso por desembolso). Sin descripción guardada:
+    # se arma al listar con el nombre del cliente
     movimiento_caja = MovimientoCaja(
         fecha=db_prestamo.fecha_inicio,
         tipo="egreso",
         categoria="prestamo",
-        descripcion=f"Desembolso préstamo #{db_prestamo.id} - {cliente_nombre}",
         monto=db_prestamo.monto,
         referencia_tipo="prestamo",
         referencia_id=db_prestamo.id,
+        prestamo_id=db_prestamo.id,
+        cliente_id=db_prestamo.cliente_id,
         usuario_id=None  # TODO: obtener del token
     )
     db.add(movimiento_caja)
+    # Sumar el desembolso a los totales del cierre del día
+    aplicar_movimientos_cierre(db, [movimiento_caja])
     db.commit()
-    
-    # Actualizar totales del cierre del día
-    actualizar_totales_cierre(db, db_prestamo.fecha_inicio)
 
     # Lógica de asignación vendedor:
     # 1. Si lo crea un admin y envía datos de comisión -> registrar
@@ -171,6 +185,7 @@ def create_prestamo(prestamo: PrestamoCreate, db: Session = Depends(get_db), cur
             monto_interes_calc = prestamo.monto * (prestamo.tasa_interes / 100)
             monto_base = (prestamo.monto + monto_interes_calc) if base_tipo == "total" else monto_interes_calc
             monto_comision = monto_base * (prestamo.vendedor_porcentaje / 100.0)
+            antes = snapshot_prestamo(db, db_prestamo.id, db_prestamo)
             registro = PrestamoVendedor(
                 prestamo_id=db_prestamo.id,
                 empleado_id=empleado.id,
@@ -181,6 +196,7 @@ def create_prestamo(prestamo: PrestamoCreate, db: Session = Depends(get_db), cur
                 monto_comision=monto_comision,
             )
             db.add(registro)
+            aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, db_prestamo.id, db_prestamo))
             db.commit()
         elif current_user.role == 'vendedor' and current_user.empleado_id:
             # Crear registro placeholder para filtrado
@@ -189,6 +205,7 @@ def create_prestamo(prestamo: PrestamoCreate, db: Session = Depends(get_db), cur
                 monto_interes_calc = prestamo.monto * (prestamo.tasa_interes / 100)
                 # base para cálculo futuro
                 monto_base = (prestamo.monto + monto_interes_calc)
+                antes = snapshot_prestamo(db, db_prestamo.id, db_prestamo)
                 registro = PrestamoVendedor(
                     prestamo_id=db_prestamo.id,
                     empleado_id=empleado.id,
@@ -199,10 +216,11 @@ def create_prestamo(prestamo: PrestamoCreate, db: Session = Depends(get_db), cur
                     monto_comision=0.0,
                 )
                 db.add(registro)
+                aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, db_prestamo.id, db_prestamo))
                 db.commit()
     except Exception as e:
         print(f"Error registrando comisión vendedor: {e}")
-    return db_prestamo
+    invalidar_cache_metricas()
     return db_prestamo
 
 @router.put("/{prestamo_id}", response_model=PrestamoSchema)
@@ -212,11 +230,16 @@ def update_prestamo(prestamo_id: int, prestamo: PrestamoUpdate, db: Session = De
     if not db_prestamo:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
     
+    antes = snapshot_prestamo(db, prestamo_id, db_prestamo)
     update_data = prestamo.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_prestamo, key, value)
     
+    if 'estado' in update_data:
+        actualizar_estado_cuotas(db, db_prestamo)
+    aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, prestamo_id, db_prestamo))
     db.commit()
+    invalidar_cache_metricas()
     db.refresh(db_prestamo)
     return db_prestamo
 
@@ -227,8 +250,13 @@ def delete_prestamo(prestamo_id: int, db: Session = Depends(get_db)):
     if not db_prestamo:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
     
+    antes = snapshot_prestamo(db, prestamo_id, db_prestamo)
+    db.query(Cuota).filter(Cuota.prestamo_id == prestamo_id).delete(synchronize_session=False)
+    desvincular_movimientos_prestamo(db, prestamo_id)
     db.delete(db_prestamo)
+    aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, prestamo_id, None))
     db.commit()
+    invalidar_cache_metricas()
     return None
 
 @router.post("/{prestamo_id}/refinanciar", response_model=PrestamoSchema, status_code=status.HTTP_201_CREATED)
@@ -279,22 +307,30 @@ def refinanciar_prestamo(prestamo_id: int, params: RefinanciacionCreate, db: Ses
     )
 
     db.add(nuevo)
+    db.flush()
+    materializar_cuotas(db, nuevo)
+    aplicar_cambio_prestamo(db, None, snapshot_prestamo(db, nuevo.id, nuevo))
 
     # Actualizar préstamo original a 'refinanciado'
+    antes = snapshot_prestamo(db, db_prestamo.id, db_prestamo)
     db_prestamo.estado = "refinanciado"
+    aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, db_prestamo.id, db_prestamo))
     db.commit()
+    invalidar_cache_metricas()
     db.refresh(nuevo)
     return nuevo
 
 
-@router.get("/{prestamo_id}/amortizacion", response_model=List[Cuota])
-def get_amortizacion(prestamo_id: int, db: Session = Depends(get_db)):
-    """Obtener la tabla de amortización de un préstamo"""
+@router.get("/{prestamo_id}/amortizacion", response_model=List[CuotaSchema])
+def get_amortizacion(prestamo_id: int, desde: Optional[date] = None, hasta: Optional[date] = None, db: Session = Depends(get_db)):
+    """Obtener la tabla de amortización de un préstamo.
+    Con desde/hasta (YYYY-MM-DD) devuelve solo las cuotas que vencen en ese rango.
+    """
     prestamo = db.query(Prestamo).filter(Prestamo.id == prestamo_id).first()
     if not prestamo:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
     
-    cuotas = generar_amortizacion(prestamo, db)
+    cuotas = generar_amortizacion(prestamo, db, desde, hasta)
     return cuotas
 
 
@@ -316,6 +352,7 @@ def aprobar_prestamo(prestamo_id: int, datos: AprobarPrestamo, db: Session = Dep
     if prestamo.estado != 'pendiente':
         # permitir re-aprobar para ajustar comisión
         pass
+    antes = snapshot_prestamo(db, prestamo_id, prestamo)
 
     # Determinar empleado vendedor
     empleado_id = datos.vendedor_empleado_id
@@ -362,17 +399,13 @@ def aprobar_prestamo(prestamo_id: int, datos: AprobarPrestamo, db: Session = Dep
 
     # Cambiar estado a activo
     prestamo.estado = 'activo'
+    aplicar_cambio_prestamo(db, antes, snapshot_prestamo(db, prestamo_id, prestamo))
     db.commit()
+    invalidar_cache_metricas()
     db.refresh(prestamo)
     return prestamo
 
-@router.get("/{prestamo_id}/vendedor/resumen")
-def resumen_comision_vendedor(prestamo_id: int, db: Session = Depends(get_db)):
-    """Resumen de comisión del vendedor para un préstamo: total pactado, pagado y restante."""
-    prestamo = db.query(Prestamo).filter(Prestamo.id == prestamo_id).first()
-    if not prestamo:
-        raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-    registro = db.query(PrestamoVendedor).filter(PrestamoVendedor.prestamo_id == prestamo_id).first()
+def _resumen_comision_vendedor(prestamo_id: int, registro: Optional[PrestamoVendedor], pagado: float) -> dict:
     total_pactado = 0.0
     porcentaje = 0.0
     base_tipo = None
@@ -380,8 +413,6 @@ def resumen_comision_vendedor(prestamo_id: int, db: Session = Depends(get_db)):
         total_pactado = float(registro.monto_comision or 0.0)
         porcentaje = float(registro.porcentaje or 0.0)
         base_tipo = registro.base_tipo
-    from sqlalchemy import func
-    pagado = db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).join(Pago, PagoVendedor.pago_id == Pago.id).filter(Pago.prestamo_id == prestamo_id).scalar() or 0.0
     restante = max(total_pactado - pagado, 0.0)
     return {
         'prestamo_id': prestamo_id,
@@ -391,3 +422,54 @@ def resumen_comision_vendedor(prestamo_id: int, db: Session = Depends(get_db)):
         'total_pagado': round(pagado, 2),
         'restante': round(restante, 2)
     }
+
+@router.get("/{prestamo_id}/vendedor/resumen")
+def resumen_comision_vendedor(prestamo_id: int, db: Session = Depends(get_db)):
+    """Resumen de comisión del vendedor para un préstamo: total pactado, pagado y restante."""
+    prestamo = db.query(Prestamo).filter(Prestamo.id == prestamo_id).first()
+    if not prestamo:
+        raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+    registro = db.query(PrestamoVendedor).filter(PrestamoVendedor.prestamo_id == prestamo_id).first()
+    pagado = db.query(func.coalesce(func.sum(PagoVendedor.monto_comision), 0)).join(Pago, PagoVendedor.pago_id == Pago.id).filter(Pago.prestamo_id == prestamo_id).scalar() or 0.0
+    return _resumen_comision_vendedor(prestamo_id, registro, pagado)
+
+
+def _prestamo_completo(db: Session, prestamo_id: int, current_user: Usuario) -> dict:
+    """Préstamo con cliente, cronograma, pagos (con sus comisiones) y vendedor en un número
+    fijo de consultas: el préstamo con su cliente en un JOIN y cada colección con un
+    SELECT ... WHERE prestamo_id/pago_id IN (...) (selectinload), sin importar cuántos pagos haya."""
+    q = aplicar_alcance(db.query(Prestamo), filtro_prestamos(current_user)).options(
+        joinedload(Prestamo.cliente),
+        selectinload(Prestamo.cuotas),
+        selectinload(Prestamo.pagos).selectinload(Pago.comisiones_cobrador),
+        selectinload(Prestamo.pagos).selectinload(Pago.comisiones_vendedor),
+        selectinload(Prestamo.vendedores).joinedload(PrestamoVendedor.empleado),
+    )
+    prestamo = q.filter(Prestamo.id == prestamo_id).first()
+    if not prestamo:
+        raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+
+    pagos = sorted(prestamo.pagos, key=lambda p: p.id)
+    registro = prestamo.vendedores[0] if prestamo.vendedores else None
+    pagado_vendedor = sum(float(c.monto_comision or 0.0) for p in pagos for c in p.comisiones_vendedor)
+    return {
+        'prestamo': prestamo,
+        'cliente': prestamo.cliente,
+        'amortizacion': generar_amortizacion(prestamo, db, cuotas=prestamo.cuotas),
+        'pagos': [
+            {
+                **PagoSchema.model_validate(p).model_dump(),
+                'cobrador': p.comisiones_cobrador[0] if p.comisiones_cobrador else None,
+                'vendedor': p.comisiones_vendedor[0] if p.comisiones_vendedor else None,
+            }
+            for p in pagos
+        ],
+        'vendedor': registro,
+        'comision_vendedor': _resumen_comision_vendedor(prestamo_id, registro, pagado_vendedor),
+    }
+
+@router.get("/{prestamo_id}/full", response_model=PrestamoCompleto)
+async def get_prestamo_completo(prestamo_id: int, db: AsyncSession = Depends(get_async_db), current_user: Usuario = Depends(get_current_user)):
+    """Detalle completo para DetallePrestamo: préstamo, cliente, amortización, pagos con
+    comisiones de cobrador/vendedor, vendedor asignado y resumen de su comisión."""
+    return await db.run_sync(_prestamo_completo, prestamo_id, current_user)
@@ -117,6 +117,19 @@ class Pago(PagoBase):
     class Config:
         from_attributes = True
 
+class PagoLoteResultado(BaseModel):
+    indice: int  # posición del pago en la lista enviada
+    ok: bool
+    status_code: int
+    pago: Optional[Pago] = None
+    error: Optional[str] = None
+
+class PagoLoteResponse(BaseModel):
+    procesados: int
+    registrados: int
+    rechazados: int
+    resultados: List[PagoLoteResultado]
+
 
 # ===== EMPLEADOS =====
 class EmpleadoBase(BaseModel):
@@ -255,6 +268,9 @@ class MovimientoCajaBase(BaseModel):
     descripcion: Optional[str] = None
     referencia_tipo: Optional[str] = None  # prestamo | pago | manual
     referencia_id: Optional[int] = None
+    prestamo_id: Optional[int] = None
+    cliente_id: Optional[int] = None
+    cuota_numero: Optional[int] = None
     usuario_id: Optional[int] = None
 
 class MovimientoCajaCreate(MovimientoCajaBase):
@@ -364,3 +380,28 @@ class CajaEmpleadoCerrarRequest(BaseModel):
 
 class CajaEmpleadoAbrirRequest(BaseModel):
     fecha: date
+
+
+# ===== DETALLE COMPLETO DE PRÉSTAMO =====
+class PagoDetalle(Pago):
+    cobrador: Optional[PagoCobrador] = None  # primer registro de comisión de cobrador
+    vendedor: Optional[PagoVendedor] = None  # primer registro de comisión de vendedor
+
+class PrestamoVendedorDetalle(PrestamoVendedor):
+    empleado: Optional[Empleado] = None
+
+class ResumenComisionVendedor(BaseModel):
+    prestamo_id: int
+    porcentaje: float
+    base_tipo: Optional[str] = None
+    total_pactado: float
+    total_pagado: float
+    restante: float
+
+class PrestamoCompleto(BaseModel):
+    prestamo: Prestamo
+    cliente: Cliente
+    amortizacion: List[Cuota]
+    pagos: List[PagoDetalle]
+    vendedor: Optional[PrestamoVendedorDetalle] = None
+    comision_vendedor: ResumenComisionVendedor
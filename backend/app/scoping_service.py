@@ -0,0 +1,67 @@
+from typing import Optional
+from sqlalchemy import exists, false, select
+from sqlalchemy.orm import Session
+from app.models.models import Prestamo, Pago, PagoCobrador, PrestamoVendedor, Cliente
+
+
+# === ALCANCE POR ROL ===
+# Criterios SQL componibles (para .filter()) con lo que cada rol puede ver. Son subconsultas
+# que resuelve la base: nunca se cargan los ids a Python para devolverlos como IN (?, ?, ...),
+# que con miles de préstamos arma sentencias enormes y supera el límite de variables de SQLite.
+#
+# - vendedor: IN (SELECT prestamo_id FROM prestamos_vendedores WHERE empleado_id = ?). SQLite
+#   recorre solo las filas del vendedor en ix_prestamos_vendedores_empleado_prestamo y busca
+#   cada préstamo por PK; un EXISTS correlacionado recorrería todos los préstamos.
+# - cobrador: NOT EXISTS correlacionado (préstamos sin vendedor, creados por admin).
+# - admin: sin filtro (None).
+
+
+def prestamos_del_vendedor(empleado_id: int):
+    """Select de los ids de préstamo asignados al vendedor."""
+    return select(PrestamoVendedor.prestamo_id).where(PrestamoVendedor.empleado_id == empleado_id)
+
+
+def sin_vendedor(prestamo_id_col=Prestamo.id):
+    """Préstamos sin registro en prestamos_vendedores (los que gestiona el admin)."""
+    return ~exists().where(PrestamoVendedor.prestamo_id == prestamo_id_col)
+
+
+def vendedor_tiene_prestamos(db: Session, empleado_id: int) -> bool:
+    return bool(db.query(exists().where(PrestamoVendedor.empleado_id == empleado_id)).scalar())
+
+
+def filtro_prestamos(usuario, prestamo_id_col=Prestamo.id):
+    """Criterio sobre una columna de id de préstamo (Prestamo.id, Pago.prestamo_id, Cuota.prestamo_id)."""
+    if usuario.role == 'admin':
+        return None
+    if usuario.role == 'cobrador':
+        return sin_vendedor(prestamo_id_col)
+    if not usuario.empleado_id:
+        return false()
+    return prestamo_id_col.in_(prestamos_del_vendedor(usuario.empleado_id))
+
+
+def filtro_pagos(usuario):
+    """Pagos visibles: el vendedor ve los de sus préstamos; el cobrador, los que registró."""
+    if usuario.role == 'admin':
+        return None
+    if not usuario.empleado_id:
+        return false()
+    if usuario.role == 'vendedor':
+        return Pago.prestamo_id.in_(prestamos_del_vendedor(usuario.empleado_id))
+    if usuario.role == 'cobrador':
+        return Pago.id.in_(select(PagoCobrador.pago_id).where(PagoCobrador.empleado_id == usuario.empleado_id))
+    return false()
+
+
+def filtro_clientes(usuario):
+    """Clientes con algún préstamo dentro del alcance del usuario."""
+    criterio = filtro_prestamos(usuario)
+    if criterio is None:
+        return None
+    return Cliente.id.in_(select(Prestamo.cliente_id).where(criterio))
+
+
+def aplicar_alcance(q, criterio: Optional[object]):
+    """q.filter(criterio) salvo para admin (criterio None)."""
+    return q if criterio is None else q.filter(criterio)
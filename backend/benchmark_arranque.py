@@ -0,0 +1,154 @@
+"""
+Benchmark de arranque en frío: tiempo hasta que la API responde /health con bases de
+distinto tamaño y las migraciones de datos ya aplicadas (app/migraciones_service.py).
+
+Cada medición es un proceso nuevo (import de main + startup + primer request), como un
+worker recién levantado. Para comparar, mide también la secuencia que antes corría en cada
+arranque (init_backfill: reconciliar cierres, autocerrar, backfill de caja de empleados,
+cuotas y contadores; la normalización de descripciones ya no existe), que crece con el historial.
+
+Verifica que el arranque no crezca con el tamaño de las tablas: el de la base más grande
+debe quedar dentro de un margen del de la base vacía. Sale con código 1 si no.
+
+Uso:
+    python benchmark_arranque.py
+    python benchmark_arranque.py --pagos 0,20000,100000 --sin-anterior
+"""
+import os
+import sys
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+from utilidades_bench import arg
+
+
+TAMANOS = [int(n) for n in arg("--pagos", "0,5000,20000").split(",")]
+REPETICIONES = arg("--repeticiones", 3)
+MARGEN_RELATIVO = arg("--margen", 0.25)  # el arranque más grande puede ser hasta 25% más lento
+MARGEN_ABSOLUTO_S = 0.2                  # más un margen fijo por ruido del sistema
+MEDIR_ANTERIOR = "--sin-anterior" not in sys.argv
+
+ARRANQUE = """
+import time
+inicio = time.perf_counter()
+from fastapi.testclient import TestClient
+import main
+with TestClient(main.app) as c:
+    assert c.get("/health").status_code == 200
+    print(time.perf_counter() - inicio)
+"""
+
+
+def poblar(db_path: str, n_pagos: int):
+    """Base con clientes, préstamos, pagos con cobrador, movimientos de caja y cierres."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from sqlalchemy import create_engine, insert
+    from app.models.models import (Base, Cliente, Empleado, Prestamo, Pago, PagoCobrador, MovimientoCaja,
+                                   CajaCierre, CajaEmpleadoMovimiento)
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    hoy = date.today()
+    n_prestamos = max(1, n_pagos // 8)
+    n_dias = 365
+    with engine.begin() as conn:
+        conn.execute(insert(Empleado), [{"nombre": "Cobrador", "puesto": "Cobrador"}])
+        if n_pagos:
+            conn.execute(insert(Cliente), [{"nombre": f"Cliente {i}", "telefono": "1"} for i in range(n_prestamos // 2 + 1)])
+            conn.execute(insert(Prestamo), [{
+                "cliente_id": 1 + i // 2, "monto": 1000, "tasa_interes": 10, "plazo_dias": 70,
+                "fecha_inicio": hoy - timedelta(days=i % n_dias), "fecha_vencimiento": hoy + timedelta(days=10),
+                "monto_total": 1100, "saldo_pendiente": 550, "estado": "activo", "cuotas_totales": 10,
+                "valor_cuota": 110, "frecuencia_pago": "semanal",
+            } for i in range(n_prestamos)])
+            conn.execute(insert(Pago), [{
+                "prestamo_id": 1 + i % n_prestamos, "monto": 110, "fecha_pago": hoy - timedelta(days=i % n_dias),
+                "tipo_pago": "cuota",
+            } for i in range(n_pagos)])
+            conn.execute(insert(PagoCobrador), [{
+                "pago_id": i + 1, "empleado_id": 1, "empleado_nombre": "Cobrador", "porcentaje": 3, "monto_comision": 3.3,
+            } for i in range(n_pagos)])
+            conn.execute(insert(MovimientoCaja), [{
+                "fecha": hoy - timedelta(days=i % n_dias), "tipo": "egreso", "categoria": "prestamo", "monto": 1000,
+                "descripcion": f"Desembolso préstamo #{i + 1} - Cliente {i // 2}", "referencia_tipo": "prestamo",
+                "referencia_id": i + 1,
+            } for i in range(n_prestamos)] + [{
+                "fecha": hoy - timedelta(days=i % n_dias), "tipo": "ingreso", "categoria": "pago", "monto": 110,
+                "descripcion": f"Pago #{i + 1} préstamo {1 + i % n_prestamos}", "referencia_tipo": "pago",
+                "referencia_id": i + 1,
+            } for i in range(n_pagos)])
+            conn.execute(insert(CajaEmpleadoMovimiento), [{
+                "fecha": hoy - timedelta(days=i % n_dias), "empleado_id": 1, "tipo": tipo, "categoria": categoria,
+                "monto": monto, "referencia_tipo": "pago", "referencia_id": i + 1,
+            } for i in range(n_pagos) for tipo, categoria, monto in (("ingreso", "pago", 110), ("egreso", "comision", 3.3))])
+            conn.execute(insert(CajaCierre), [{
+                "fecha": hoy - timedelta(days=d), "saldo_inicial": 0, "ingresos": 0, "egresos": 0, "saldo_esperado": 0,
+                "cerrado": True, "created_at": datetime.utcnow(),
+            } for d in range(1, n_dias + 1)])
+    engine.dispose()
+
+
+def preparar(db_path: str) -> float:
+    """Aplica las migraciones (una vez) y devuelve lo que tarda la secuencia del arranque anterior."""
+    codigo = f"""
+import os, time
+os.environ["DATABASE_URL"] = "sqlite:///{db_path}"
+from app.database.database import SessionLocal
+from app.caja_service import reconciliar_cierres, autocerrar_dias_pendientes, backfill_caja_empleado_movimientos
+from app.amortization_service import backfill_cuotas
+from app.portfolio_stats_service import asegurar_portfolio_stats
+from app.migraciones_service import aplicar_migraciones
+
+def init_backfill_anterior():
+    db = SessionLocal()
+    try:
+        reconciliar_cierres(db)
+        autocerrar_dias_pendientes(db)
+        backfill_caja_empleado_movimientos(db)
+        backfill_cuotas(db)
+        asegurar_portfolio_stats(db)
+    finally:
+        db.close()
+
+aplicar_migraciones(SessionLocal, log=lambda *_: None)
+duracion = 0.0
+if {MEDIR_ANTERIOR}:
+    inicio = time.perf_counter()
+    init_backfill_anterior()
+    duracion = time.perf_counter() - inicio
+print(duracion)
+"""
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def medir_arranque(db_path: str) -> float:
+    entorno = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", MANTENIMIENTO_DEMORA_SEG="3600")
+    tiempos = []
+    for _ in range(REPETICIONES):
+        salida = subprocess.run([sys.executable, "-c", ARRANQUE], capture_output=True, text=True, check=True, env=entorno)
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]))
+    return min(tiempos)
+
+
+def benchmark() -> bool:
+    print(f"Arranque en frío (mejor de {REPETICIONES}), migraciones ya aplicadas\n")
+    print(f"{'pagos':>10}{'arranque (s)':>15}{'init_backfill anterior (s)':>30}")
+    resultados = []
+    for n in TAMANOS:
+        with tempfile.TemporaryDirectory() as carpeta:
+            db_path = os.path.join(carpeta, "bench.db")
+            poblar(db_path, n)
+            anterior = preparar(db_path)
+            arranque = medir_arranque(db_path)
+        resultados.append(arranque)
+        print(f"{n:>10}{arranque:>15.2f}{(f'{anterior:.2f}' if MEDIR_ANTERIOR else '-'):>30}")
+
+    base, mayor = resultados[0], max(resultados)
+    limite = base * (1 + MARGEN_RELATIVO) + MARGEN_ABSOLUTO_S
+    ok = mayor <= limite
+    print(f"\n{'✓' if ok else '✗'} Arranque máximo {mayor:.2f} s (límite {limite:.2f} s sobre {base:.2f} s de la base más chica)")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark() else 1)
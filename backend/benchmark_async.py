@@ -0,0 +1,164 @@
+"""
+Prueba de carga del camino async (get_async_db + run_sync) contra el síncrono (get_db en el
+threadpool de Starlette) para el mismo servicio de lectura.
+
+Cada consulta agrega una espera simulada dentro de la base (función SQL espera(ms)) para
+emular la latencia de red de MySQL/PostgreSQL. Con el camino síncrono, cada request en
+espera ocupa un hilo del threadpool (40 por defecto), así que la concurrencia efectiva se
+corta ahí; con el camino async la espera no ocupa hilos y el límite pasa a ser el pool.
+Con pocos núcleos el costo de CPU por request acota a ambos caminos: la diferencia se ve
+cuando domina la espera (latencias altas o muchas consultas lentas a la vez).
+
+Todas las rutas autentican con get_current_user, sin caché de principales (AUTH_CACHE_MAX=0,
+como con la caché fría), y la búsqueda en usuarios también espera: la tabla se reemplaza por
+una vista que llama a espera(ms) por fila leída. La columna "async, auth def" usa la
+dependencia síncrona anterior (SessionLocal en el threadpool) delante del endpoint async.
+
+Uso:
+    python benchmark_async.py
+    python benchmark_async.py --concurrencia 200 --requests 1000 --latencia-ms 50
+"""
+import os
+import time
+import asyncio
+from utilidades_bench import arg, base_temporal
+
+
+CONCURRENCIA = arg("--concurrencia", 200)
+REQUESTS = arg("--requests", 800)
+LATENCIA_MS = arg("--latencia-ms", 250)
+HILOS = arg("--hilos", 40)
+
+base_temporal()
+os.environ.setdefault("DB_PROFILE", "produccion")
+# Pool holgado para que el límite medido sea el threadpool y no las conexiones
+os.environ.setdefault("DB_POOL_SIZE", str(CONCURRENCIA))
+os.environ["METRICS_CACHE_MAX"] = "0"
+os.environ["AUTH_CACHE_MAX"] = "0"
+
+import anyio
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.database import engine, async_engine, get_db, get_async_db, SessionLocal
+from app.models.models import Base, Usuario
+from app.metrics_service import get_due_next
+from app.auth_service import cargar_principal
+from app.routers.auth import get_current_user, oauth2_scheme, create_access_token, SECRET_KEY, ALGORITHM
+from jose import jwt
+
+en_curso = {"actual": 0, "pico": 0}
+
+
+def _registrar_espera(dbapi_connection, connection_record):
+    dbapi_connection.create_function("espera", 1, lambda ms: time.sleep(ms / 1000) or 0)
+
+
+event.listen(engine, "connect", _registrar_espera)
+event.listen(async_engine.sync_engine, "connect", _registrar_espera)
+
+
+def consulta(db: Session):
+    """Lectura real (cuotas próximas) precedida de la latencia simulada."""
+    en_curso["actual"] += 1
+    en_curso["pico"] = max(en_curso["pico"], en_curso["actual"])
+    try:
+        db.execute(text("SELECT espera(:ms)"), {"ms": LATENCIA_MS})
+        return get_due_next(db, 7)
+    finally:
+        en_curso["actual"] -= 1
+
+
+def get_current_user_def(token: str = Depends(oauth2_scheme)):
+    """Dependencia anterior: `def`, así que Starlette la corre en el threadpool."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    db = SessionLocal()
+    try:
+        return cargar_principal(db, payload["sub"], payload.get("ver", 0))
+    finally:
+        db.close()
+
+
+app = FastAPI()
+
+
+@app.get("/sync")
+def lectura_sync(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    return consulta(db)
+
+
+@app.get("/async-auth-def")
+async def lectura_async_auth_def(db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user_def)):
+    return await db.run_sync(consulta)
+
+
+@app.get("/async")
+async def lectura_async(db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user)):
+    return await db.run_sync(consulta)
+
+
+def preparar_base():
+    """Un usuario y la vista usuarios que espera LATENCIA_MS por fila leída."""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(Usuario.__table__.insert().values(username="bench", hashed_password="-", nombre_completo="Bench",
+                                                       role="admin", token_version=0))
+        conn.execute(text("ALTER TABLE usuarios RENAME TO usuarios_base"))
+        columnas = [c.name for c in Usuario.__table__.columns if c.name != "token_version"]
+        conn.execute(text(f"CREATE VIEW usuarios AS SELECT {', '.join(columnas)}, "
+                          f"token_version + espera({LATENCIA_MS}) AS token_version FROM usuarios_base"))
+    token = create_access_token({"sub": "bench", "uid": 1, "role": "admin", "empleado_id": None, "ver": 0})
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def cargar(ruta, cabeceras):
+    en_curso["pico"] = 0
+    latencias = []
+    semaforo = asyncio.Semaphore(CONCURRENCIA)
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        async def uno():
+            async with semaforo:
+                inicio = time.perf_counter()
+                r = await cliente.get(ruta, headers=cabeceras)
+                r.raise_for_status()
+                latencias.append(time.perf_counter() - inicio)
+
+        await cliente.get(ruta, headers=cabeceras)  # calentar conexiones
+        inicio = time.perf_counter()
+        await asyncio.gather(*(uno() for _ in range(REQUESTS)))
+        total = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        "req_s": REQUESTS / total,
+        "p50_ms": latencias[len(latencias) // 2] * 1000,
+        "p99_ms": latencias[int(len(latencias) * 0.99)] * 1000,
+        "pico": en_curso["pico"],
+    }
+
+
+async def benchmark():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = HILOS
+    cabeceras = preparar_base()
+    print(f"{REQUESTS} requests, concurrencia {CONCURRENCIA}, latencia simulada {LATENCIA_MS} ms, "
+          f"threadpool {HILOS} hilos\n")
+    rutas = {"sync": "/sync", "async, auth def": "/async-auth-def", "async": "/async"}
+    resultados = {modo: await cargar(ruta, cabeceras) for modo, ruta in rutas.items()}
+    print(f"{'':26}" + "".join(f"{modo:>17}" for modo in rutas))
+    for clave, titulo in (
+        ("req_s", "requests/s"),
+        ("p50_ms", "p50 (ms)"),
+        ("p99_ms", "p99 (ms)"),
+        ("pico", "consultas en paralelo"),
+    ):
+        print(f"{titulo:26}" + "".join(f"{resultados[modo][clave]:>17.1f}" for modo in rutas))
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(benchmark())
+    finally:
+        engine.dispose()
@@ -0,0 +1,129 @@
+"""
+Microbenchmark del costo de autenticación por request (get_current_user) en tres modos:
+
+- sin caché: decodifica el JWT y consulta usuarios en cada request (AUTH_CACHE_MAX=0)
+- caché: principal cacheado por (sub, versión de token) (AUTH_CACHE_MAX por defecto)
+- claims: requests GET confían en los claims firmados (AUTH_TRUST_CLAIMS=true)
+
+Cada modo corre en un proceso aparte sobre una base temporal nueva. Se mide un endpoint
+GET trivial con y sin la dependencia; la diferencia es el costo de autenticar.
+
+Uso:
+    python benchmark_auth.py
+    python benchmark_auth.py --requests 5000 --usuarios 20
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from utilidades_bench import arg
+
+
+REQUESTS = arg("--requests", 3000)
+USUARIOS = arg("--usuarios", 10)
+
+MODOS = {
+    "sin caché": {"AUTH_CACHE_MAX": "0", "AUTH_TRUST_CLAIMS": "false"},
+    "caché": {"AUTH_TRUST_CLAIMS": "false"},
+    "claims": {"AUTH_TRUST_CLAIMS": "true"},
+}
+
+
+def medir():
+    """Corre dentro del proceso hijo, con DATABASE_URL y AUTH_* ya definidos."""
+    from fastapi import Depends, FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.database.database import SessionLocal, engine, async_engine
+    from app.models.models import Base, Usuario
+    from app.routers.auth import router, get_current_user, get_password_hash
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    hashed = get_password_hash("x")
+    db.add_all([
+        Usuario(username=f"u{i}", hashed_password=hashed, nombre_completo=f"Usuario {i}", role="admin")
+        for i in range(USUARIOS)
+    ])
+    db.commit()
+    db.close()
+
+    consultas = {"usuarios": 0}
+
+    def _contar(conn, cursor, statement, parameters, context, executemany):
+        if "FROM usuarios" in statement:
+            consultas["usuarios"] += 1
+
+    # get_current_user consulta por la sesión async; el login, por la síncrona
+    event.listen(engine, "before_cursor_execute", _contar)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _contar)
+
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.get("/libre")
+    def libre():
+        return {"ok": True}
+
+    @app.get("/autenticado")
+    def autenticado(current_user=Depends(get_current_user)):
+        return {"ok": True}
+
+    cliente = TestClient(app)
+    tokens = []
+    for i in range(USUARIOS):
+        r = cliente.post("/api/auth/login", data={"username": f"u{i}", "password": "x"})
+        r.raise_for_status()
+        tokens.append({"Authorization": "Bearer " + r.json()["access_token"]})
+
+    def correr(ruta):
+        for i in range(50):  # calentar
+            cliente.get(ruta, headers=tokens[i % USUARIOS])
+        consultas["usuarios"] = 0
+        inicio = time.perf_counter()
+        for i in range(REQUESTS):
+            r = cliente.get(ruta, headers=tokens[i % USUARIOS])
+            assert r.status_code == 200, r.text
+        return (time.perf_counter() - inicio) / REQUESTS * 1e6, consultas["usuarios"] / REQUESTS
+
+    libre_us, _ = correr("/libre")
+    auth_us, por_request = correr("/autenticado")
+    print(json.dumps({
+        "us_request": auth_us,
+        "us_auth": auth_us - libre_us,
+        "consultas_request": por_request,
+    }))
+
+
+def correr_modo(variables):
+    with tempfile.TemporaryDirectory() as carpeta:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{carpeta}/bench.db", **variables)
+        salida = subprocess.run(
+            [sys.executable, __file__, "--interno"] + sys.argv[1:],
+            env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if salida.returncode != 0:
+            print(salida.stderr)
+            raise SystemExit("✗ Falló el benchmark")
+        return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def benchmark():
+    print(f"{REQUESTS} requests GET, {USUARIOS} usuarios\n")
+    resultados = {modo: correr_modo(variables) for modo, variables in MODOS.items()}
+    print(f"{'':28}" + "".join(f"{modo:>12}" for modo in MODOS))
+    for clave, titulo, formato in (
+        ("us_request", "µs por request", ".0f"),
+        ("us_auth", "µs de autenticación", ".0f"),
+        ("consultas_request", "consultas usuarios/request", ".2f"),
+    ):
+        print(f"{titulo:28}" + "".join(f"{resultados[modo][clave]:>12{formato}}" for modo in MODOS))
+
+
+if __name__ == "__main__":
+    if "--interno" in sys.argv:
+        medir()
+    else:
+        benchmark()
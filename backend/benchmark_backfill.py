@@ -0,0 +1,129 @@
+"""
+Benchmark de los backfills de caja al restaurar un dump sin movimientos: el recorrido por
+registro anterior (consultas de préstamo/cliente por pago y dos chequeos de existencia por
+pago en la caja de empleados) contra los INSERT ... SELECT por lotes de app/caja_service.py.
+
+El enfoque anterior se mide sobre una muestra (--muestra pagos) y se extrapola; el actual
+corre sobre la base completa.
+
+Uso:
+    python benchmark_backfill.py
+    python benchmark_backfill.py --pagos 1000000 --lote 100000
+"""
+import sys
+import time
+from datetime import date, timedelta
+from utilidades_bench import arg, base_temporal
+
+
+PAGOS = arg("--pagos", 200000)
+MUESTRA = arg("--muestra", 2000)
+LOTE = arg("--lote", 50000)
+
+base_temporal()
+
+from sqlalchemy import insert
+from app.database.database import SessionLocal, engine
+from app.models.models import (Base, Cliente, Empleado, Prestamo, Pago, PagoCobrador, MovimientoCaja,
+                               CajaEmpleadoMovimiento)
+from app.caja_service import backfill_caja_movimientos, backfill_caja_empleado_movimientos
+from app.backfill_service import progreso_log
+
+BLOQUE = 100000
+
+
+def poblar(n_pagos: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    hoy = date.today()
+    n_prestamos = max(1, n_pagos // 10)
+    n_clientes = max(1, n_prestamos // 2)
+    with engine.begin() as conn:
+        conn.execute(insert(Empleado), [{"nombre": "Cobrador", "puesto": "Cobrador"}])
+        conn.execute(insert(Cliente), [{"nombre": f"Cliente {i}", "telefono": "1"} for i in range(n_clientes)])
+        conn.execute(insert(Prestamo), [{
+            "cliente_id": 1 + i % n_clientes, "monto": 1000, "tasa_interes": 10, "plazo_dias": 70,
+            "fecha_inicio": hoy - timedelta(days=i % 365), "fecha_vencimiento": hoy, "monto_total": 1100,
+            "saldo_pendiente": 0,
+        } for i in range(n_prestamos)])
+        for inicio in range(0, n_pagos, BLOQUE):
+            ids = range(inicio, min(inicio + BLOQUE, n_pagos))
+            conn.execute(insert(Pago), [{
+                "prestamo_id": 1 + i % n_prestamos, "monto": 110, "fecha_pago": hoy - timedelta(days=i % 365),
+            } for i in ids])
+            conn.execute(insert(PagoCobrador), [{
+                "pago_id": i + 1, "empleado_id": 1, "porcentaje": 3, "monto_comision": 3.3,
+            } for i in ids])
+    return n_prestamos
+
+
+# Enfoque anterior, registro por registro (copia reducida de lo que reemplazó caja_service)
+def backfill_anterior(db):
+    creados = 0
+    for p in db.query(Prestamo).all():
+        cliente = db.query(Cliente).filter(Cliente.id == p.cliente_id).first()
+        db.add(MovimientoCaja(fecha=p.fecha_inicio, tipo="egreso", categoria="prestamo", monto=p.monto,
+                              descripcion=f"Desembolso préstamo #{p.id} - {cliente.nombre}",
+                              referencia_tipo="prestamo", referencia_id=p.id))
+        creados += 1
+    for pg in db.query(Pago).all():
+        prestamo = db.query(Prestamo).filter(Prestamo.id == pg.prestamo_id).first()
+        cliente = db.query(Cliente).filter(Cliente.id == prestamo.cliente_id).first()
+        db.add(MovimientoCaja(fecha=pg.fecha_pago, tipo="ingreso", categoria="pago", monto=pg.monto,
+                              descripcion=f"Pago #{pg.id} préstamo {pg.prestamo_id} - {cliente.nombre}",
+                              referencia_tipo="pago", referencia_id=pg.id))
+        pc = db.query(PagoCobrador).filter(PagoCobrador.pago_id == pg.id).first()
+        for tipo, categoria, monto in (("ingreso", "pago", pg.monto), ("egreso", "comision", pc.monto_comision)):
+            existe = db.query(CajaEmpleadoMovimiento).filter(
+                CajaEmpleadoMovimiento.empleado_id == pc.empleado_id,
+                CajaEmpleadoMovimiento.referencia_tipo == "pago",
+                CajaEmpleadoMovimiento.referencia_id == pg.id,
+                CajaEmpleadoMovimiento.tipo == tipo,
+            ).first()
+            if not existe:
+                db.add(CajaEmpleadoMovimiento(fecha=pg.fecha_pago, empleado_id=pc.empleado_id, tipo=tipo,
+                                              categoria=categoria, monto=monto, referencia_tipo="pago",
+                                              referencia_id=pg.id))
+                creados += 1
+        creados += 1
+    db.commit()
+    return creados
+
+
+def medir(fn):
+    db = SessionLocal()
+    inicio = time.perf_counter()
+    try:
+        filas = fn(db)
+    finally:
+        db.close()
+    return filas, time.perf_counter() - inicio
+
+
+def benchmark():
+    poblar(MUESTRA)
+    _, t_muestra = medir(backfill_anterior)
+    por_pago = t_muestra / MUESTRA
+
+    inicio = time.perf_counter()
+    n_prestamos = poblar(PAGOS)
+    print(f"Base: {PAGOS} pagos, {n_prestamos} préstamos (poblada en {time.perf_counter() - inicio:.1f} s)\n")
+    filas_caja, t_caja = medir(lambda db: backfill_caja_movimientos(db, lote=LOTE, progreso=progreso_log("caja")))
+    filas_emp, t_emp = medir(lambda db: backfill_caja_empleado_movimientos(db, lote=LOTE, progreso=progreso_log("empleados")))
+
+    print(f"\n{'':34}{'filas':>10}{'segundos':>12}")
+    print(f"{'caja_movimientos':34}{filas_caja:>10}{t_caja:>12.1f}")
+    print(f"{'caja_empleado_movimientos':34}{filas_emp:>10}{t_emp:>12.1f}")
+    print(f"{'anterior (extrapolado)':34}{'':>10}{por_pago * PAGOS:>12.0f}"
+          f"   ({por_pago * 1000:.2f} ms por pago en {MUESTRA} pagos)")
+    ok = filas_caja == PAGOS + n_prestamos and filas_emp == 2 * PAGOS
+    print(f"\n{'✓' if ok else '✗'} Un movimiento por préstamo y pago, dos por pago en la caja del cobrador")
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        ok = benchmark()
+    finally:
+        engine.dispose()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,173 @@
+"""
+Benchmark de concurrencia entre la pantalla de caja y los cobradores: lectores que consultan
+el cierre de distintos días (como quien recorre el historial en Caja.jsx) mientras escritores
+registran cobros de hoy (un movimiento de caja con su delta al cierre, un commit cada uno).
+Cada lector hace un número fijo de vistas por segundo, así la carga de lectura es la misma
+en ambos modos y la diferencia en los cobros viene de los locks.
+
+Compara el GET /api/caja/cierre anterior (autocerrar los días abiertos, crear el cierre si
+falta y recién ahí leer: cada vista de un día sin cierre escribía y tomaba el lock de SQLite)
+con el actual de app/caja_service.py, que solo lee. Cada modo corre en un proceso aparte
+sobre una base nueva con el perfil de producción (WAL), con dos años de movimientos sin
+cierres (una base restaurada o recién migrada).
+
+Verifica que las lecturas actuales no emitan ninguna escritura y que la latencia p95 de los
+cobros no sea peor que con la versión anterior. Sale con código 1 si no.
+
+Uso:
+    python benchmark_cierre_concurrente.py
+    python benchmark_cierre_concurrente.py --segundos 10 --escritores 2 --lectores 6
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+import subprocess
+from datetime import date, timedelta
+from utilidades_bench import arg
+
+
+SEGUNDOS = arg("--segundos", 5.0)
+ESCRITORES = arg("--escritores", 2)
+LECTORES = arg("--lectores", 4)
+VISTAS_POR_SEG = arg("--vistas-por-seg", 10.0)  # por lector: misma carga de lectura en ambos modos
+DIAS_HISTORIAL = 730
+
+
+def medir(modo: str):
+    """Corre dentro del proceso hijo, con DB_PROFILE y DATABASE_URL ya definidos."""
+    from sqlalchemy import event, insert
+    from app.database.database import SessionLocal, engine
+    from app.models.models import Base, MovimientoCaja
+    from app.schemas.schemas import MovimientoCajaCreate
+    from app.caja_service import crear_movimiento, get_cierre_caja, autocerrar_dias_pendientes, get_or_create_cierre
+
+    def get_cierre_caja_anterior(db, fecha):
+        """Efectos de escritura del GET anterior, antes de la misma lectura."""
+        autocerrar_dias_pendientes(db)
+        get_or_create_cierre(db, fecha)
+        return get_cierre_caja(db, fecha)
+
+    leer = get_cierre_caja_anterior if modo == "anterior" else get_cierre_caja
+    local = threading.local()
+    escrituras_lectores = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _contar(conn, cursor, statement, params, context, executemany):
+        if getattr(local, "lector", False) and statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            escrituras_lectores["n"] += 1
+
+    Base.metadata.create_all(bind=engine)
+    hoy = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(MovimientoCaja), [{
+            "fecha": hoy - timedelta(days=1 + i % DIAS_HISTORIAL), "tipo": "ingreso" if i % 4 else "egreso",
+            "categoria": "pago" if i % 4 else "prestamo", "monto": 100.0,
+        } for i in range(DIAS_HISTORIAL * 20)])
+    db = SessionLocal()
+    get_or_create_cierre(db, hoy)
+    db.close()
+
+    conteo = {"escrituras": 0, "lecturas": 0, "errores": 0}
+    latencias = {"escrituras": [], "lecturas": []}
+    lock = threading.Lock()
+    fin = time.perf_counter() + SEGUNDOS
+
+    def trabajar(tipo, semilla):
+        local.lector = tipo == "lecturas"
+        azar = random.Random(semilla)
+        proxima = time.perf_counter()
+        db = SessionLocal()
+        try:
+            while time.perf_counter() < fin:
+                if local.lector:
+                    proxima += 1 / VISTAS_POR_SEG
+                    time.sleep(max(0.0, proxima - time.perf_counter()))
+                inicio = time.perf_counter()
+                try:
+                    if tipo == "escrituras":
+                        crear_movimiento(db, MovimientoCajaCreate(
+                            fecha=hoy, tipo="ingreso", categoria="pago", descripcion="cobro", monto=50.0
+                        ))
+                    else:
+                        leer(db, hoy - timedelta(days=azar.randint(0, DIAS_HISTORIAL)))
+                        db.rollback()  # fin de la transacción de lectura
+                except Exception:
+                    db.rollback()
+                    with lock:
+                        conteo["errores"] += 1
+                    continue
+                with lock:
+                    conteo[tipo] += 1
+                    latencias[tipo].append(time.perf_counter() - inicio)
+        finally:
+            db.close()
+
+    hilos = [threading.Thread(target=trabajar, args=("escrituras", i)) for i in range(ESCRITORES)]
+    hilos += [threading.Thread(target=trabajar, args=("lecturas", 100 + i)) for i in range(LECTORES)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    def percentil(valores, p):
+        return sorted(valores)[min(len(valores) - 1, int(len(valores) * p))] * 1000 if valores else 0.0
+
+    print(json.dumps({
+        "escrituras_s": conteo["escrituras"] / SEGUNDOS,
+        "lecturas_s": conteo["lecturas"] / SEGUNDOS,
+        "p50_escritura_ms": percentil(latencias["escrituras"], 0.5),
+        "p95_escritura_ms": percentil(latencias["escrituras"], 0.95),
+        "max_escritura_ms": percentil(latencias["escrituras"], 1.0),
+        "p95_lectura_ms": percentil(latencias["lecturas"], 0.95),
+        "escrituras_de_lectores": escrituras_lectores["n"],
+        "errores": conteo["errores"],
+    }))
+
+
+def correr_modo(modo: str) -> dict:
+    with tempfile.TemporaryDirectory() as carpeta:
+        env = dict(os.environ, DB_PROFILE="produccion", DATABASE_URL=f"sqlite:///{carpeta}/bench.db",
+                   METRICS_CACHE_MAX="0")
+        salida = subprocess.run(
+            [sys.executable, __file__, "--interno", modo] + sys.argv[1:],
+            env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if salida.returncode != 0:
+            print(salida.stderr)
+            raise SystemExit(f"✗ Falló el modo {modo}")
+        return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def benchmark() -> bool:
+    print(f"{ESCRITORES} cobradores, {LECTORES} lectores de caja, {SEGUNDOS:.0f}s por modo\n")
+    resultados = {modo: correr_modo(modo) for modo in ("anterior", "actual")}
+    print(f"{'':26}{'anterior':>12}{'actual':>12}")
+    for clave, titulo in (
+        ("escrituras_s", "cobros/s"),
+        ("p50_escritura_ms", "p50 cobro (ms)"),
+        ("p95_escritura_ms", "p95 cobro (ms)"),
+        ("max_escritura_ms", "máx cobro (ms)"),
+        ("lecturas_s", "lecturas/s"),
+        ("p95_lectura_ms", "p95 lectura (ms)"),
+        ("escrituras_de_lectores", "escrituras de lectores"),
+        ("errores", "errores (locks)"),
+    ):
+        a, b = resultados["anterior"][clave], resultados["actual"][clave]
+        print(f"{titulo:26}{a:>12.1f}{b:>12.1f}")
+
+    actual, anterior = resultados["actual"], resultados["anterior"]
+    ok = (actual["escrituras_de_lectores"] == 0 and actual["errores"] == 0
+          and actual["p95_escritura_ms"] <= anterior["p95_escritura_ms"])
+    print(f"\n{'✓' if ok else '✗'} Las lecturas de caja no escriben ni demoran los cobros")
+    return ok
+
+
+if __name__ == "__main__":
+    if "--interno" in sys.argv:
+        medir(sys.argv[sys.argv.index("--interno") + 1])
+    else:
+        sys.exit(0 if benchmark() else 1)
@@ -0,0 +1,124 @@
+"""
+Benchmark del detalle de comisiones de un vendedor (/api/comisiones/vendedor/detalle): el
+recorrido anterior (por cada PrestamoVendedor, una consulta del préstamo y otra con el SUM de
+lo cobrado: 2N+1 consultas y totales sumados en Python) contra la versión agrupada de
+app/routers/comisiones.py (una consulta de totales y una de la página).
+
+Verifica además que ambas versiones devuelvan las mismas filas y totales.
+
+Uso:
+    python benchmark_comisiones.py
+    python benchmark_comisiones.py --prestamos-vendedor 10000 --pagos-por-prestamo 6
+"""
+import sys
+import time
+from datetime import date, timedelta
+from utilidades_bench import arg, base_temporal
+
+
+PRESTAMOS_VENDEDOR = arg("--prestamos-vendedor", 1500)
+PAGOS_POR_PRESTAMO = arg("--pagos-por-prestamo", 4)
+REPETICIONES = arg("--repeticiones", 3)
+
+base_temporal()
+
+from sqlalchemy import event, func, insert
+from app.database.database import SessionLocal, engine
+from app.models.models import Base, Cliente, Empleado, Prestamo, PrestamoVendedor, Pago, PagoVendedor
+from app.routers.comisiones import _detalle_comisiones_vendedor
+
+consultas = {"n": 0}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _contar(conn, cursor, statement, params, context, executemany):
+    consultas["n"] += 1
+
+
+def poblar():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    hoy = date.today()
+    db.add_all([Empleado(nombre="Vendedor senior", puesto="Vendedor"), Empleado(nombre="Otro", puesto="Vendedor")])
+    db.flush()
+    n = PRESTAMOS_VENDEDOR * 2  # la mitad de la cartera es de otro vendedor
+    db.execute(insert(Cliente), [{"nombre": f"Cliente {i}", "telefono": "1"} for i in range(n // 4)])
+    db.execute(insert(Prestamo), [{
+        "cliente_id": 1 + i % (n // 4), "monto": 1000, "tasa_interes": 10, "plazo_dias": 70,
+        "fecha_inicio": hoy - timedelta(days=i % 90), "fecha_vencimiento": hoy + timedelta(days=10),
+        "monto_total": 1100, "saldo_pendiente": 550, "estado": "activo", "cuotas_totales": 10,
+    } for i in range(n)])
+    db.execute(insert(PrestamoVendedor), [
+        {"prestamo_id": pid, "empleado_id": 1 + pid % 2, "porcentaje": 5, "monto_base": 1100,
+         "monto_comision": 55 + pid % 7} for pid in range(1, n + 1)
+    ])
+    db.execute(insert(Pago), [
+        {"prestamo_id": 1 + i % n, "monto": 110, "fecha_pago": hoy - timedelta(days=i % 30)}
+        for i in range(n * PAGOS_POR_PRESTAMO)
+    ])
+    db.execute(insert(PagoVendedor), [
+        {"pago_id": i + 1, "empleado_id": 1 + (1 + i % n) % 2, "porcentaje": 5, "monto_comision": 5.5}
+        for i in range(n * PAGOS_POR_PRESTAMO)
+    ])
+    db.commit()
+    db.close()
+
+
+def detalle_anterior(db, vendedor_id):
+    """Copia del recorrido por préstamo que reemplazó la versión agrupada."""
+    vendedor = db.query(Empleado).filter(Empleado.id == vendedor_id).first()
+    detalle = []
+    for pv in db.query(PrestamoVendedor).filter(PrestamoVendedor.empleado_id == vendedor_id).all():
+        prestamo = db.query(Prestamo).filter(Prestamo.id == pv.prestamo_id).first()
+        cobradas = db.query(func.sum(PagoVendedor.monto_comision)).join(Pago, PagoVendedor.pago_id == Pago.id).filter(
+            Pago.prestamo_id == prestamo.id, PagoVendedor.empleado_id == vendedor_id
+        ).scalar() or 0.0
+        detalle.append({"prestamo_id": prestamo.id, "comision_esperada": pv.monto_comision,
+                        "comision_cobrada": round(cobradas, 2),
+                        "comision_pendiente": round(pv.monto_comision - cobradas, 2)})
+    return {"vendedor": vendedor.nombre, "prestamos": detalle,
+            "esperada": sum(p["comision_esperada"] for p in detalle),
+            "cobrada": sum(p["comision_cobrada"] for p in detalle)}
+
+
+def medir(fn):
+    mejor = float("inf")
+    for _ in range(REPETICIONES):
+        db = SessionLocal()
+        consultas["n"] = 0
+        inicio = time.perf_counter()
+        try:
+            resultado = fn(db)
+        finally:
+            db.close()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultado, mejor * 1000, consultas["n"]
+
+
+def benchmark():
+    poblar()
+    print(f"Vendedor con {PRESTAMOS_VENDEDOR} préstamos y {PAGOS_POR_PRESTAMO} pagos por préstamo\n")
+    anterior, t_ant, q_ant = medir(lambda db: detalle_anterior(db, 1))
+    completo, t_nue, q_nue = medir(lambda db: _detalle_comisiones_vendedor(db, 1, "prestamo", None, None, 0, None, None))
+    _, t_pag, q_pag = medir(lambda db: _detalle_comisiones_vendedor(db, 1, "pendiente", 100, None, 0, None, None))
+
+    print(f"{'':32}{'ms':>10}{'consultas':>11}")
+    print(f"{'por préstamo (anterior)':32}{t_ant:>10.1f}{q_ant:>11}")
+    print(f"{'agrupado, todos':32}{t_nue:>10.1f}{q_nue:>11}")
+    print(f"{'agrupado, página 100 pendiente':32}{t_pag:>10.1f}{q_pag:>11}")
+
+    filas_ant = [(p["prestamo_id"], p["comision_cobrada"], p["comision_pendiente"]) for p in anterior["prestamos"]]
+    filas_nue = [(p["prestamo_id"], p["comision_cobrada"], p["comision_pendiente"]) for p in completo["prestamos"]]
+    iguales = (filas_ant == filas_nue
+               and round(anterior["esperada"], 2) == completo["totales"]["comision_esperada_total"]
+               and round(anterior["cobrada"], 2) == completo["totales"]["comision_cobrada_total"])
+    print(f"\n{'✓' if iguales else '✗'} Mismas filas y totales en ambas versiones")
+    return iguales
+
+
+if __name__ == "__main__":
+    try:
+        ok = benchmark()
+    finally:
+        engine.dispose()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,101 @@
+"""
+Benchmark de logins concurrentes (inicio de turno): N usuarios inician sesión a la vez
+mientras otro cliente consulta un endpoint liviano. Reporta p50/p99 del login, rechazos por
+cola llena (503) y la latencia del endpoint liviano durante el pico comparada con reposo.
+
+bcrypt corre en el pool acotado de app/password_service.py (PASSWORD_WORKERS hilos, cola
+de PASSWORD_QUEUE_MAX); el endpoint liviano no debería esperar detrás de los hashes.
+
+Uso:
+    python benchmark_login.py
+    python benchmark_login.py --logins 200 --concurrencia 50 --rounds 12
+"""
+import os
+import time
+import asyncio
+from utilidades_bench import arg, base_temporal
+
+
+LOGINS = arg("--logins", 100)
+CONCURRENCIA = arg("--concurrencia", 40)
+ROUNDS = arg("--rounds", 10)
+
+base_temporal()
+os.environ["BCRYPT_ROUNDS"] = str(ROUNDS)
+
+import httpx
+import main
+from app.database.database import SessionLocal, engine, async_engine
+from app.models.models import Usuario
+from app.password_service import hashear_password_sync, get_password_pool_stats, cerrar_pool
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] * 1000 if valores else 0.0
+
+
+async def benchmark():
+    db = SessionLocal()
+    hashed = hashear_password_sync("clave")
+    db.add_all([
+        Usuario(username=f"cobrador{i}", hashed_password=hashed, nombre_completo=f"Cobrador {i}", role="cobrador")
+        for i in range(LOGINS)
+    ])
+    db.commit()
+    db.close()
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        async def liviano(latencias, hasta):
+            while time.perf_counter() < hasta():
+                inicio = time.perf_counter()
+                await cliente.get("/health")
+                latencias.append(time.perf_counter() - inicio)
+                await asyncio.sleep(0.005)
+
+        reposo = []
+        fin_reposo = time.perf_counter() + 1
+        await liviano(reposo, lambda: fin_reposo)
+
+        logins, rechazos, pico = [], [0], []
+        semaforo = asyncio.Semaphore(CONCURRENCIA)
+        terminado = [False]
+
+        async def login(i):
+            async with semaforo:
+                inicio = time.perf_counter()
+                r = await cliente.post("/api/auth/login", data={"username": f"cobrador{i}", "password": "clave"})
+                if r.status_code == 503:
+                    rechazos[0] += 1
+                    return
+                r.raise_for_status()
+                logins.append(time.perf_counter() - inicio)
+
+        async def tormenta():
+            await asyncio.gather(*(login(i) for i in range(LOGINS)))
+            terminado[0] = True
+
+        inicio = time.perf_counter()
+        await asyncio.gather(tormenta(), liviano(pico, lambda: float("inf") if not terminado[0] else 0))
+        total = time.perf_counter() - inicio
+
+    stats = get_password_pool_stats()
+    print(f"{LOGINS} logins, concurrencia {CONCURRENCIA}, bcrypt rounds {ROUNDS}, "
+          f"{stats['workers']} workers, cola máx {stats['max_cola']}\n")
+    print(f"{'logins/s':32}{len(logins) / total:>10.1f}")
+    print(f"{'login p50 (ms)':32}{_percentil(logins, 0.5):>10.1f}")
+    print(f"{'login p99 (ms)':32}{_percentil(logins, 0.99):>10.1f}")
+    print(f"{'rechazados (503)':32}{rechazos[0]:>10}")
+    print(f"{'espera en cola p99 (ms)':32}{stats['espera_p99_ms']:>10.1f}")
+    print(f"{'/health p99 en reposo (ms)':32}{_percentil(reposo, 0.99):>10.1f}")
+    print(f"{'/health p99 durante logins (ms)':32}{_percentil(pico, 0.99):>10.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(benchmark())
+    finally:
+        cerrar_pool()
+        engine.dispose()
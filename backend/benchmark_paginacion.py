@@ -0,0 +1,74 @@
+"""
+Benchmark de paginación de pagos: OFFSET (skip) contra keyset (cursor) a distintas
+profundidades, sobre una base temporal con muchos pagos.
+
+Con OFFSET la base recorre y descarta todas las filas anteriores, así que el costo crece con
+la página; con keyset cada página es una búsqueda por índice desde el último id visto.
+
+Uso:
+    python benchmark_paginacion.py
+    python benchmark_paginacion.py --pagos 500000 --limit 100
+"""
+import time
+from datetime import date, timedelta
+from utilidades_bench import arg, base_temporal
+
+
+PAGOS = arg("--pagos", 300000)
+LIMIT = arg("--limit", 100)
+REPETICIONES = arg("--repeticiones", 5)
+
+base_temporal()
+
+from sqlalchemy import insert
+from app.database.database import SessionLocal, engine
+from app.models.models import Base, Cliente, Prestamo, Pago
+from app.auth_service import Principal
+from app.routers.pagos import _listar_pagos
+from app.pagination_service import codificar_cursor
+
+
+def benchmark():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    hoy = date.today()
+    db.execute(insert(Cliente), [{"nombre": "Cliente", "telefono": "1"}])
+    db.execute(insert(Prestamo), [{
+        "cliente_id": 1, "monto": 1000, "tasa_interes": 10, "plazo_dias": 30, "fecha_inicio": hoy,
+        "fecha_vencimiento": hoy, "monto_total": 1100, "saldo_pendiente": 0, "estado": "pagado",
+    } for _ in range(1000)])
+    for inicio in range(0, PAGOS, 50000):
+        db.execute(insert(Pago), [
+            {"prestamo_id": 1 + i % 1000, "monto": 10.0, "fecha_pago": hoy - timedelta(days=i % 365)}
+            for i in range(inicio, min(PAGOS, inicio + 50000))
+        ])
+    db.commit()
+    admin = Principal(id=1, username="admin", role="admin", empleado_id=None, token_version=0)
+
+    def medir(fn):
+        mejor = float("inf")
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            fn()
+            mejor = min(mejor, time.perf_counter() - inicio)
+        return mejor * 1000
+
+    print(f"{PAGOS} pagos, páginas de {LIMIT}\n")
+    print(f"{'página':>10}{'offset (ms)':>14}{'keyset (ms)':>14}")
+    for fraccion in (0, 0.1, 0.5, 0.9, 0.99):
+        skip = int(PAGOS * fraccion) // LIMIT * LIMIT
+        # El cursor de la página anterior es el id de su última fila
+        cursor = codificar_cursor((skip,)) if skip else None
+        t_offset = medir(lambda: _listar_pagos(db, skip, LIMIT, admin))
+        t_keyset = medir(lambda: _listar_pagos(db, 0, LIMIT, admin, cursor))
+        assert [p.id for p in _listar_pagos(db, skip, LIMIT, admin)[0]] == \
+            [p.id for p in _listar_pagos(db, 0, LIMIT, admin, cursor)[0]]
+        print(f"{skip // LIMIT + 1:>10}{t_offset:>14.2f}{t_keyset:>14.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    try:
+        benchmark()
+    finally:
+        engine.dispose()
@@ -0,0 +1,113 @@
+"""
+Benchmark del reporte de caja de un mes: 30 llamadas a get_cierre_caja (una por día, como
+lo arma hoy el frontend o una planilla; cada una repite las consultas de un rango de un día)
+contra cierres_rango de app/caja_service.py (una consulta agrupada por tabla para todo el
+mes). Mide también el CSV de un año completo.
+
+Verifica que ambos devuelvan los mismos días y que ninguno de los dos escriba.
+
+Uso:
+    python benchmark_reporte_caja.py
+    python benchmark_reporte_caja.py --pagos-por-dia 2000
+"""
+import sys
+import time
+from datetime import date, datetime, timedelta
+from utilidades_bench import arg, base_temporal
+
+
+PAGOS_POR_DIA = arg("--pagos-por-dia", 300)
+DIAS = 365
+REPETICIONES = arg("--repeticiones", 3)
+
+base_temporal()
+
+from sqlalchemy import event, insert
+from app.database.database import SessionLocal, engine
+from app.models.models import Base, Cliente, Empleado, Prestamo, Pago, PagoCobrador, PagoVendedor, MovimientoCaja
+from app.caja_service import get_cierre_caja, cierres_rango, filas_csv_cierres, reconstruir_saldos_cierres
+
+consultas = {"n": 0, "escrituras": 0}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _contar(conn, cursor, statement, params, context, executemany):
+    consultas["n"] += 1
+    if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+        consultas["escrituras"] += 1
+
+
+def poblar():
+    Base.metadata.create_all(bind=engine)
+    hoy = date.today()
+    n_pagos = PAGOS_POR_DIA * DIAS
+    n_prestamos = max(1, n_pagos // 10)
+    with engine.begin() as conn:
+        conn.execute(insert(Empleado), [{"nombre": "Cobrador", "puesto": "Cobrador"}, {"nombre": "Vendedor", "puesto": "Vendedor"}])
+        conn.execute(insert(Cliente), [{"nombre": f"Cliente {i}", "telefono": "1"} for i in range(n_prestamos // 2 + 1)])
+        conn.execute(insert(Prestamo), [{
+            "cliente_id": 1 + i // 2, "monto": 1000, "tasa_interes": 10, "plazo_dias": 70,
+            "fecha_inicio": hoy - timedelta(days=1 + i % DIAS), "fecha_vencimiento": hoy, "monto_total": 1100,
+            "saldo_pendiente": 0,
+        } for i in range(n_prestamos)])
+        conn.execute(insert(Pago), [{
+            "prestamo_id": 1 + i % n_prestamos, "monto": 110, "fecha_pago": hoy - timedelta(days=1 + i % DIAS),
+        } for i in range(n_pagos)])
+        conn.execute(insert(PagoCobrador), [{"pago_id": i + 1, "empleado_id": 1, "porcentaje": 3, "monto_comision": 3.3}
+                                            for i in range(n_pagos)])
+        conn.execute(insert(PagoVendedor), [{"pago_id": i + 1, "empleado_id": 2, "porcentaje": 5, "monto_comision": 5.5}
+                                            for i in range(0, n_pagos, 3)])
+        conn.execute(insert(MovimientoCaja), [{
+            "fecha": hoy - timedelta(days=1 + i % DIAS), "tipo": "egreso", "categoria": "prestamo", "monto": 1000,
+            "referencia_tipo": "prestamo", "referencia_id": i + 1, "created_at": datetime.utcnow(),
+        } for i in range(n_prestamos)] + [{
+            "fecha": hoy - timedelta(days=1 + i % DIAS), "tipo": "ingreso", "categoria": "pago", "monto": 110,
+            "referencia_tipo": "pago", "referencia_id": i + 1, "created_at": datetime.utcnow(),
+        } for i in range(n_pagos)])
+    db = SessionLocal()
+    try:
+        reconstruir_saldos_cierres(db)  # un cierre (cerrado) por día pasado
+    finally:
+        db.close()
+    return hoy
+
+
+def medir(fn):
+    mejor, resultado = float("inf"), None
+    for _ in range(REPETICIONES):
+        db = SessionLocal()
+        consultas["n"] = consultas["escrituras"] = 0
+        inicio = time.perf_counter()
+        try:
+            resultado = fn(db)
+        finally:
+            db.close()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultado, mejor * 1000, consultas["n"], consultas["escrituras"]
+
+
+def benchmark():
+    hoy = poblar()
+    desde, hasta = hoy - timedelta(days=30), hoy - timedelta(days=1)
+    print(f"{PAGOS_POR_DIA} pagos por día durante {DIAS} días\n")
+    por_dia, t_dia, q_dia, w_dia = medir(
+        lambda db: [get_cierre_caja(db, desde + timedelta(days=i)) for i in range((hasta - desde).days + 1)])
+    rango, t_rango, q_rango, w_rango = medir(lambda db: cierres_rango(db, desde, hasta))
+    lineas, t_csv, q_csv, w_csv = medir(lambda db: sum(1 for _ in filas_csv_cierres(db, hoy - timedelta(days=DIAS), hoy)))
+
+    print(f"{'':34}{'ms':>10}{'consultas':>11}{'escrituras':>12}")
+    print(f"{'mes, get_cierre_caja por día':34}{t_dia:>10.1f}{q_dia:>11}{w_dia:>12}")
+    print(f"{'mes, cierres_rango':34}{t_rango:>10.1f}{q_rango:>11}{w_rango:>12}")
+    print(f"{f'año en CSV ({lineas - 1} días)':34}{t_csv:>10.1f}{q_csv:>11}{w_csv:>12}")
+
+    ok = por_dia == rango and w_dia == 0 and w_rango == 0 and w_csv == 0
+    print(f"\n{'✓' if ok else '✗'} Mismos días en ambas versiones y ninguna escribe")
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        ok = benchmark()
+    finally:
+        engine.dispose()
+    sys.exit(0 if ok else 1)
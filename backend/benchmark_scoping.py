@@ -0,0 +1,138 @@
+"""
+Benchmark del alcance por rol para un vendedor con muchos préstamos: lista de ids cargada en
+Python y devuelta como IN (?, ?, ...) (enfoque anterior) contra las subconsultas de
+app/scoping_service.py, en los listados y las métricas por empleado.
+
+Además del tiempo, informa cuántos parámetros lleva la sentencia: con la lista materializada
+crece con la cartera del vendedor y puede superar SQLITE_MAX_VARIABLE_NUMBER (999 antes de
+SQLite 3.32, 32766 desde entonces, salvo que el build lo suba); con la subconsulta es constante.
+
+Uso:
+    python benchmark_scoping.py
+    python benchmark_scoping.py --prestamos-vendedor 40000 --prestamos 60000
+"""
+import os
+import time
+from datetime import date, timedelta
+from utilidades_bench import arg, base_temporal
+
+
+PRESTAMOS = arg("--prestamos", 30000)
+PRESTAMOS_VENDEDOR = arg("--prestamos-vendedor", 12000)
+REPETICIONES = arg("--repeticiones", 5)
+
+base_temporal()
+os.environ["METRICS_CACHE_MAX"] = "0"
+
+from sqlalchemy import event, insert
+from app.database.database import SessionLocal, engine
+from app.models.models import Base, Cliente, Empleado, Prestamo, PrestamoVendedor, Pago, Cuota
+from app.auth_service import Principal
+from app.routers.prestamos import _listar_prestamos
+from app.routers.pagos import _listar_pagos
+from app.routers.clientes import _listar_clientes
+from app.metrics_service import get_period_metrics, get_expectativas
+
+parametros = {"max": 0}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _contar_parametros(conn, cursor, statement, params, context, executemany):
+    parametros["max"] = max(parametros["max"], statement.count("?"))
+
+
+def poblar():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    hoy = date.today()
+    db.add(Empleado(nombre="Vendedor senior", puesto="Vendedor"))
+    db.flush()
+    n_clientes = PRESTAMOS // 3
+    db.execute(insert(Cliente), [{"nombre": f"Cliente {i}", "telefono": "1"} for i in range(n_clientes)])
+    db.execute(insert(Prestamo), [{
+        "cliente_id": 1 + i % n_clientes, "monto": 1000, "tasa_interes": 10, "plazo_dias": 70,
+        "fecha_inicio": hoy - timedelta(days=i % 60), "fecha_vencimiento": hoy + timedelta(days=10),
+        "monto_total": 1100, "saldo_pendiente": 550, "estado": "activo", "cuotas_totales": 10,
+    } for i in range(PRESTAMOS)])
+    # El vendedor tiene uno de cada PRESTAMOS / PRESTAMOS_VENDEDOR préstamos
+    paso = max(1, PRESTAMOS // PRESTAMOS_VENDEDOR)
+    ids = list(range(1, PRESTAMOS + 1, paso))[:PRESTAMOS_VENDEDOR]
+    db.execute(insert(PrestamoVendedor), [
+        {"prestamo_id": pid, "empleado_id": 1, "porcentaje": 5, "monto_base": 1100, "monto_comision": 55} for pid in ids
+    ])
+    db.execute(insert(Pago), [
+        {"prestamo_id": 1 + i % PRESTAMOS, "monto": 110, "fecha_pago": hoy - timedelta(days=i % 30)}
+        for i in range(PRESTAMOS * 2)
+    ])
+    db.execute(insert(Cuota), [
+        {"prestamo_id": 1 + i % PRESTAMOS, "numero": 1 + i // PRESTAMOS, "fecha_vencimiento": hoy + timedelta(days=i % 30),
+         "monto": 110, "estado": "pendiente"}
+        for i in range(PRESTAMOS * 3)
+    ])
+    db.commit()
+    db.close()
+    return len(ids)
+
+
+# Enfoque anterior: ids del vendedor a Python y de vuelta como lista IN
+def _ids_vendedor(db, empleado_id):
+    return [p[0] for p in db.query(PrestamoVendedor.prestamo_id).filter(
+        PrestamoVendedor.empleado_id == empleado_id).distinct().all()]
+
+
+def prestamos_lista_in(db, empleado_id):
+    return db.query(Prestamo).filter(Prestamo.id.in_(_ids_vendedor(db, empleado_id))).order_by(Prestamo.id).limit(100).all()
+
+
+def pagos_lista_in(db, empleado_id):
+    return db.query(Pago).filter(Pago.prestamo_id.in_(_ids_vendedor(db, empleado_id))).order_by(Pago.id).limit(100).all()
+
+
+def clientes_lista_in(db, empleado_id):
+    clientes = [c[0] for c in db.query(Prestamo.cliente_id).filter(
+        Prestamo.id.in_(_ids_vendedor(db, empleado_id))).distinct().all()]
+    return db.query(Cliente).filter(Cliente.id.in_(clientes)).order_by(Cliente.id).limit(100).all()
+
+
+def medir(fn):
+    mejor, error = float("inf"), None
+    parametros["max"] = 0
+    for _ in range(REPETICIONES):
+        db = SessionLocal()
+        inicio = time.perf_counter()
+        try:
+            fn(db)
+        except Exception as e:  # p. ej. "too many SQL variables"
+            error = type(e).__name__
+            break
+        finally:
+            db.close()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return error or f"{mejor * 1000:.1f}", parametros["max"]
+
+
+def benchmark():
+    n = poblar()
+    vendedor = Principal(id=1, username="vend", role="vendedor", empleado_id=1, token_version=0)
+    hoy = date.today()
+    casos = [
+        ("préstamos (página 100)", lambda db: prestamos_lista_in(db, 1), lambda db: _listar_prestamos(db, 0, 100, vendedor)),
+        ("pagos (página 100)", lambda db: pagos_lista_in(db, 1), lambda db: _listar_pagos(db, 0, 100, vendedor)),
+        ("clientes (página 100)", lambda db: clientes_lista_in(db, 1), lambda db: _listar_clientes(db, 0, 100, vendedor)),
+        ("métricas del mes", None, lambda db: get_period_metrics(db, 'month', hoy - timedelta(days=30), hoy, empleado_id=1)),
+        ("expectativas 30 días", None, lambda db: get_expectativas(db, hoy, hoy + timedelta(days=30), empleado_id=1)),
+    ]
+    print(f"{PRESTAMOS} préstamos, vendedor con {n}\n")
+    print(f"{'':24}{'lista IN (ms)':>15}{'params':>8}{'subconsulta (ms)':>18}{'params':>8}")
+    for titulo, anterior, nuevo in casos:
+        t_ant, p_ant = medir(anterior) if anterior else ("-", "-")
+        t_nue, p_nue = medir(nuevo)
+        print(f"{titulo:24}{t_ant:>15}{p_ant:>8}{t_nue:>18}{p_nue:>8}")
+    print("\n(las métricas solo se miden con el alcance actual)")
+
+
+if __name__ == "__main__":
+    try:
+        benchmark()
+    finally:
+        engine.dispose()
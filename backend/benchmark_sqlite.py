@@ -0,0 +1,134 @@
+"""
+Benchmark de lectura/escritura concurrente sobre SQLite con el perfil de desarrollo
+(rollback journal, synchronous=FULL) y el de producción (WAL y pragmas, ver
+app/database/database.py).
+
+Cada perfil corre en un proceso aparte sobre una base temporal nueva: escritores que
+registran movimientos de caja de hoy (un commit por operación, con el delta al cierre del
+día) y lectores que consultan movimientos y cierre de ayer (volumen fijo, precargado),
+durante un tiempo fijo.
+
+Uso:
+    python benchmark_sqlite.py
+    python benchmark_sqlite.py --segundos 10 --escritores 4 --lectores 8
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import subprocess
+from datetime import date, timedelta
+from utilidades_bench import arg
+
+
+SEGUNDOS = arg("--segundos", 5.0)
+ESCRITORES = arg("--escritores", 4)
+LECTORES = arg("--lectores", 8)
+
+
+def medir():
+    """Corre dentro del proceso hijo, con DB_PROFILE y DATABASE_URL ya definidos."""
+    from app.database.database import SessionLocal, engine
+    from sqlalchemy import insert
+    from app.models.models import Base, MovimientoCaja
+    from app.schemas.schemas import MovimientoCajaCreate
+    from app.caja_service import crear_movimiento, listar_movimientos_por_fecha, get_cierre_caja
+
+    Base.metadata.create_all(bind=engine)
+    hoy = date.today()
+    ayer = hoy - timedelta(days=1)
+    conteo = {"escrituras": 0, "lecturas": 0, "errores": 0}
+    latencias = {"escrituras": [], "lecturas": []}
+    lock = threading.Lock()
+    fin = time.perf_counter() + SEGUNDOS
+
+    def trabajar(tipo):
+        db = SessionLocal()
+        try:
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    if tipo == "escrituras":
+                        crear_movimiento(db, MovimientoCajaCreate(
+                            fecha=hoy, tipo="ingreso", categoria="otros", descripcion="bench", monto=1.0
+                        ))
+                    else:
+                        listar_movimientos_por_fecha(db, ayer)
+                        get_cierre_caja(db, ayer)
+                        db.commit()
+                except Exception:
+                    db.rollback()
+                    with lock:
+                        conteo["errores"] += 1
+                    continue
+                with lock:
+                    conteo[tipo] += 1
+                    latencias[tipo].append(time.perf_counter() - inicio)
+        finally:
+            db.close()
+
+    # Precargar el día que leen los lectores y crear los cierres antes de medir
+    db = SessionLocal()
+    db.execute(insert(MovimientoCaja), [
+        {"fecha": ayer, "tipo": "ingreso" if i % 3 else "egreso", "categoria": "pago", "monto": 10.0,
+         "descripcion": f"Precarga {i}"} for i in range(500)
+    ])
+    db.commit()
+    get_cierre_caja(db, ayer)
+    get_cierre_caja(db, hoy)
+    db.close()
+
+    hilos = [threading.Thread(target=trabajar, args=("escrituras",)) for _ in range(ESCRITORES)]
+    hilos += [threading.Thread(target=trabajar, args=("lecturas",)) for _ in range(LECTORES)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    def p95(valores):
+        return sorted(valores)[int(len(valores) * 0.95)] * 1000 if valores else 0.0
+
+    print(json.dumps({
+        "escrituras_s": conteo["escrituras"] / SEGUNDOS,
+        "lecturas_s": conteo["lecturas"] / SEGUNDOS,
+        "errores": conteo["errores"],
+        "p95_escritura_ms": p95(latencias["escrituras"]),
+        "p95_lectura_ms": p95(latencias["lecturas"]),
+    }))
+
+
+def correr_perfil(perfil):
+    with tempfile.TemporaryDirectory() as carpeta:
+        env = dict(os.environ, DB_PROFILE=perfil, DATABASE_URL=f"sqlite:///{carpeta}/bench.db", METRICS_CACHE_MAX="0")
+        salida = subprocess.run(
+            [sys.executable, __file__, "--interno"] + sys.argv[1:],
+            env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if salida.returncode != 0:
+            print(salida.stderr)
+            raise SystemExit(f"✗ Falló el perfil {perfil}")
+        return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def benchmark():
+    print(f"{ESCRITORES} escritores, {LECTORES} lectores, {SEGUNDOS:.0f}s por perfil\n")
+    resultados = {perfil: correr_perfil(perfil) for perfil in ("desarrollo", "produccion")}
+    print(f"{'':22}{'desarrollo':>14}{'produccion':>14}")
+    for clave, titulo in (
+        ("escrituras_s", "escrituras/s"),
+        ("lecturas_s", "lecturas/s"),
+        ("p95_escritura_ms", "p95 escritura (ms)"),
+        ("p95_lectura_ms", "p95 lectura (ms)"),
+        ("errores", "errores (locks)"),
+    ):
+        a, b = resultados["desarrollo"][clave], resultados["produccion"][clave]
+        print(f"{titulo:22}{a:>14.1f}{b:>14.1f}")
+
+
+if __name__ == "__main__":
+    if "--interno" in sys.argv:
+        medir()
+    else:
+        benchmark()
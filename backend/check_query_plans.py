@@ -0,0 +1,267 @@
+"""
+Arnés de planes de consulta: carga una base SQLite temporal con volumen realista, recorre los
+endpoints de los routers (lecturas y escrituras, con cada rol) capturando cada sentencia SQL
+que emiten routers y servicios, y corre EXPLAIN QUERY PLAN sobre cada una.
+
+Falla (exit 1) si una consulta filtrada (con WHERE) recorre completa alguna tabla (SCAN).
+Recorrer un índice parcial no cuenta: solo contiene las filas que cumplen su predicado.
+Las consultas sin WHERE (listados completos, agregados globales) se reportan aparte: ahí el
+recorrido es inherente a la consulta, no un índice faltante.
+
+Uso:
+    python check_query_plans.py                 # volumen por defecto
+    python check_query_plans.py --prestamos 20000
+    python check_query_plans.py --verbose       # imprime el plan de cada consulta
+"""
+import os
+import re
+import sys
+import random
+from datetime import date, datetime, timedelta
+from utilidades_bench import base_temporal
+
+PRESTAMOS = int(sys.argv[sys.argv.index("--prestamos") + 1]) if "--prestamos" in sys.argv else 5000
+VERBOSE = "--verbose" in sys.argv
+
+base_temporal()
+os.environ.setdefault("METRICS_CACHE_MAX", "0")
+
+import bcrypt
+from sqlalchemy import event, insert
+from fastapi.testclient import TestClient
+import main
+from app.database.database import engine, async_engine, SessionLocal
+from app.models.models import (
+    Usuario, Empleado, Cliente, Prestamo, Pago, Cuota, PrestamoVendedor, PagoVendedor,
+    PagoCobrador, MovimientoCaja, CajaEmpleadoMovimiento
+)
+from app.portfolio_stats_service import reconciliar_portfolio_stats
+
+# Sentencias conocidas cuyo recorrido es aceptado aunque tengan WHERE: (patrón, motivo)
+PERMITIDAS = [
+    (r"NOT \(EXISTS \(SELECT \* \s*FROM prestamos_vendedores", "anti-join de cobrador: casi todas las filas califican y el listado lleva LIMIT"),
+]
+
+
+def poblar(n_prestamos: int):
+    """Inserta clientes, préstamos, cuotas, pagos, comisiones y movimientos en bloque."""
+    rnd = random.Random(7)
+    hoy = date.today()
+    db = SessionLocal()
+    h = bcrypt.hashpw(b"x", bcrypt.gensalt(4)).decode()
+    empleados = [Empleado(nombre=f"Empleado {i}", puesto="Vendedor" if i % 2 else "Cobrador") for i in range(20)]
+    db.add_all(empleados)
+    db.flush()
+    vendedor_id, cobrador_id = empleados[1].id, empleados[0].id
+    db.add_all([
+        Usuario(username="admin", hashed_password=h, nombre_completo="Admin", role="admin"),
+        Usuario(username="vend", hashed_password=h, nombre_completo="Vendedor", role="vendedor", empleado_id=vendedor_id),
+        Usuario(username="cobr", hashed_password=h, nombre_completo="Cobrador", role="cobrador", empleado_id=cobrador_id),
+    ])
+    db.commit()
+    emp_ids = [e.id for e in empleados]
+
+    n_clientes = max(1, n_prestamos // 3)
+    conn = db.connection()
+    conn.execute(insert(Cliente), [
+        {"id": i, "nombre": f"Cliente {i}", "telefono": "11" + str(i).zfill(8)} for i in range(1, n_clientes + 1)
+    ])
+    prestamos, cuotas, pvs = [], [], []
+    for i in range(1, n_prestamos + 1):
+        inicio = hoy - timedelta(days=rnd.randint(0, 400))
+        monto = float(rnd.choice([300, 800, 1500, 4000, 9000]))
+        total = monto * 1.2
+        n = rnd.choice([4, 8, 12])
+        pagadas = rnd.randint(0, n)
+        saldo = 0.0 if pagadas == n else round(total / n * (n - pagadas), 2)
+        prestamos.append({
+            "id": i, "cliente_id": rnd.randint(1, n_clientes), "monto": monto, "tasa_interes": 20.0,
+            "plazo_dias": n * 7, "fecha_inicio": inicio, "fecha_vencimiento": inicio + timedelta(days=n * 7),
+            "monto_total": total, "saldo_pendiente": saldo, "estado": "pagado" if saldo == 0 else "activo",
+            "frecuencia_pago": "semanal", "cuotas_totales": n, "cuotas_pagadas": pagadas,
+            "valor_cuota": total / n, "saldo_cuota": 0.0, "created_at": datetime.combine(inicio, datetime.min.time()),
+        })
+        for k in range(1, n + 1):
+            cuotas.append({"prestamo_id": i, "numero": k, "fecha_vencimiento": inicio + timedelta(days=7 * k),
+                           "monto": total / n, "estado": "pagado" if k <= pagadas else "pendiente"})
+        if i % 3 == 0:
+            pvs.append({"prestamo_id": i, "empleado_id": rnd.choice(emp_ids), "empleado_nombre": "Vendedor",
+                        "porcentaje": 5.0, "base_tipo": "total", "monto_base": total, "monto_comision": total * 0.05})
+    conn.execute(insert(Prestamo), prestamos)
+    conn.execute(insert(Cuota), cuotas)
+    conn.execute(insert(PrestamoVendedor), pvs)
+
+    pagos, pcs, pvends, movs, movs_emp = [], [], [], [], []
+    pago_id = 0
+    for p in prestamos:
+        movs.append({"fecha": p["fecha_inicio"], "tipo": "egreso", "categoria": "prestamo", "monto": p["monto"],
+                     "referencia_tipo": "prestamo", "referencia_id": p["id"], "prestamo_id": p["id"], "cliente_id": p["cliente_id"]})
+        for k in range(p["cuotas_pagadas"]):
+            pago_id += 1
+            fecha = min(p["fecha_inicio"] + timedelta(days=7 * (k + 1)), hoy)
+            monto = round(p["valor_cuota"], 2)
+            pagos.append({"id": pago_id, "prestamo_id": p["id"], "monto": monto, "fecha_pago": fecha, "tipo_pago": "cuota",
+                          "created_at": datetime.combine(fecha, datetime.min.time())})
+            cobrador_id = rnd.choice(emp_ids)
+            pcs.append({"pago_id": pago_id, "empleado_id": cobrador_id, "empleado_nombre": "Cobrador",
+                        "porcentaje": 3.0, "monto_comision": round(monto * 0.03, 2)})
+            if p["id"] % 3 == 0:
+                pvends.append({"pago_id": pago_id, "empleado_id": rnd.choice(emp_ids), "empleado_nombre": "Vendedor",
+                               "porcentaje": 5.0, "monto_comision": round(monto * 0.05, 2)})
+            movs.append({"fecha": fecha, "tipo": "ingreso", "categoria": "pago", "monto": monto,
+                         "referencia_tipo": "pago", "referencia_id": pago_id, "prestamo_id": p["id"], "cliente_id": p["cliente_id"],
+                         "cuota_numero": k + 1})
+            movs_emp.append({"fecha": fecha, "empleado_id": cobrador_id, "tipo": "ingreso", "categoria": "pago",
+                             "monto": monto, "referencia_tipo": "pago", "referencia_id": pago_id})
+    conn.execute(insert(Pago), pagos)
+    conn.execute(insert(PagoCobrador), pcs)
+    if pvends:
+        conn.execute(insert(PagoVendedor), pvends)
+    conn.execute(insert(MovimientoCaja), movs)
+    conn.execute(insert(CajaEmpleadoMovimiento), movs_emp)
+    db.commit()
+    reconciliar_portfolio_stats(db)
+    db.close()
+    with engine.connect() as c:
+        c.exec_driver_sql("ANALYZE")
+    print(f"Base poblada: {n_clientes} clientes, {n_prestamos} préstamos, {len(cuotas)} cuotas, "
+          f"{len(pagos)} pagos, {len(movs)} movimientos")
+    return vendedor_id, cobrador_id
+
+
+def recorrer_endpoints(vendedor_id: int, cobrador_id: int):
+    """Llama a los endpoints de lectura y escritura con cada rol."""
+    c = TestClient(main.app, raise_server_exceptions=False)
+
+    def token(usuario):
+        r = c.post("/api/auth/login", data={"username": usuario, "password": "x"})
+        return {"Authorization": "Bearer " + r.json()["access_token"]}
+
+    hoy = date.today()
+    desde = (hoy - timedelta(days=60)).isoformat()
+    for h in (token("admin"), token("vend"), token("cobr")):
+        for url in [
+            "/api/clientes/", "/api/clientes/1", "/api/prestamos/", "/api/prestamos/3",
+            "/api/prestamos/cliente/1", "/api/prestamos/3/vendedor", "/api/prestamos/3/amortizacion",
+            "/api/pagos/", "/api/pagos/1", "/api/pagos/prestamo/3", "/api/pagos/1/cobrador",
+            "/api/empleados/", f"/api/empleados/{cobrador_id}/comisiones",
+            f"/api/empleados/{vendedor_id}/comisiones-vendedor", f"/api/empleados/{vendedor_id}/comisiones-pago-vendedor",
+            f"/api/empleados/{cobrador_id}/ganancias",
+            "/api/metrics/summary", "/api/metrics/kpis", "/api/metrics/evolucion", "/api/metrics/rentabilidad",
+            "/api/metrics/top-clientes", "/api/metrics/segment?dimension=morosidad", "/api/metrics/due-next",
+            "/api/metrics/due-today", "/api/metrics/daily-simple?days=7", f"/api/metrics/summary?empleado_id={vendedor_id}",
+            f"/api/metrics/period/date?date={hoy}", f"/api/metrics/period/week?start_date={desde}&end_date={hoy}",
+            f"/api/metrics/period/month?month={hoy.strftime('%Y-%m')}", f"/api/metrics/expectativas/date?date={hoy}",
+            f"/api/metrics/expectativas/week?start_date={hoy}&end_date={hoy + timedelta(days=7)}",
+            f"/api/metrics/expectativas/month?month={hoy.strftime('%Y-%m')}",
+            f"/api/comisiones/vendedor/resumen?vendedor_id={vendedor_id}&fecha_desde={desde}",
+            f"/api/comisiones/vendedor/detalle?vendedor_id={vendedor_id}",
+            f"/api/comisiones/cobrador/resumen?cobrador_id={cobrador_id}&fecha_desde={desde}",
+            f"/api/comisiones/dia?fecha={hoy}",
+            f"/api/caja/movimientos?fecha={hoy}", "/api/caja/movimientos?cliente_id=1", "/api/caja/movimientos?prestamo_id=3",
+            f"/api/caja/cierre?fecha={hoy}", f"/api/caja/cierres?desde={desde}&hasta={hoy}",
+            f"/api/caja/cierres?desde={desde}&hasta={hoy}&formato=csv",
+            f"/api/caja/empleado/movimientos?fecha={hoy}", f"/api/caja/empleado/resumen?fecha={hoy}",
+        ]:
+            c.get(url, headers=h)
+
+    admin = token("admin")
+    r = c.post("/api/prestamos/", json={"cliente_id": 1, "monto": 1000, "tasa_interes": 10, "plazo_dias": 28,
+                                        "fecha_inicio": hoy.isoformat(), "frecuencia_pago": "semanal",
+                                        "vendedor_id": vendedor_id, "vendedor_porcentaje": 5}, headers=admin)
+    nuevo = r.json().get("id", 3) if r.status_code == 201 else 3
+    c.put(f"/api/prestamos/{nuevo}", json={"monto": 1200}, headers=admin)
+    c.post("/api/pagos/", json={"prestamo_id": nuevo, "monto": 50, "fecha_pago": hoy.isoformat(), "tipo_pago": "cuota",
+                                "cobrador_id": cobrador_id, "porcentaje_cobrador": 3}, headers=admin)
+    c.post("/api/pagos/", json={"prestamo_id": 6, "monto": 50, "fecha_pago": hoy.isoformat()}, headers=token("cobr"))
+    c.post("/api/pagos/batch", json=[{"prestamo_id": 9, "monto": 40, "fecha_pago": hoy.isoformat(),
+                                      "cobrador_id": cobrador_id, "porcentaje_cobrador": 3}], headers=admin)
+    c.post("/api/caja/movimientos", json={"fecha": hoy.isoformat(), "tipo": "ingreso", "categoria": "otros",
+                                          "descripcion": "Ajuste", "monto": 10}, headers=admin)
+    c.post("/api/caja/empleado/movimientos", json={"fecha": hoy.isoformat(), "tipo": "egreso", "categoria": "deposito_caja",
+                                                   "descripcion": "Depósito", "monto": 20}, headers=token("cobr"))
+    c.post("/api/clientes/", json={"nombre": "Nuevo", "telefono": "1100000000"}, headers=admin)
+
+
+def capturar_sentencias():
+    sentencias = {}
+
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            return
+        if re.match(r"\s*(SELECT|UPDATE|DELETE)", statement, re.I):
+            sentencias.setdefault(statement, parameters)
+
+    event.listen(engine, "before_cursor_execute", antes)
+    # Los endpoints async pasan por el engine async (mismo archivo, otro pool)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", antes)
+    return sentencias
+
+
+def recorridos(plan, tablas, parciales):
+    """Tablas recorridas completas según las filas de EXPLAIN QUERY PLAN. Los recorridos de
+    subconsultas materializadas (anon_N) y de índices parciales no cuentan."""
+    scans = []
+    for fila in plan:
+        detalle = fila[-1]
+        m = re.match(r"SCAN (?:TABLE )?(\w+)(?:.* INDEX (\w+))?", detalle)
+        if not m or m.group(2) in parciales:
+            continue
+        # Los alias de SQLAlchemy (prestamos_1) apuntan a la tabla base
+        if re.sub(r"_\d+$", "", m.group(1)) in tablas:
+            scans.append(detalle)
+    return scans
+
+
+def check_query_plans():
+    vendedor_id, cobrador_id = poblar(PRESTAMOS)
+    sentencias = capturar_sentencias()
+    recorrer_endpoints(vendedor_id, cobrador_id)
+
+    fallas, inherentes = [], []
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        tablas = {fila[0] for fila in cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        parciales = {fila[0] for fila in cur.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'"
+        )}
+        for sql, params in sentencias.items():
+            plan = cur.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            scans = recorridos(plan, tablas, parciales)
+            if VERBOSE:
+                print("\n" + " ".join(sql.split()))
+                for fila in plan:
+                    print("    ", fila[-1])
+            if not scans:
+                continue
+            permitida = next((motivo for patron, motivo in PERMITIDAS if re.search(patron, sql, re.S)), None)
+            if re.search(r"\bWHERE\b", sql, re.I) and not permitida:
+                fallas.append((sql, scans))
+            else:
+                inherentes.append((sql, scans, permitida))
+    finally:
+        raw.close()
+
+    print(f"\n{len(sentencias)} sentencias distintas analizadas")
+    if inherentes:
+        print(f"\n{len(inherentes)} recorridos completos sin filtro (listados/agregados globales):")
+        for sql, scans, motivo in inherentes:
+            print("  -", " ".join(sql.split())[:110], "|", ", ".join(scans), f"({motivo})" if motivo else "")
+    if fallas:
+        print(f"\n✗ {len(fallas)} consultas filtradas hacen recorrido completo:")
+        for sql, scans in fallas:
+            print("\n ", " ".join(sql.split()))
+            for s in scans:
+                print("     ", s)
+        return 1
+    print("\n✓ Ninguna consulta filtrada recorre tablas completas")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        code = check_query_plans()
+    finally:
+        engine.dispose()
+    sys.exit(code)
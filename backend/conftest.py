@@ -0,0 +1,54 @@
+"""
+Base temporal para las pruebas con pytest (test_backfill, test_saldos_caja, test_prestamo_full).
+
+app.database crea el engine al importarse, durante la colección de los módulos de prueba y
+antes de cualquier fixture; por eso DATABASE_URL se define en pytest_configure, en una
+carpeta propia de la corrida que se borra al terminar. La fixture `db` recrea el esquema
+sobre esa base (nunca sobre la configurada) y entrega una sesión.
+
+    python -m pytest test_backfill.py test_saldos_caja.py test_prestamo_full.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+_carpeta = None
+
+
+def pytest_configure(config):
+    global _carpeta
+    if "app.database.database" in sys.modules:
+        raise pytest.UsageError("app.database se importó antes de conftest: las pruebas usarían la base configurada")
+    _carpeta = tempfile.mkdtemp(prefix="gestor_pruebas_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_carpeta, 'pruebas.db')}"
+
+
+def pytest_unconfigure(config):
+    if "app.database.database" in sys.modules:
+        sys.modules["app.database.database"].engine.dispose()
+    if _carpeta:
+        shutil.rmtree(_carpeta, ignore_errors=True)
+
+
+@pytest.fixture
+def base_limpia():
+    """Esquema recién creado en la base temporal de la corrida. Devuelve el engine."""
+    from app.database.database import engine
+    from app.models.models import Base
+    assert engine.url.database.startswith(_carpeta), f"la base de pruebas no es temporal: {engine.url}"
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def db(base_limpia):
+    from app.database.database import SessionLocal
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
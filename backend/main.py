@@ -1,37 +1,16 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import clientes, prestamos, pagos, auth, metrics, empleados, caja, comisiones
-from app.database.database import engine, SessionLocal
+from app.database.database import engine, async_engine, SessionLocal
 from app.models import models
-from app.caja_service import backfill_caja_movimientos, autocerrar_dias_pendientes, normalizar_descripciones_movimientos, backfill_caja_empleado_movimientos
+from app.password_service import cerrar_pool
+from app.migraciones_service import aplicar_migraciones, migraciones_pendientes, MIGRACIONES_AL_INICIAR
+from app.mantenimiento_service import iniciar_mantenimiento, detener_mantenimiento
 
 # Crear las tablas en la base de datos
 models.Base.metadata.create_all(bind=engine)
 
-# Backfill movimientos de caja si está vacío
-def init_backfill():
-    db = SessionLocal()
-    try:
-        creados = backfill_caja_movimientos(db)
-        if creados:
-            print(f"[Caja] Backfill inicial completado: {creados} movimientos creados.")
-        else:
-            # Si ya había movimientos, intentar normalizar descripciones antiguas
-            cambios = normalizar_descripciones_movimientos(db)
-            if cambios:
-                print(f"[Caja] Normalización de descripciones: {cambios} movimientos actualizados.")
-        # Autocerrar días pendientes al iniciar
-        autocerrar_dias_pendientes(db)
-        emp_creados = backfill_caja_empleado_movimientos(db)
-        if emp_creados:
-            print(f"[Caja Empleado] Backfill movimientos empleado: {emp_creados} creados.")
-    except Exception as e:
-        print(f"[Caja] Error en backfill inicial: {e}")
-    finally:
-        db.close()
-
-init_backfill()
-
 app = FastAPI(
     title="Gestor Prestamista API",
     description="API para gestión de préstamos, clientes y pagos",
@@ -45,6 +24,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Aprox"],  # paginación por keyset
 )
 
 # Incluir routers
@@ -57,6 +37,30 @@ app.include_router(empleados.router)
 app.include_router(caja.router)
 app.include_router(comisiones.router, prefix="/api/comisiones", tags=["Comisiones"])
 
+@app.on_event("startup")
+async def preparar_datos():
+    # Migraciones de datos pendientes (una sola vez; ver migraciones_service). Ya aplicadas,
+    # esto es una lectura de schema_version y el arranque no depende del tamaño de las tablas.
+    if MIGRACIONES_AL_INICIAR:
+        await asyncio.to_thread(aplicar_migraciones, SessionLocal)
+    else:
+        db = SessionLocal()
+        try:
+            pendientes = migraciones_pendientes(db)
+        finally:
+            db.close()
+        if pendientes:
+            print(f"[Migraciones] {len(pendientes)} pendientes: ejecutar migrate_pendientes.py")
+    # Reconciliación de cierres y autocierre de días: en segundo plano, con la app ya atendiendo
+    iniciar_mantenimiento(SessionLocal)
+
+@app.on_event("shutdown")
+async def cerrar_conexiones_async():
+    await detener_mantenimiento()
+    # Cierra el pool async (con aiosqlite cada conexión mantiene un hilo propio)
+    await async_engine.dispose()
+    cerrar_pool()
+
 @app.get("/")
 def read_root():
     return {"message": "Bienvenido a Gestor Prestamista API"}
@@ -0,0 +1,52 @@
+"""
+Crear en una base existente los índices declarados en los modelos (simples, compuestos y
+parciales). create_all solo crea índices al crear la tabla, así que una base anterior a
+estos índices necesita este script. Es idempotente: los índices existentes se saltean.
+"""
+import shutil
+from pathlib import Path
+from datetime import datetime
+from sqlalchemy import inspect
+from app.database.database import engine, DATABASE_URL
+from app.models.models import Base
+
+DB_PATH = Path(DATABASE_URL.replace("sqlite:///", "")) if DATABASE_URL.startswith("sqlite") else None
+BACKUP_PATH = Path(f"gestor_prestamista_backup_indices_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+
+
+def migrate_add_indices():
+    es_sqlite = DB_PATH is not None
+    if es_sqlite and DB_PATH.exists():
+        print(f"Creando backup en {BACKUP_PATH}...")
+        shutil.copy2(DB_PATH, BACKUP_PATH)
+        print("✓ Backup creado")
+
+    try:
+        inspector = inspect(engine)
+        tablas = set(inspector.get_table_names())
+        creados = 0
+        for tabla in Base.metadata.sorted_tables:
+            if tabla.name not in tablas:
+                print(f"- {tabla.name} no existe (la crea create_all al iniciar)")
+                continue
+            existentes = {ix["name"] for ix in inspector.get_indexes(tabla.name)}
+            for indice in sorted(tabla.indexes, key=lambda ix: ix.name):
+                if indice.name in existentes:
+                    continue
+                print(f"Creando {indice.name} en {tabla.name}...")
+                indice.create(bind=engine)
+                creados += 1
+        if es_sqlite:
+            # Estadísticas para que el planificador elija los índices nuevos
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ANALYZE")
+            print("✓ ANALYZE ejecutado")
+        print(f"✓ Migración completada: {creados} índices creados")
+    except Exception as e:
+        print("✗ Error en migración:", e)
+        if es_sqlite and BACKUP_PATH.exists():
+            print(f"Restaura desde: {BACKUP_PATH}")
+
+
+if __name__ == "__main__":
+    migrate_add_indices()
@@ -0,0 +1,42 @@
+"""
+Aplicar las migraciones de datos pendientes (app/migraciones_service.py) sin levantar la API.
+
+Pensado para el deploy: correrlo una vez antes de iniciar los workers (con
+MIGRACIONES_AL_INICIAR=false), así ningún worker demora su arranque con backfills.
+
+Uso:
+    python migrate_pendientes.py            # aplica las pendientes
+    python migrate_pendientes.py --estado   # solo lista aplicadas y pendientes
+"""
+import sys
+from app.database.database import engine, SessionLocal
+from app.models.models import Base, SchemaVersion
+from app.migraciones_service import MIGRACIONES, aplicar_migraciones
+
+
+def mostrar_estado():
+    db = SessionLocal()
+    try:
+        filas = {f.version: f for f in db.query(SchemaVersion)}
+    finally:
+        db.close()
+    for version, nombre, _ in MIGRACIONES:
+        fila = filas.get(version)
+        if fila is None:
+            print(f"  · v{version} {nombre}: pendiente")
+        elif fila.estado == "aplicada":
+            print(f"  ✓ v{version} {nombre}: {fila.resultado} ({fila.aplicada_at:%Y-%m-%d %H:%M})")
+        else:
+            print(f"  … v{version} {nombre}: en curso desde {fila.iniciada_at:%Y-%m-%d %H:%M}")
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    if "--estado" not in sys.argv:
+        aplicadas = aplicar_migraciones(SessionLocal)
+        print(f"✓ {len(aplicadas)} migraciones aplicadas" if aplicadas else "✓ Sin migraciones pendientes")
+    mostrar_estado()
+
+
+if __name__ == "__main__":
+    main()
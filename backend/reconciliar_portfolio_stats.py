@@ -0,0 +1,40 @@
+"""
+Script para reconstruir los contadores de cartera (portfolio_stats) desde las tablas base
+y reportar el drift encontrado.
+
+Uso:
+    python reconciliar_portfolio_stats.py            # reporta y corrige
+    python reconciliar_portfolio_stats.py --reportar # solo reporta
+"""
+import sys
+from app.database.database import SessionLocal, engine
+from app.models.models import Base
+from app.portfolio_stats_service import reconciliar_portfolio_stats
+
+
+def reconciliar(corregir: bool = True):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        drift = reconciliar_portfolio_stats(db, corregir=corregir)
+        if not drift:
+            print("✓ Contadores sin drift")
+            return
+        for empleado_id, diferencias in sorted(drift.items(), key=lambda x: (x[0] is not None, x[0] or 0)):
+            fila = "global" if empleado_id is None else f"empleado {empleado_id}"
+            print(f"✗ Drift en fila {fila}:")
+            for campo, (guardado, esperado) in diferencias.items():
+                print(f"    {campo}: guardado={guardado} esperado={esperado}")
+        if corregir:
+            print(f"✓ {len(drift)} filas reconstruidas")
+        else:
+            print("Ejecuta sin --reportar para corregir")
+    except Exception as e:
+        print("✗ Error en reconciliación:", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    reconciliar(corregir="--reportar" not in sys.argv)
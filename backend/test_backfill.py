@@ -0,0 +1,159 @@
+"""
+Prueba de los backfills por lotes de caja (app/caja_service.py + app/backfill_service.py):
+mismas filas que generaba el recorrido por registro, sin duplicar al repetir, y retomando
+desde el checkpoint si el proceso se corta a mitad. También las referencias estructuradas de
+los movimientos anteriores a esas columnas.
+
+Corre con pytest sobre la base temporal de conftest.py:
+    python -m pytest test_backfill.py
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert
+from app import caja_service
+from app.database.database import SessionLocal, engine
+from app.models.models import (Cliente, Empleado, Prestamo, Pago, PagoCobrador, MovimientoCaja,
+                               CajaEmpleadoMovimiento, BackfillCheckpoint)
+
+N_PRESTAMOS, N_PAGOS = 23, 97
+
+
+def _poblar():
+    hoy = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Empleado), [{"nombre": "Cobra", "puesto": "Cobrador"}, {"nombre": "Otro", "puesto": "Cobrador"}])
+        conn.execute(insert(Cliente), [{"nombre": f"Cliente {i}", "telefono": "1"} for i in range(10)])
+        # El último préstamo apunta a un cliente inexistente: la descripción usa "Cliente <id>"
+        conn.execute(insert(Prestamo), [{
+            "cliente_id": 1 + i % 10 if i < N_PRESTAMOS - 1 else 999, "monto": 100 + i, "tasa_interes": 10,
+            "plazo_dias": 30, "fecha_inicio": hoy - timedelta(days=i), "fecha_vencimiento": hoy, "monto_total": 110 + i,
+            "saldo_pendiente": 110 + i,
+        } for i in range(N_PRESTAMOS)])
+        conn.execute(insert(Pago), [{
+            "prestamo_id": 1 + i % N_PRESTAMOS, "monto": 10 + i, "fecha_pago": hoy - timedelta(days=i % 7),
+        } for i in range(N_PAGOS)])
+        # Cada tercer pago sin cobrador, uno con cobrador nulo y uno con dos registros (vale el primero)
+        pcs = [{"pago_id": i + 1, "empleado_id": 1, "porcentaje": 5, "monto_comision": round((10 + i) * 0.05, 2)}
+               for i in range(N_PAGOS) if i % 3]
+        pcs[0]["empleado_id"] = None
+        pcs.append({"pago_id": pcs[1]["pago_id"], "empleado_id": 2, "porcentaje": 9, "monto_comision": 99})
+        conn.execute(insert(PagoCobrador), pcs)
+        # Un pago ya tenía su ingreso en la caja del empleado: solo falta el egreso de comisión
+        conn.execute(insert(CajaEmpleadoMovimiento), [{
+            "fecha": hoy, "empleado_id": 1, "tipo": "ingreso", "categoria": "pago", "monto": 12,
+            "referencia_tipo": "pago", "referencia_id": 3,
+        }])
+
+
+def _movimientos(db):
+    return sorted(
+        (m.fecha, m.tipo, m.categoria, m.descripcion, m.monto, m.referencia_tipo, m.referencia_id)
+        for m in caja_service.describir_movimientos(db, db.query(MovimientoCaja).all())
+    )
+
+
+def _esperados(db):
+    """Lo que generaba el backfill anterior, registro por registro."""
+    clientes = {c.id: c.nombre for c in db.query(Cliente)}
+    prestamos = {p.id: p for p in db.query(Prestamo)}
+    filas = [(p.fecha_inicio, "egreso", "prestamo", f"Desembolso préstamo #{p.id} - {clientes.get(p.cliente_id, f'Cliente {p.cliente_id}')}",
+              p.monto, "prestamo", p.id) for p in prestamos.values()]
+    for pg in db.query(Pago):
+        p = prestamos[pg.prestamo_id]
+        nombre = clientes.get(p.cliente_id, f"Cliente {p.cliente_id}")
+        filas.append((pg.fecha_pago, "ingreso", "pago", f"Pago #{pg.id} préstamo {pg.prestamo_id} - {nombre}", pg.monto, "pago", pg.id))
+    return sorted(filas)
+
+
+def test_backfill_caja_movimientos(db):
+    _poblar()
+    creados = caja_service.backfill_caja_movimientos(db, lote=10)
+    assert creados == N_PRESTAMOS + N_PAGOS
+    assert _movimientos(db) == _esperados(db)
+    # Con la tabla ya poblada no vuelve a correr
+    assert caja_service.backfill_caja_movimientos(db, lote=10) == 0
+    assert db.query(BackfillCheckpoint).count() == 0
+
+
+def test_backfill_caja_movimientos_retoma_checkpoint(base_limpia):
+    _poblar()
+    original, llamadas = caja_service._insertar_movimientos_pagos, {"n": 0}
+
+    def cortar_en_el_tercer_lote(db, desde, hasta):
+        llamadas["n"] += 1
+        if llamadas["n"] == 3:
+            raise RuntimeError("proceso interrumpido")
+        return original(db, desde, hasta)
+
+    db = SessionLocal()
+    caja_service._insertar_movimientos_pagos = cortar_en_el_tercer_lote
+    try:
+        caja_service.backfill_caja_movimientos(db, lote=10)
+        raise AssertionError("se esperaba la interrupción")
+    except RuntimeError:
+        db.rollback()
+    finally:
+        caja_service._insertar_movimientos_pagos = original
+        db.close()
+
+    db = SessionLocal()
+    try:
+        cp = db.get(BackfillCheckpoint, "caja_movimientos")
+        assert cp is not None and cp.fase == 1 and cp.ultimo_id == 20
+        # La tabla ya no está vacía, pero el checkpoint permite completar sin duplicar
+        caja_service.backfill_caja_movimientos(db, lote=10)
+        assert _movimientos(db) == _esperados(db)
+        assert db.query(BackfillCheckpoint).count() == 0
+    finally:
+        db.close()
+
+
+def test_backfill_referencias_movimientos(db):
+    _poblar()
+    hoy = date.today()
+    with engine.begin() as conn:
+        # Movimientos previos a las columnas de referencia, con los textos de entonces
+        conn.execute(insert(MovimientoCaja), [
+            {"fecha": hoy, "tipo": "egreso", "categoria": "prestamo", "monto": 100, "referencia_tipo": "prestamo",
+             "referencia_id": 1, "descripcion": "Desembolso préstamo #1 cliente 1"},
+            {"fecha": hoy, "tipo": "ingreso", "categoria": "pago", "monto": 10, "referencia_tipo": "pago",
+             "referencia_id": 24, "descripcion": "Pago #24 préstamo 1"},
+            {"fecha": hoy, "tipo": "ingreso", "categoria": "pago", "monto": 11, "referencia_tipo": "pago",
+             "referencia_id": 2, "descripcion": "Cuota #1 préstamo 2 - Cliente 1"},
+            {"fecha": hoy, "tipo": "egreso", "categoria": "comision", "monto": 1, "referencia_tipo": "pago",
+             "referencia_id": 2, "descripcion": "Comisión cobrador pago #2 préstamo 2"},
+            {"fecha": hoy, "tipo": "ingreso", "categoria": "ajuste", "monto": 5, "referencia_tipo": "manual", "referencia_id": None,
+             "descripcion": "Ajuste"},
+        ])
+    assert caja_service.backfill_referencias_movimientos(db, lote=2) == 4
+    movimientos = caja_service.describir_movimientos(db, db.query(MovimientoCaja).order_by(MovimientoCaja.id).all())
+    assert [(m.prestamo_id, m.cliente_id) for m in movimientos] == [(1, 1), (1, 1), (2, 2), (2, 2), (None, None)]
+    assert [m.descripcion for m in movimientos] == [
+        "Desembolso préstamo #1 - Cliente 0", "Pago #24 préstamo 1 - Cliente 0",
+        "Cuota #1 préstamo 2 - Cliente 1", "Comisión cobrador pago #2 préstamo 2", "Ajuste",
+    ]
+    # El texto armado al leer no se guarda
+    db.commit()
+    db.expire_all()
+    assert db.query(MovimientoCaja).filter(MovimientoCaja.descripcion.is_(None)).count() == 2
+
+
+def test_backfill_caja_empleado_movimientos(db):
+    _poblar()
+    creados = caja_service.backfill_caja_empleado_movimientos(db, lote=8)
+    pcs = {}
+    for pc in db.query(PagoCobrador).order_by(PagoCobrador.id):
+        pcs.setdefault(pc.pago_id, pc)
+    con_cobrador = [pago_id for pago_id, pc in pcs.items() if pc.empleado_id]
+    # Dos movimientos por pago con cobrador, menos el ingreso que ya existía
+    assert creados == 2 * len(con_cobrador) - 1
+    filas = db.query(CajaEmpleadoMovimiento.referencia_id, CajaEmpleadoMovimiento.tipo,
+                     CajaEmpleadoMovimiento.empleado_id, CajaEmpleadoMovimiento.monto).all()
+    assert len(filas) == len(set((r, t) for r, t, _, _ in filas)) == 2 * len(con_cobrador)
+    assert all(e == 1 for _, _, e, _ in filas)  # el segundo registro de comisión se ignora
+    comision = db.query(CajaEmpleadoMovimiento).filter_by(referencia_id=con_cobrador[1], tipo="egreso").one()
+    assert comision.monto == pcs[con_cobrador[1]].monto_comision
+    assert comision.descripcion == f"Comisión cobrador pago #{con_cobrador[1]} préstamo {1 + (con_cobrador[1] - 1) % N_PRESTAMOS}"
+    # Idempotente: repetirlo no agrega nada
+    assert caja_service.backfill_caja_empleado_movimientos(db, lote=8) == 0
+    assert db.query(func.count(CajaEmpleadoMovimiento.id)).scalar() == len(filas)
@@ -0,0 +1,99 @@
+"""
+Prueba de GET /api/prestamos/{id}/full: devuelve lo mismo que los endpoints sueltos que usa
+DetallePrestamo y ejecuta la misma cantidad (fija) de consultas con 2 o con 40 pagos.
+
+Corre con pytest sobre la base temporal de conftest.py, sin servidor:
+    python -m pytest test_prestamo_full.py
+"""
+from datetime import date, timedelta
+
+import bcrypt
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+import main
+from app.database.database import SessionLocal, engine, async_engine
+from app.models.models import Usuario, Empleado
+
+# Préstamo + cliente, cuotas, pagos, comisiones de cobrador y de vendedor, vendedor con empleado
+MAX_CONSULTAS = 6
+
+
+def _preparar():
+    db = SessionLocal()
+    h = bcrypt.hashpw(b"x", bcrypt.gensalt(4)).decode()
+    vendedor, cobrador = Empleado(nombre="Vende", puesto="Vendedor"), Empleado(nombre="Cobra", puesto="Cobrador")
+    db.add_all([vendedor, cobrador])
+    db.flush()
+    db.add(Usuario(username="admin_full", hashed_password=h, nombre_completo="Admin", role="admin"))
+    db.commit()
+    ids = vendedor.id, cobrador.id
+    db.close()
+    cliente = TestClient(main.app)
+    r = cliente.post("/api/auth/login", data={"username": "admin_full", "password": "x"})
+    return cliente, {"Authorization": "Bearer " + r.json()["access_token"]}, ids
+
+
+def _crear_prestamo(cliente, headers, vendedor_id, cobrador_id, n_pagos):
+    cli = cliente.post("/api/clientes/", json={"nombre": "Cliente full", "telefono": "1"}, headers=headers).json()
+    prestamo = cliente.post("/api/prestamos/", json={
+        "cliente_id": cli["id"], "monto": 10000, "tasa_interes": 10, "plazo_dias": 350,
+        "fecha_inicio": (date.today() - timedelta(days=70)).isoformat(), "frecuencia_pago": "semanal",
+        "vendedor_id": vendedor_id, "vendedor_porcentaje": 10,
+    }, headers=headers).json()
+    for i in range(n_pagos):
+        extra = {"cobrador_id": cobrador_id, "porcentaje_cobrador": 5} if i % 2 else {}
+        r = cliente.post("/api/pagos/", json={
+            "prestamo_id": prestamo["id"], "monto": 50, "fecha_pago": date.today().isoformat(), "tipo_pago": "parcial", **extra
+        }, headers=headers)
+        assert r.status_code == 201, r.text
+    return prestamo["id"]
+
+
+def _contar_consultas(cliente, url, headers):
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if "FROM usuarios" not in statement:  # la autenticación no es parte del detalle
+            sentencias.append(statement)
+
+    motores = (engine, async_engine.sync_engine)
+    for motor in motores:
+        event.listen(motor, "before_cursor_execute", registrar)
+    try:
+        r = cliente.get(url, headers=headers)
+    finally:
+        for motor in motores:
+            event.remove(motor, "before_cursor_execute", registrar)
+    assert r.status_code == 200, r.text
+    return r.json(), sentencias
+
+
+def test_prestamo_full(base_limpia):
+    cliente, headers, (vendedor_id, cobrador_id) = _preparar()
+    conteos = []
+    for n_pagos in (2, 40):
+        prestamo_id = _crear_prestamo(cliente, headers, vendedor_id, cobrador_id, n_pagos)
+        full, sentencias = _contar_consultas(cliente, f"/api/prestamos/{prestamo_id}/full", headers)
+        conteos.append(len(sentencias))
+        assert len(sentencias) <= MAX_CONSULTAS, "\n".join(sentencias)
+
+        # Mismo contenido que los endpoints individuales
+        get = lambda url: cliente.get(url, headers=headers).json()
+        assert full["prestamo"] == get(f"/api/prestamos/{prestamo_id}")
+        assert full["cliente"] == get(f"/api/clientes/{full['prestamo']['cliente_id']}")
+        assert full["amortizacion"] == get(f"/api/prestamos/{prestamo_id}/amortizacion")
+        assert full["comision_vendedor"] == get(f"/api/prestamos/{prestamo_id}/vendedor/resumen")
+        vendedor = get(f"/api/prestamos/{prestamo_id}/vendedor")
+        assert {k: full["vendedor"][k] for k in vendedor} == vendedor
+        assert full["vendedor"]["empleado"]["id"] == vendedor_id
+        pagos = get(f"/api/pagos/prestamo/{prestamo_id}")
+        assert [{k: p[k] for k in pagos[0]} for p in full["pagos"]] == pagos
+        assert len(pagos) == n_pagos
+        for pago in full["pagos"]:
+            r = cliente.get(f"/api/pagos/{pago['id']}/cobrador", headers=headers)
+            assert pago["cobrador"] == (r.json() if r.status_code == 200 else None)
+            r = cliente.get(f"/api/pagos/{pago['id']}/vendedor", headers=headers)
+            assert pago["vendedor"] == (r.json() if r.status_code == 200 else None)
+
+    # La cantidad de consultas no depende de la cantidad de pagos
+    assert conteos[0] == conteos[1], conteos
@@ -0,0 +1,103 @@
+"""
+Prueba del saldo encadenado de caja (app/caja_service.py): el saldo_inicial sale del último
+cierre anterior aunque haya días sin cierre, y los cambios en un día pasado (movimientos,
+cerrar con diferencia, reabrir) se trasladan a los días siguientes. También el reporte de
+cierres por rango, que no escribe nada.
+
+Corre con pytest sobre la base temporal de conftest.py:
+    python -m pytest test_saldos_caja.py
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+from app import caja_service
+from app.database.database import engine
+from app.models.models import CajaCierre, MovimientoCaja
+from app.schemas.schemas import MovimientoCajaCreate
+
+HOY = date.today()
+
+
+def _movimiento(db, dias_atras: int, tipo: str, monto: float):
+    caja_service.crear_movimiento(db, MovimientoCajaCreate(
+        fecha=HOY - timedelta(days=dias_atras), tipo=tipo, monto=monto, categoria="ajuste"))
+
+
+def _saldos(db):
+    db.expire_all()
+    return {(HOY - c.fecha).days: (c.saldo_inicial, c.saldo_esperado, c.saldo_final)
+            for c in db.query(CajaCierre).order_by(CajaCierre.fecha)}
+
+
+def test_saldo_inicial_salta_dias_sin_cierre(db):
+    _movimiento(db, 5, "ingreso", 1000)
+    caja_service.cerrar_dia(db, HOY - timedelta(days=5), 990)
+    # Cuatro días sin cierre: hoy abre con lo contado hace cinco días
+    assert caja_service.get_or_create_cierre(db, HOY).saldo_inicial == 990
+    assert caja_service.get_saldo_anterior(db, HOY - timedelta(days=5)) == 0.0
+
+
+def test_cambios_en_dias_pasados_se_propagan(db):
+    _movimiento(db, 3, "ingreso", 500)
+    _movimiento(db, 1, "egreso", 100)
+    _movimiento(db, 0, "ingreso", 10)
+    caja_service.cerrar_dia(db, HOY - timedelta(days=1), 395)  # faltan 5
+    assert _saldos(db) == {3: (0, 500, None), 1: (500, 400, 395), 0: (395, 405, None)}
+
+    # Movimiento atrasado en un día sin cierre: se crea el cierre y se corre todo lo posterior
+    _movimiento(db, 2, "ingreso", 50)
+    assert _saldos(db) == {3: (0, 500, None), 2: (500, 550, None), 1: (550, 450, 445), 0: (445, 455, None)}
+
+    # Cerrar con diferencia un día anterior la traslada a los siguientes
+    caja_service.cerrar_dia(db, HOY - timedelta(days=3), 480)
+    assert _saldos(db)[0] == (425, 435, None)
+
+    # Reabrir lo deshace
+    caja_service.abrir_dia(db, HOY - timedelta(days=3))
+    assert _saldos(db)[0] == (445, 455, None)
+    assert _saldos(db)[1] == (550, 450, 445)
+
+
+def test_reconstruir_saldos_cierres(db):
+    # Base anterior al libro: movimientos sin cierre y un cierre que arrancó en 0 tras un hueco
+    with engine.begin() as conn:
+        conn.execute(insert(MovimientoCaja), [
+            {"fecha": HOY - timedelta(days=4), "tipo": "ingreso", "monto": 300, "categoria": "pago"},
+            {"fecha": HOY - timedelta(days=2), "tipo": "egreso", "monto": 50, "categoria": "gastos"},
+            {"fecha": HOY, "tipo": "ingreso", "monto": 20, "categoria": "pago"},
+        ])
+        conn.execute(insert(CajaCierre), [
+            {"fecha": HOY - timedelta(days=2), "saldo_inicial": 0, "ingresos": 0, "egresos": 50,
+             "saldo_esperado": -50, "saldo_final": -60, "diferencia": -10, "cerrado": True},
+        ])
+    assert caja_service.reconstruir_saldos_cierres(db) == 2
+    assert _saldos(db) == {4: (0, 300, 300), 2: (300, 250, 240), 0: (240, 260, None)}
+    assert caja_service.reconstruir_saldos_cierres(db) == 0
+
+
+def test_cierres_rango_solo_lectura(db):
+    _movimiento(db, 6, "ingreso", 1000)
+    _movimiento(db, 6, "egreso", 200)
+    caja_service.cerrar_dia(db, HOY - timedelta(days=6), 790)
+    _movimiento(db, 3, "egreso", 90)
+    with engine.begin() as conn:
+        # Movimiento sin cierre (base sin reconstruir): el día se calcula al vuelo
+        conn.execute(insert(MovimientoCaja), [{"fecha": HOY - timedelta(days=1), "tipo": "ingreso", "monto": 5,
+                                               "categoria": "pago"}])
+    cantidad = db.query(CajaCierre).count()
+    dias = caja_service.cierres_rango(db, HOY - timedelta(days=7), HOY)
+    assert db.query(CajaCierre).count() == cantidad and not db.dirty and not db.new
+
+    assert [d["fecha"] for d in dias] == [(HOY - timedelta(days=n)).isoformat() for n in range(7, -1, -1)]
+    assert [d["saldo_inicial"] for d in dias] == [0, 0, 790, 790, 790, 700, 700, 705]
+    assert dias[1]["detalle_ingresos"] == {"ajuste": 1000} and dias[1]["diferencia"] == -10
+    assert dias[6]["ingresos"] == 5 and dias[6]["cerrado"] is False and dias[6]["saldo_final"] is None
+    # El cierre de un día es la misma vista: sin autocierre ni cierre nuevo para ayer
+    assert caja_service.get_cierre_caja(db, HOY - timedelta(days=1)) == dias[6]
+    assert caja_service.get_cierre_caja(db, HOY - timedelta(days=3))["cerrado"] is False
+    assert db.query(CajaCierre).count() == cantidad and not db.dirty and not db.new
+
+    lineas = list(caja_service.filas_csv_cierres(db, HOY - timedelta(days=7), HOY))
+    assert len(lineas) == 9 and lineas[0].strip().endswith("egreso_ajuste,ingreso_ajuste,ingreso_pago")
+    assert lineas[2].startswith(f"{HOY - timedelta(days=6)},0.0,1000.0,200.0,800.0,790.0,-10.0,1,")
+
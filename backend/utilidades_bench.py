@@ -0,0 +1,24 @@
+"""
+Utilidades compartidas por los scripts benchmark_*.py y check_query_plans.py: argumentos
+de línea de comandos y la base SQLite temporal en la que corren.
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+
+
+def arg(nombre, defecto):
+    """Valor de `nombre valor` en sys.argv, convertido al tipo del defecto."""
+    return type(defecto)(sys.argv[sys.argv.index(nombre) + 1]) if nombre in sys.argv else defecto
+
+
+def base_temporal() -> str:
+    """Apunta DATABASE_URL a una base nueva en una carpeta propia (mkdtemp) que se borra al
+    salir, con sus archivos -wal/-shm. Llamar antes de importar app.*. Devuelve la ruta."""
+    carpeta = tempfile.mkdtemp(prefix="gestor_bench_")
+    atexit.register(shutil.rmtree, carpeta, True)
+    ruta = os.path.join(carpeta, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{ruta}"
+    return ruta
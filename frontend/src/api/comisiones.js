@@ -25,10 +25,18 @@ export async function fetchResumenVendedor(vendedorId = null, fechaDesde = null,
 
 /**
  * Obtener detalle de comisiones por préstamo de un vendedor
+ * opciones: { orden: 'prestamo' | 'pendiente', limit, cursor, fechaDesde, fechaHasta }
+ * Con limit, la siguiente página viene en `siguiente_cursor` (null en la última).
  */
-export async function fetchDetalleVendedor(vendedorId) {
+export async function fetchDetalleVendedor(vendedorId, opciones = {}) {
   try {
-    const response = await fetch(`${API_URL}/api/comisiones/vendedor/detalle?vendedor_id=${vendedorId}`);
+    const params = new URLSearchParams({ vendedor_id: vendedorId });
+    if (opciones.orden) params.append('orden', opciones.orden);
+    if (opciones.limit) params.append('limit', opciones.limit);
+    if (opciones.cursor) params.append('cursor', opciones.cursor);
+    if (opciones.fechaDesde) params.append('fecha_desde', opciones.fechaDesde);
+    if (opciones.fechaHasta) params.append('fecha_hasta', opciones.fechaHasta);
+    const response = await fetch(`${API_URL}/api/comisiones/vendedor/detalle?${params}`);
     if (!response.ok) throw new Error(`Error ${response.status}`);
     return await response.json();
   } catch (error) {
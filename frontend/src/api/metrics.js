@@ -99,9 +99,9 @@ export async function fetchRentabilidad() {
   }
 }
 
-export async function fetchEvolucion(periodoDias = 30) {
+export async function fetchEvolucion(periodoDias = 30, granularity = 'dia') {
   try {
-    const { data } = await api.get('/api/metrics/evolucion', { params: { periodo_dias: periodoDias } });
+    const { data } = await api.get('/api/metrics/evolucion', { params: { periodo_dias: periodoDias, granularity } });
     return data;
   } catch (err) {
     handleApiError(err);
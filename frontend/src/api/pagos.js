@@ -36,6 +36,15 @@ export async function createPago(payload) {
   }
 }
 
+export async function createPagosLote(pagos) {
+  try {
+    const { data } = await api.post('/api/pagos/batch', pagos);
+    return data;
+  } catch (err) {
+    handleApiError(err);
+  }
+}
+
 export async function deletePago(id) {
   try {
     await api.delete(`/api/pagos/${id}`);
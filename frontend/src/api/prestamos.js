@@ -18,6 +18,16 @@ export async function fetchPrestamo(id) {
   }
 }
 
+// Detalle completo: préstamo, cliente, amortización, pagos con comisiones y vendedor
+export async function fetchPrestamoCompleto(id) {
+  try {
+    const { data } = await api.get(`/api/prestamos/${id}/full`);
+    return data;
+  } catch (err) {
+    handleApiError(err);
+  }
+}
+
 export async function fetchPrestamosByCliente(clienteId) {
   try {
     const { data } = await api.get(`/api/prestamos/cliente/${clienteId}`);
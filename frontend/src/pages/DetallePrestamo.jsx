@@ -1,8 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { fetchPrestamos, refinanciarPrestamo, fetchAmortizacion, fetchPrestamoVendedor, fetchPrestamoVendedorResumen } from '../api/prestamos';
-import { fetchCliente } from '../api/clientes';
-import { fetchPagosByPrestamo } from '../api/pagos';
+import { refinanciarPrestamo, fetchPrestamoCompleto } from '../api/prestamos';
 import { exportPrestamoPDF, exportContratoPrestamoFormatoPDF } from '../utils/pdfExport';
 import '../styles/DetallePrestamo.css';
 import formatCurrency from '../utils/formatCurrency';
@@ -36,44 +34,24 @@ export default function DetallePrestamo() {
       try {
         setLoading(true);
         
-        // Cargar todos los préstamos y encontrar el específico
-        const prestamosData = await fetchPrestamos();
-        const prestamoEncontrado = prestamosData.find(p => p.id === parseInt(id));
-        
-        if (!prestamoEncontrado) {
+        // Préstamo, cliente, pagos, amortización y comisión de vendedor en una sola llamada
+        const full = await fetchPrestamoCompleto(id);
+        if (!full) {
           setError('Préstamo no encontrado');
           setLoading(false);
           return;
         }
 
-        setPrestamo(prestamoEncontrado);
-
-        // Cargar datos del cliente, pagos y amortización
-        const [clienteData, pagosData, amortizacionData] = await Promise.all([
-          fetchCliente(prestamoEncontrado.cliente_id),
-          fetchPagosByPrestamo(id),
-          fetchAmortizacion(id)
-        ]);
-
-        setCliente(clienteData);
-        setPagos(pagosData || []);
-        setAmortizacion(amortizacionData || []);
+        setPrestamo(full.prestamo);
+        setCliente(full.cliente);
+        setPagos(full.pagos || []);
+        setAmortizacion(full.amortizacion || []);
 
-        // Cargar comisión de vendedor (si existe) + datos completos del empleado y resumen pagado
-        try {
-          const vend = await fetchPrestamoVendedor(id);
-          if (vend && vend.empleado_id) {
-            // Cargar datos completos del empleado
-            const { fetchEmpleado } = await import('../api/empleados');
-            const empleadoCompleto = await fetchEmpleado(vend.empleado_id);
-            setVendedor({ ...vend, ...empleadoCompleto }); // fusionar comisión + datos personales
-          } else if (vend) {
-            setVendedor(vend);
-          }
-          const resumen = await fetchPrestamoVendedorResumen(id);
-          setComisionResumen(resumen);
-        } catch (e) {
-          // 404 u otro error: no hay comisión de vendedor, continuar
+        // Comisión de vendedor (si existe) fusionada con los datos personales del empleado
+        if (full.vendedor) {
+          const { empleado, ...vend } = full.vendedor;
+          setVendedor(empleado ? { ...vend, ...empleado } : vend);
+          setComisionResumen(full.comision_vendedor);
         }
       } catch (err) {
         console.error('Error al cargar datos:', err);